@@ -1,8 +1,26 @@
+import time
+
+# Start of the rerun: the imports below are only paid by the cold start
+RERUN_STARTED = time.perf_counter()
+
+import functools
+from datetime import date
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime
-import os
+
+import engine
+import fx
+import profiling
+import theme
+from batch import import_batch, read_batch
+from export import EXPORT_FORMATS, export_dossiers, filter_dossiers
+from workload import check_consistency
+
+# Timing of this rerun's sections (debug panel and achat_metrics.jsonl)
+profile = profiling.start(started=RERUN_STARTED)
+profile.lap("imports")
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -25,272 +43,227 @@ def set_theme():
 set_theme()
 
 # --- CUSTOM CSS FOR THEMES ---
-def get_theme_css():
-    if st.session_state.theme == 'dark':
-        return """
-        :root {
-            --primary-color: #4ade80;
-            --secondary-color: #34d399;
-            --background-color: #111827;
-            --card-bg: #1f2937;
-            --text-color: #f3f4f6;
-            --text-secondary: #9ca3af;
-            --border-color: #374151;
-        }
-        """
-    else:
-        return """
-        :root {
-            --primary-color: #2c7873;
-            --secondary-color: #60a5a0;
-            --background-color: #f8fafc;
-            --card-bg: #ffffff;
-            --text-color: #1e293b;
-            --text-secondary: #64748b;
-            --border-color: #e2e8f0;
-        }
-        """
-
-st.markdown(f"""
-<style>
-{get_theme_css()}
-
-/* Import Inter font */
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-
-/* Global styles */
-body {{
-    background-color: var(--background-color);
-    color: var(--text-color);
-    font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-    font-size: 15px;
-}}
-
-/* Headers */
-h1, h2, h3, h4 {{
-    font-family: 'Inter', sans-serif;
-    font-weight: 700;
-    color: var(--text-color);
-}}
-
-/* Sidebar */
-.css-1d391kg {{
-    background-color: var(--card-bg) !important;
-    border-right: 1px solid var(--border-color) !important;
-}}
-
-/* Cards */
-[data-testid="stMetric"] {{
-    background-color: var(--card-bg);
-    border-radius: 12px;
-    padding: 15px;
-    box-shadow: 0 4px 6px -1px rgba(0,0,0,0.1);
-    border: 1px solid var(--border-color);
-}}
-
-/* Buttons */
-.stButton>button {{
-    background-color: var(--primary-color);
-    color: white;
-    border: none;
-    border-radius: 8px;
-    padding: 10px 20px;
-    font-weight: 500;
-    font-family: 'Inter', sans-serif;
-}}
-
-.stButton>button:hover {{
-    background-color: var(--secondary-color);
-}}
-
-/* Tables */
-.stDataFrame, .stTable {{
-    background-color: var(--card-bg);
-    border-radius: 12px;
-    overflow: hidden;
-    border: 1px solid var(--border-color);
-}}
-</style>
-""", unsafe_allow_html=True)
-
-# --- HEADER ---
-st.markdown("""
-<div style="text-align: center; margin-bottom: 1.5rem;">
-  <h1 style="display: flex; align-items: center; justify-content: center; gap: 10px;">
-    <span>🛒</span> Achat Assistant
-  </h1>
-  <p style="color: var(--text-secondary); max-width: 600px; margin: 0 auto;">
-    Attribution intelligente des dossiers d'achat • Optimisation de la charge de travail
-  </p>
-</div>
-""", unsafe_allow_html=True)
-
-st.markdown('<hr style="margin: 1rem 0;">', unsafe_allow_html=True)
+# Stylesheet and header assembled once per process (theme.py), sent as one element
+st.markdown(theme.page_header(st.session_state.theme), unsafe_allow_html=True)
+profile.lap("theme_css")
 
 # --- INIT DATA ---
+# One shared, versioned state per server process instead of one DataFrame copy
+# per session; the pages query its store instead of scanning DataFrames
+@st.cache_resource
 def init_data():
-    if not os.path.exists("dossiers.csv"):
-        pd.DataFrame(columns=[
-            "ID", "Description", "Category", "Urgency", 
-            "Buyer", "Status", "Assigned_Date", "Closed_Date"
-        ]).to_csv("dossiers.csv", index=False)
-    
-    if not os.path.exists("buyers.csv"):
-        pd.DataFrame(columns=["Name", "Email"]).to_csv("buyers.csv", index=False)
-
-init_data()
-
-# --- LOAD DATA ---
-@st.cache_data(ttl=60)
-def load_data():
-    try:
-        dossiers = pd.read_csv("dossiers.csv", parse_dates=["Assigned_Date", "Closed_Date"])
-    except:
-        dossiers = pd.DataFrame(columns=[
-            "ID", "Description", "Category", "Urgency", 
-            "Buyer", "Status", "Assigned_Date", "Closed_Date"
-        ])
-    
-    try:
-        buyers = pd.read_csv("buyers.csv")
-    except:
-        buyers = pd.DataFrame(columns=["Name", "Email"])
-    
-    return dossiers, buyers
-
-# --- SESSION STATE INIT ---
-if 'dossiers' not in st.session_state:
-    dossiers_df, buyers_df = load_data()
-    st.session_state.dossiers = dossiers_df
-    st.session_state.buyers = buyers_df
+    state = engine.open_state()
+    if state.notifications is not None:
+        # One thread per server process sends the queued emails
+        state.notifications.start_worker()
+    return state
+
+state = init_data()
+store = state.store
+# Writes of other processes: only the changes since the last rerun are read
+state.sync()
+
+# Another session or process wrote since our last rerun: its changes are visible
+if st.session_state.get("data_version", state.version) != state.version:
+    st.toast("🔄 Données mises à jour par un autre utilisateur")
+st.session_state.data_version = state.version
+profile.lap("init_data")
 
 # --- HELPER FUNCTIONS ---
-def ensure_datetime(df, col):
-    if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    return df
-
-def generate_dossier_id():
-    today = datetime.now().strftime("%Y%m%d")
-    if not st.session_state.dossiers.empty:
-        last_id = st.session_state.dossiers["ID"].max()
-        num = int(last_id.split("-")[-1]) + 1 if "-" in last_id else 1
-    else:
-        num = 1
-    return f"PR-{today}-{num:03d}"
-
-def get_buyer_workload():
-    if st.session_state.dossiers.empty:
-        return pd.Series(dtype=int)
-    
-    open_files = st.session_state.dossiers[st.session_state.dossiers["Status"] == "Open"]
-    if open_files.empty:
-        return pd.Series(0, index=st.session_state.buyers["Name"])
-    
-    workload = open_files["Buyer"].value_counts().reindex(st.session_state.buyers["Name"], fill_value=0)
-    return workload
-
-def get_last_assignment():
-    if st.session_state.dossiers.empty:
-        return pd.Series(dtype='datetime64[ns]')
-    
-    open_files = st.session_state.dossiers[st.session_state.dossiers["Status"] == "Open"].copy()
-    
-    if not pd.api.types.is_datetime64_any_dtype(open_files["Assigned_Date"]):
-        open_files["Assigned_Date"] = pd.to_datetime(open_files["Assigned_Date"], errors='coerce')
-    
-    open_files = open_files.dropna(subset=["Assigned_Date"])
-    
-    if open_files.empty:
-        return pd.Series(dtype='datetime64[ns]')
-    
-    last_assign = open_files.groupby("Buyer")["Assigned_Date"].max()
-    return last_assign
-
-def assign_to_least_busy():
-    workload = get_buyer_workload()
-    last_assign = get_last_assignment()
-    
-    if workload.empty:
-        return st.session_state.buyers["Name"].iloc[0] if not st.session_state.buyers.empty else "N/A"
-    
-    min_work = workload.min()
-    candidates = workload[workload == min_work].index.tolist()
-    
-    if len(candidates) > 1 and not last_assign.empty:
-        candidate_assign = last_assign.reindex(candidates)
-        sorted_candidates = candidate_assign.sort_values().index.tolist()
-        return sorted_candidates[0]
-    
-    return candidates[0]
-
-def save_data():
-    st.session_state.dossiers.to_csv("dossiers.csv", index=False)
-    st.session_state.buyers.to_csv("buyers.csv", index=False)
+# Rows (or IDs) shown per page in the tables and the Gestion picker
+PAGE_SIZE = 50
+
+def page_offset(total, key):
+    # Page picker, only shown when the rows do not fit on one page
+    n_pages = max(1, -(-total // PAGE_SIZE))
+    if n_pages == 1:
+        return 0
+    if st.session_state.get(key, 1) > n_pages:
+        st.session_state[key] = n_pages
+    page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, key=key)
+    return (page - 1) * PAGE_SIZE
+
+def fragment(name):
+    # Region re-executed on its own when one of its widgets changes (no full
+    # rerun); its own reruns are recorded in the metrics file like full ones
+    def decorate(fn):
+        @st.fragment
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            state.sync()
+            path = profiling.metrics_path(store.data_dir)
+            with profiling.section_or_rerun(name, st.session_state.get("menu"), path):
+                return fn(*args, **kwargs)
+        return run
+    return decorate
+
+# Shared by every page and session, computed once per data version
+@st.cache_data(max_entries=4, show_spinner=False)
+def summary(_state, version):
+    return {
+        "total": _state.store.count_dossiers(),
+        "open": _state.store.count_dossiers(status="Open"),
+        "closed": _state.store.count_dossiers(status="Closed"),
+        "buyers": _state.store.buyers(),
+        "workload": engine.get_buyer_workload(_state),
+        "weighted": _state.workload.weighted_workload(),
+        "last_assignment": engine.get_last_assignment(_state),
+    }
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def kpi_views(_state, version):
+    kpi = _state.kpi
+    return {
+        "lead_time": kpi.lead_time(),
+        "backlog_age": kpi.backlog_age(),
+        "categories": kpi.category_breakdown(),
+    }
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def kpi_series(_state, version, kind, period, last):
+    return _state.kpi.series(kind, period, last)
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def archive_lead_time(_state, version):
+    # Reads three columns of every cold partition, once per data version
+    archived = _state.store.archived(["Status", "Assigned_Date", "Closed_Date"])
+    closed = archived[(archived["Status"] == "Closed") & archived["Closed_Date"].notna()]
+    days = (closed["Closed_Date"] - closed["Assigned_Date"]) / pd.Timedelta(days=1)
+    return days.groupby(closed["Closed_Date"].dt.strftime("%Y-%m")).mean().rename("Délai moyen (j)")
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def adjustment_totals(_state, version, rates_version):
+    # One vectorized conversion per data version (and rate table version)
+    return engine.adjustment_totals(_state)
+
+shared = summary(state, state.version)
 
 # --- SIDEBAR NAVIGATION ---
-st.sidebar.image("https://cdn-icons-png.flaticon.com/512/2986/2986820.png", width=80)
+st.sidebar.image(theme.logo(), width=80)
 st.sidebar.title("🛒 Achat Assistant")
 st.sidebar.markdown("### Navigation")
 
 menu = st.sidebar.radio(
     "Menu",
     ["🏠 Accueil", "📝 Créer un Dossier", "👥 Suivi des Acheteurs", "🔧 Gestion", "📈 KPI"],
-    label_visibility="collapsed"
+    label_visibility="collapsed",
+    key="menu"
 )
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("### Configuration")
+# Actor of this session's changes in the dossier history
+st.sidebar.text_input("👤 Votre nom", key="actor", placeholder="Pour l'historique des dossiers")
+
+
+def current_actor():
+    return st.session_state.get("actor", "").strip() or None
+
 
 # Buyer management
-if st.sidebar.toggle("Gérer les acheteurs", False):
-    with st.sidebar.expander("➕ Ajouter un acheteur", expanded=True):
+@fragment("buyer_forms")
+def buyer_forms():
+    if not st.toggle("Gérer les acheteurs", False):
+        return
+    with st.expander("➕ Ajouter un acheteur", expanded=True):
         new_buyer = st.text_input("Nom de l'acheteur")
         new_email = st.text_input("Email (optionnel)")
+        new_capacity = st.number_input("Capacité", min_value=0.1, value=1.0, step=0.5,
+                                       help="Charge relative acceptée (1 = temps plein)")
+        new_absences = st.text_input("Absences (optionnel)", placeholder="AAAA-MM-JJ:AAAA-MM-JJ;...")
         if st.button("Ajouter", use_container_width=True):
-            if new_buyer and new_buyer not in st.session_state.buyers["Name"].values:
-                new_row = pd.DataFrame([{"Name": new_buyer, "Email": new_email}])
-                st.session_state.buyers = pd.concat([st.session_state.buyers, new_row], ignore_index=True)
-                save_data()
-                st.success(f"✅ {new_buyer} ajouté !")
-                st.rerun()
-            elif new_buyer in st.session_state.buyers["Name"].values:
-                st.warning("⚠️ Cet acheteur existe déjà")
+            if new_buyer:
+                try:
+                    engine.add_buyer(state, new_buyer, new_email, new_capacity, new_absences.strip())
+                except ValueError as e:
+                    st.warning(f"⚠️ {e}")
+                else:
+                    st.session_state.data_version = state.version
+                    # The buyer list below is read after the write: no rerun needed
+                    st.success(f"✅ {new_buyer} ajouté !")
+
+    buyers_table = summary(state, state.version)["buyers"]
+    if not buyers_table.empty:
+        with st.expander("✏️ Capacité et absences"):
+            edited = st.selectbox("Acheteur", buyers_table["Name"], key="edit_buyer")
+            buyer_row = buyers_table[buyers_table["Name"] == edited].iloc[0]
+            capacity = st.number_input("Capacité", min_value=0.1, value=float(buyer_row["Capacity"]), step=0.5,
+                                       key=f"capacity_{edited}")
+            absences = st.text_input("Absences", value=buyer_row["Absences"], key=f"absences_{edited}",
+                                     placeholder="AAAA-MM-JJ:AAAA-MM-JJ;...")
+            if st.button("Enregistrer", use_container_width=True):
+                try:
+                    engine.update_buyer(state, edited, capacity, absences)
+                except ValueError as e:
+                    st.warning(f"⚠️ {e}")
+                else:
+                    st.session_state.data_version = state.version
+                    st.success(f"✅ {edited} mis à jour")
+
+with st.sidebar:
+    buyer_forms()
+
+profile.lap("sidebar")
 
 # Data export
-# Export to Excel (clean tabular format)
-@st.cache_data
-def convert_df_to_excel(df):
-    import io
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Dossiers')
-    return buffer.getvalue()
-
-# Only show export if there's data
-if not st.session_state.dossiers.empty:
-    excel_data = convert_df_to_excel(st.session_state.dossiers)
-    
-    st.sidebar.download_button(
-        label="💾 Exporter en Excel",
-        data=excel_data,
-        file_name="dossiers_achat.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True
-    )
-    
+# Built only on request and cached per data version (no hashing of the table)
+@st.cache_data(max_entries=4, show_spinner=False)
+def build_export(_state, version, fmt, start, end, buyers, statuses):
+    selection = filter_dossiers(_state.store.all_dossiers(), start, end, buyers, statuses)
+    return export_dossiers(selection, fmt), len(selection)
+
+@fragment("export")
+def export_panel():
+    with st.expander("💾 Exporter les dossiers"):
+        export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+        export_period = st.date_input("Période d'attribution", value=(), format="DD/MM/YYYY")
+        export_buyers = st.multiselect("Acheteurs", summary(state, state.version)["buyers"]["Name"].tolist())
+        export_statuses = st.multiselect("Statuts", engine.STATUSES)
+
+        start, end = (tuple(export_period) + (None, None))[:2]
+        if start is not None and end is None:
+            end = start
+        export_key = (state.version, export_format, start, end, tuple(export_buyers), tuple(export_statuses))
+        if st.button("Préparer l'export", use_container_width=True):
+            st.session_state.export_key = export_key
+
+        if st.session_state.get("export_key") == export_key:
+            try:
+                with st.spinner("Préparation de l'export..."):
+                    (export_data, extension, mime), export_rows = build_export(state, *export_key)
+            except ValueError as e:
+                st.warning(f"⚠️ {e}")
+            else:
+                st.caption(f"{export_rows} dossier(s)")
+                st.download_button(
+                    label=f"⬇️ Télécharger ({export_format})",
+                    data=export_data,
+                    file_name=f"dossiers_achat.{extension}",
+                    mime=mime,
+                    use_container_width=True
+                )
+
+if shared["total"] > 0:
+    with st.sidebar:
+        export_panel()
+
+profile.lap("sidebar_export")
+
 # --- MAIN CONTENT ---
+# Each page's interactive regions are fragments: a keystroke, a radio change or
+# a save re-runs the region it belongs to, not the theme, sidebar and page
+profile.page = menu
 if menu == "🏠 Accueil":
     st.markdown("### Bienvenue dans Achat Assistant")
-    
+
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total Dossiers", len(st.session_state.dossiers))
+        st.metric("Total Dossiers", shared["total"])
     with col2:
-        st.metric("Dossiers Ouverts", len(st.session_state.dossiers[st.session_state.dossiers["Status"] == "Open"]))
+        st.metric("Dossiers Ouverts", shared["open"])
     with col3:
-        st.metric("Acheteurs Actifs", len(st.session_state.buyers))
-    
+        st.metric("Acheteurs Actifs", len(shared["buyers"]))
+
     st.info("""
     1. **Ajoutez des acheteurs** dans la barre latérale  
     2. **Créez des dossiers** dans 'Créer un Dossier'  
@@ -300,10 +273,9 @@ if menu == "🏠 Accueil":
 
 elif menu == "📝 Créer un Dossier":
     st.markdown("### 📝 Créer un nouveau dossier d'achat")
-    
-    if st.session_state.buyers.empty:
-        st.warning("⚠️ Aucun acheteur configuré. Veuillez ajouter des acheteurs dans la barre latérale.")
-    else:
+
+    @fragment("create_form")
+    def create_form():
         with st.form("new_dossier_form"):
             st.markdown("#### 🔹 Informations du dossier")
 
@@ -373,107 +345,133 @@ elif menu == "📝 Créer un Dossier":
             if submitted:
                 if not desc.strip():
                     st.error("❌ Veuillez entrer une description")
+                    return
+                # Generate or use manual ID, auto-assign buyer, persist
+                try:
+                    new_dossier = engine.create_dossier(
+                        state, desc, category, urgency, dossier_id=manual_id or None,
+                        type_ao=type_ao, devise=devise,
+                        montant_ajustement=montant_ajustement, date_ajustement=date_ajustement,
+                        actor=current_actor()
+                    )
+                except ValueError as e:
+                    st.warning(f"⚠️ {e}")
+                    return
+                new_id = new_dossier["ID"]
+                assigned_to = new_dossier["Buyer"]
+                assigned_date = new_dossier["Assigned_Date"]
+                st.session_state.data_version = state.version
+
+                # Success message
+                st.success(f"""
+                ✅ **Dossier créé avec succès !**
+                - **ID**: `{new_id}`
+                - **Assigné à**: {assigned_to}
+                - **Statut**: Ouvert
+                """)
+                if state.notifications is not None:
+                    st.caption(f"📧 {assigned_to} sera prévenu(e) par email.")
+
+                # Show assignment details
+                st.info(f"""
+                **Détails d'affectation**:
+                - Type AO: {type_ao or 'Non spécifié'}
+                - Devise: {devise}
+                - Ajustement: {montant_ajustement:+.2f} {devise}
+                - Date d'affectation: {assigned_date}
+                """)
+
+    # Bulk intake: the whole batch is assigned in one pass and written at once
+    @fragment("batch_import")
+    def batch_import():
+        with st.expander("📥 Import en lot (CSV / JSONL)"):
+            st.caption("Une demande par ligne : `Description` (obligatoire), `Category`, `Urgency`, `ID`, `Type_AO`, `Devise`, `Montant_Ajustement`, `Date_Ajustement`.")
+            batch_file = st.file_uploader("Fichier de demandes", type=["csv", "jsonl", "json"])
+            if batch_file is not None and st.button("📥 Importer et assigner le lot"):
+                try:
+                    batch = read_batch(batch_file, batch_file.name)
+                    created, report = import_batch(state, batch, actor=current_actor())
+                except ValueError as e:
+                    st.error(f"❌ {e}")
                 else:
-                    # Generate or use manual ID
-                    if manual_id:
-                        new_id = manual_id.strip()
-                        if new_id in st.session_state.dossiers["ID"].values:
-                            st.warning(f"⚠️ L'ID `{new_id}` existe déjà. Veuillez en choisir un autre.")
-                            st.stop()
-                    else:
-                        new_id = generate_dossier_id()
-
-                    # Auto-assign buyer
-                    assigned_to = assign_to_least_busy()
-
-                    # Get current datetime for assignment
-                    assigned_date = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-                    # Prepare new dossier
-                    new_dossier = {
-                        "ID": new_id,
-                        "Description": desc,
-                        "Category": category,
-                        "Urgency": urgency,
-                        "Buyer": assigned_to,
-                        "Status": "Open",
-                        "Assigned_Date": assigned_date,
-                        "Closed_Date": "",
-                        "Type_AO": type_ao or "",
-                        "Devise": devise,
-                        "Montant_Ajustement": montant_ajustement,
-                        "Date_Ajustement": date_ajustement.strftime("%Y-%m-%d") if date_ajustement else ""
-                    }
-
-                    # Add to session state
-                    new_row = pd.DataFrame([new_dossier])
-                    st.session_state.dossiers = pd.concat([st.session_state.dossiers, new_row], ignore_index=True)
-                    save_data()
-
-                    # Success message
-                    st.success(f"""
-                    ✅ **Dossier créé avec succès !**
-                    - **ID**: `{new_id}`
-                    - **Assigné à**: {assigned_to}
-                    - **Statut**: Ouvert
-                    """)
-
-                    # Show assignment details
-                    st.info(f"""
-                    **Détails d'affectation**:
-                    - Type AO: {type_ao or 'Non spécifié'}
-                    - Devise: {devise}
-                    - Ajustement: {montant_ajustement:+.2f} {devise}
-                    - Date d'affectation: {assigned_date}
-                    """)
-                    
+                    st.session_state.data_version = state.version
+                    st.success(f"✅ {report['count']} dossiers créés et assignés en {report['seconds']:.3f} s")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric("Attribution en lot", f"{report['assign_seconds'] * 1000:.2f} ms")
+                    with col2:
+                        st.metric("Attribution séquentielle", f"{report['sequential_assign_seconds'] * 1000:.2f} ms")
+                    st.dataframe(
+                        pd.DataFrame({"Lot": report["batch"], "Séquentiel": report["sequential"]}).rename(index={
+                            "max_load": "Charge max",
+                            "load_spread": "Écart de charge (max - min)",
+                            "load_std": "Écart-type de charge",
+                            "urgent_spread": "Écart urgences élevées",
+                            "category_spread": "Écart moyen par catégorie",
+                        }),
+                        use_container_width=True
+                    )
+                    st.dataframe(created[["ID", "Description", "Category", "Urgency", "Buyer"]], hide_index=True)
+
+    if shared["buyers"].empty:
+        st.warning("⚠️ Aucun acheteur configuré. Veuillez ajouter des acheteurs dans la barre latérale.")
+    else:
+        create_form()
+        batch_import()
+
 elif menu == "👥 Suivi des Acheteurs":
     st.markdown("### 👥 Suivi des Acheteurs")
-    
-    if st.session_state.buyers.empty:
-        st.info("ℹ️ Aucun acheteur configuré. Veuillez ajouter des acheteurs dans la barre latérale.")
-    else:
+
+    @fragment("buyer_follow_up")
+    def buyer_follow_up():
+        # Re-run on its own when another buyer or page is picked
+        current = summary(state, state.version)
+
         # Select buyer
         selected_buyer = st.selectbox(
             "Sélectionner un acheteur",
-            st.session_state.buyers["Name"],
+            current["buyers"]["Name"],
             help="Choisissez un acheteur pour voir ses dossiers en cours"
         )
 
         # Get workload
-        workload = get_buyer_workload()
-        current_load = workload.get(selected_buyer, 0)
+        current_load = current["workload"].get(selected_buyer, 0)
 
         # Show metrics
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         with col1:
             st.metric("Dossiers Actifs", current_load)
         with col2:
             # Last assignment
-            last_assign = get_last_assignment()
-            last_date = last_assign.get(selected_buyer)
+            last_date = current["last_assignment"].get(selected_buyer)
             if pd.notna(last_date) and last_date is not None:
                 display = last_date.strftime("%d/%m/%Y")
             else:
                 display = "Jamais"
             st.metric("Dernière Attribution", display)
         with col3:
-            total_assigned = len(st.session_state.dossiers[st.session_state.dossiers["Buyer"] == selected_buyer])
+            total_assigned = store.count_dossiers(buyer=selected_buyer)
             st.metric("Total Traité", total_assigned)
+        with col4:
+            # Sum of the open dossier costs divided by the buyer's capacity
+            weighted = current["weighted"].get(selected_buyer, 0.0)
+            st.metric("Charge pondérée", f"{weighted:.2f}",
+                      help=f"Capacité : {state.workload.capacity(selected_buyer):g}")
+        if not state.workload.is_available(selected_buyer):
+            st.warning(f"🏖️ {selected_buyer} est absent(e) : aucun nouveau dossier ne lui est attribué.")
 
         st.markdown("---")
 
-        # Filter active dossiers for this buyer
-        buyer_dossiers = st.session_state.dossiers[
-            (st.session_state.dossiers["Buyer"] == selected_buyer) &
-            (st.session_state.dossiers["Status"] == "Open")
-        ].copy()
-
-        if not buyer_dossiers.empty:
+        # Active dossiers for this buyer: only the displayed page is read
+        if current_load:
             st.markdown(f"#### 📂 Dossiers actifs de **{selected_buyer}**")
+            offset = page_offset(current_load, key=f"active_page_{selected_buyer}")
+            buyer_dossiers = store.find_dossiers(
+                buyer=selected_buyer, statuses=["Open"], offset=offset, limit=PAGE_SIZE
+            )
 
             # Format date for display
-            buyer_dossiers["Date_Ajustement"] = pd.to_datetime(buyer_dossiers["Date_Ajustement"], errors='coerce').dt.strftime("%d/%m/%Y").fillna("")
+            buyer_dossiers["Date_Ajustement"] = buyer_dossiers["Date_Ajustement"].dt.strftime("%d/%m/%Y").fillna("")
 
             # Prepare display columns
             display_df = buyer_dossiers[[
@@ -495,10 +493,8 @@ elif menu == "👥 Suivi des Acheteurs":
                 "Assigned_Date": "Date d'Affectation"
             }, inplace=True)
 
-            # Format numeric column
-            display_df["Montant Ajustement (devise)"] = display_df["Montant Ajustement (devise)"].apply(
-                lambda x: f"{x:+,.2f}"
-            )
+            # Format numeric column (one page of rows at most)
+            display_df["Montant Ajustement (devise)"] = display_df["Montant Ajustement (devise)"].map("{:+,.2f}".format)
 
             # Display as table
             st.dataframe(
@@ -507,62 +503,133 @@ elif menu == "👥 Suivi des Acheteurs":
                 hide_index=True
             )
 
-       
+
         else:
             st.info(f"✅ {selected_buyer} n'a aucun dossier actif en ce moment.")
 
-        # Optional: Show closed files
-        with st.expander("📋 Voir les dossiers terminés (fermés ou annulés)"):
-            closed_files = st.session_state.dossiers[
-                (st.session_state.dossiers["Buyer"] == selected_buyer) &
-                (st.session_state.dossiers["Status"].isin(["Closed", "Cancelled"]))
-            ]
-
-            if not closed_files.empty:
-                st.dataframe(
-                    closed_files[["ID", "Description", "Status", "Assigned_Date", "Closed_Date"]],
-                    hide_index=True
-                )
-            else:
-                st.info("Aucun dossier fermé ou annulé.")
-                                    
+        # Optional: Show closed files. The expander tracks its state, so the
+        # archived partitions are only read once it is opened
+        closed_panel = st.expander(
+            "📋 Voir les dossiers terminés (fermés ou annulés)",
+            key=f"closed_{selected_buyer}", on_change="rerun"
+        )
+        with closed_panel:
+            if closed_panel.open:
+                closed_total = store.count_dossiers(status=["Closed", "Cancelled"], buyer=selected_buyer)
+
+                if closed_total:
+                    offset = page_offset(closed_total, key=f"closed_page_{selected_buyer}")
+                    closed_files = store.find_dossiers(
+                        buyer=selected_buyer, statuses=["Closed", "Cancelled"], offset=offset, limit=PAGE_SIZE
+                    )
+                    st.dataframe(
+                        closed_files[["ID", "Description", "Status", "Assigned_Date", "Closed_Date"]],
+                        hide_index=True
+                    )
+                else:
+                    st.info("Aucun dossier fermé ou annulé.")
+
+    if shared["buyers"].empty:
+        st.info("ℹ️ Aucun acheteur configuré. Veuillez ajouter des acheteurs dans la barre latérale.")
+    else:
+        buyer_follow_up()
+
 elif menu == "🔧 Gestion":
     st.markdown("### 🔧 Gestion des Dossiers")
-    
-    if st.session_state.dossiers.empty:
-        st.info("ℹ️ Aucun dossier créé. Allez dans 'Créer un Dossier' pour commencer.")
-    else:
-        filtered = st.session_state.dossiers.copy()
-        
+
+    def save_status(dossier_id, new_status):
+        # Button callback: runs before the region re-runs, which then shows the saved row
+        comment = st.session_state.pop("status_comment", "")
+        engine.update_status(state, dossier_id, new_status, comment, actor=current_actor())
+        st.session_state.data_version = state.version
+        st.session_state.status_saved = (dossier_id, new_status)
+
+    def save_buyer(dossier_id, buyer):
+        comment = st.session_state.pop("reassign_comment", "")
+        engine.reassign_dossier(state, dossier_id, buyer, comment, actor=current_actor())
+        st.session_state.data_version = state.version
+        st.session_state.buyer_saved = (dossier_id, buyer)
+
+    @fragment("dossier_editor")
+    def dossier_editor():
+        # Typing an ID or words, picking a status or saving re-runs this region only
+        if "status_saved" in st.session_state:
+            saved_id, saved_status = st.session_state.pop("status_saved")
+            st.success(f"✅ Statut mis à jour : `{saved_id}` → {saved_status}")
+        if "buyer_saved" in st.session_state:
+            saved_id, saved_buyer = st.session_state.pop("buyer_saved")
+            st.success(f"✅ Dossier `{saved_id}` réattribué à {saved_buyer}")
         st.markdown("### 🔍 Sélectionner un dossier")
-        
-        # Option 1: Manual input
-        manual_id = st.text_input(
-            "Tapez l'ID du dossier",
-            placeholder="Ex: PR-20250405-001",
-            help="Utile si vous connaissez déjà l'ID"
-        )
-        
-        # Option 2: Dropdown selection
-        auto_id = st.selectbox(
-            "Ou choisissez dans la liste",
-            options=[""] + filtered["ID"].tolist(),
-            format_func=lambda x: "Sélectionnez un dossier" if x == "" else x
-        )
-        
-        # Priority: manual input > dropdown
-        if manual_id:
-            selected_id = manual_id
-        elif auto_id:
-            selected_id = auto_id
+        mode = st.radio("Rechercher", ["Par ID", "Dans les descriptions"], horizontal=True, key="search_mode")
+
+        if mode == "Par ID":
+            # Search on the ID index: only one page of matching IDs is sent to the browser
+            query = st.text_input(
+                "Rechercher par ID",
+                placeholder="Ex: PR-20250405",
+                help="Début de l'ID (ou ID complet) ; les plus récents sont listés en premier"
+            ).strip()
+
+            total_matches = store.count_ids_with_prefix(query)
+            offset = page_offset(total_matches, key=f"ids_page_{query}")
+            page_ids = store.ids_with_prefix(query, offset=offset, limit=PAGE_SIZE)
+
+            if query and store.get_dossier(query) is not None:
+                # Exact ID typed: no need to pick it in the list
+                selected_id = query
+            else:
+                st.caption(f"{total_matches} dossier(s) correspondant(s)")
+                selected_id = st.selectbox(
+                    "Choisissez dans la liste",
+                    options=[""] + page_ids,
+                    format_func=lambda x: "Sélectionnez un dossier" if x == "" else x
+                ) or None
         else:
+            # Full-text search on the inverted index: only the page shown is read
+            query = st.text_input(
+                "Mots recherchés",
+                placeholder="Ex: ordinateur portable",
+                help="Mots de la description ou de la catégorie, accents ignorés, ou ID ; "
+                     "le dernier mot peut être incomplet"
+            ).strip()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                buyer = st.selectbox("Acheteur", ["Tous"] + summary(state, state.version)["buyers"]["Name"].tolist(), key="search_buyer")
+            with col2:
+                statuses = st.multiselect("Statut", ["Open", "Closed", "Cancelled"], key="search_statuses")
+            with col3:
+                period = st.date_input("Attribué entre", value=(), format="DD/MM/YYYY", key="search_period")
+            filters = {
+                "buyer": None if buyer == "Tous" else buyer,
+                "statuses": statuses or None,
+                "start": period[0] if len(period) > 0 else None,
+                "end": period[1] if len(period) > 1 else None,
+            }
+
+            total_matches, _ = engine.search_dossiers(state, query, limit=0, **filters)
             selected_id = None
-        
+            if total_matches:
+                st.caption(f"{total_matches} dossier(s) correspondant(s), les plus pertinents en premier")
+                offset = page_offset(total_matches, key=f"text_page_{query}")
+                _, results = engine.search_dossiers(state, query, offset=offset, limit=PAGE_SIZE, **filters)
+                # Picking a row opens the dossier below
+                picked = st.dataframe(
+                    results[["ID", "Description", "Category", "Buyer", "Status", "Assigned_Date", "Score"]].rename(
+                        columns={"Category": "Catégorie", "Buyer": "Acheteur", "Status": "Statut",
+                                 "Assigned_Date": "Date d'Affectation"}),
+                    hide_index=True, use_container_width=True,
+                    on_select="rerun", selection_mode="single-row", key=f"text_results_{query}_{offset}"
+                )
+                if picked.selection.rows:
+                    selected_id = results["ID"].iloc[picked.selection.rows[0]]
+                else:
+                    st.caption("👆 Cliquez sur une ligne pour ouvrir le dossier.")
+
         # Validate and process
         if selected_id:
-            if selected_id in filtered["ID"].values:
-                dossier = filtered[filtered["ID"] == selected_id].iloc[0]
-                
+            dossier = store.get_dossier(selected_id)
+            if dossier is not None:
+
                 with st.expander("📄 Détails du dossier", expanded=True):
                     col1, col2 = st.columns(2)
                     with col1:
@@ -576,7 +643,19 @@ elif menu == "🔧 Gestion":
                         st.write(f"**Date d'attribution**: {dossier['Assigned_Date']}")
                         if pd.notna(dossier.get("Closed_Date", None)):
                             st.write(f"**Date de clôture**: {dossier['Closed_Date']}")
-                
+
+                with st.expander("🕓 Historique"):
+                    events = engine.dossier_history(state, selected_id)
+                    if events.empty:
+                        st.caption("Aucun événement enregistré (dossier antérieur à l'historique).")
+                    else:
+                        st.dataframe(
+                            events[["Ts", "Actor", "Label", "Detail"]].rename(columns={
+                                "Ts": "Date", "Actor": "Par", "Label": "Événement", "Detail": "Détail"
+                            }),
+                            hide_index=True, use_container_width=True
+                        )
+
                 # Status update
                 st.subheader("✏️ Mettre à jour le statut")
                 new_status = st.radio(
@@ -584,43 +663,201 @@ elif menu == "🔧 Gestion":
                     ["Open", "Closed", "Cancelled"],
                     index=["Open", "Closed", "Cancelled"].index(dossier["Status"])
                 )
-                
+
                 if new_status != dossier["Status"]:
-                    reason = st.text_area("Commentaire (optionnel)")
-                    if st.button("💾 Enregistrer les modifications", type="primary"):
-                        # Update status
-                        st.session_state.dossiers.loc[st.session_state.dossiers["ID"] == selected_id, "Status"] = new_status
-                        
-                        # Update closed date if needed
-                        if new_status == "Closed" and (pd.isna(dossier["Closed_Date"]) or dossier["Closed_Date"] == ""):
-                            st.session_state.dossiers.loc[st.session_state.dossiers["ID"] == selected_id, "Closed_Date"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-                        
-                        save_data()
-                        st.success(f"✅ Statut mis à jour : `{selected_id}` → {new_status}")
-                        st.rerun()
-            else:
-                st.warning(f"❌ Aucun dossier trouvé avec l'ID : `{selected_id}`")
+                    # Kept with the status change in the dossier history
+                    st.text_area("Commentaire (optionnel)", key="status_comment")
+                    # Update status (and closed date if needed) in a single-row write
+                    st.button("💾 Enregistrer les modifications", type="primary",
+                              on_click=save_status, args=(selected_id, new_status))
+
+                # Reassignment (kept in the dossier history)
+                st.subheader("👤 Réattribuer")
+                names = store.buyers()["Name"].tolist()
+                new_buyer = st.selectbox(
+                    "Acheteur", names, index=names.index(dossier["Buyer"]) if dossier["Buyer"] in names else 0
+                )
+                if new_buyer != dossier["Buyer"]:
+                    st.text_area("Motif (optionnel)", key="reassign_comment")
+                    st.button("👤 Réattribuer le dossier", on_click=save_buyer, args=(selected_id, new_buyer))
+        elif query and total_matches == 0:
+            if mode == "Par ID":
+                st.warning(f"❌ Aucun dossier trouvé avec l'ID : `{query}`")
                 st.info("Vérifiez l'orthographe ou utilisez la liste déroulante.")
-        else:
+            else:
+                st.warning(f"❌ Aucun dossier ne correspond à : `{query}`")
+        elif mode == "Par ID":
             st.info("👉 Veuillez entrer un ID ou sélectionner un dossier dans la liste.")
+        elif not query:
+            st.info("👉 Tapez des mots de la description ou de la catégorie (ex : « ordinateur portable »).")
+
+    if shared["total"] == 0:
+        st.info("ℹ️ Aucun dossier créé. Allez dans 'Créer un Dossier' pour commencer.")
+    else:
+        dossier_editor()
 
 elif menu == "📈 KPI":
     st.markdown("### 📈 KPI & Améliorations")
-    
-    if not st.session_state.dossiers.empty:
+
+    total = shared["total"]
+    if total > 0:
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total", len(st.session_state.dossiers))
+            st.metric("Total", total)
         with col2:
-            st.metric("Ouverts", len(st.session_state.dossiers[st.session_state.dossiers["Status"] == "Open"]))
+            st.metric("Ouverts", shared["open"])
         with col3:
-            st.metric("Fermés", len(st.session_state.dossiers[st.session_state.dossiers["Status"] == "Closed"]))
-        
-        workload = get_buyer_workload()
+            st.metric("Fermés", shared["closed"])
+
+        workload = shared["workload"]
         if not workload.empty:
-            st.bar_chart(workload)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.caption("Dossiers ouverts par acheteur")
+                st.bar_chart(workload)
+            with col2:
+                st.caption("Charge pondérée (coût / capacité)")
+                st.bar_chart(shared["weighted"])
+
+        # Materialized rollups: cost independent of the history length
+        views = kpi_views(state, state.version)
+        lead_counts, lead_mean, lead_median = views["lead_time"]
+
+        @fragment("kpi_activity")
+        def kpi_activity():
+            # Switching between days and weeks only redraws these two charts
+            st.markdown("#### 📅 Dossiers créés et clôturés")
+            period = st.radio("Période", ["Jour", "Semaine"], horizontal=True, label_visibility="collapsed")
+            period_key, last = ("day", 60) if period == "Jour" else ("week", 26)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.caption("Créés par acheteur")
+                created = kpi_series(state, state.version, "created", period_key, last)
+                if not created.empty:
+                    st.bar_chart(created)
+            with col2:
+                st.caption("Clôturés par acheteur")
+                closed = kpi_series(state, state.version, "closed", period_key, last)
+                if not closed.empty:
+                    st.bar_chart(closed)
+
+        kpi_activity()
+
+        st.markdown("#### ⏱️ Délai de traitement (attribution → clôture)")
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            st.metric("Délai moyen", f"{lead_mean:.1f} j" if lead_mean is not None else "—")
+            st.metric("Délai médian", lead_median or "—")
+        with col2:
+            st.bar_chart(lead_counts)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("#### 📦 Ancienneté des dossiers ouverts")
+            st.dataframe(views["backlog_age"], use_container_width=True)
+        with col2:
+            st.markdown("#### 🗂️ Par catégorie")
+            st.dataframe(views["categories"], use_container_width=True)
+
+        @fragment("consistency_check")
+        def consistency_check():
+            with st.expander("🔎 Vérifier l'index de charge"):
+                if st.button("Comparer avec un recalcul complet"):
+                    # Only the open dossiers count: the archive is not read
+                    problems = check_consistency(state.workload, store.find_dossiers(statuses=["Open"]), store.buyers())
+                    if problems:
+                        st.error("\n".join(f"- {p}" for p in problems))
+                    else:
+                        st.success("✅ Index de charge cohérent avec les données")
+
+        consistency_check()
+
+        # Amounts of the whole history: computed once the section is opened
+        @fragment("kpi_amounts")
+        def kpi_amounts():
+            amounts = st.expander("💱 Ajustements en MAD", key="kpi_amounts", on_change="rerun")
+            with amounts:
+                if amounts.open:
+                    try:
+                        totals = adjustment_totals(state, state.version, fx.rates_signature(store.data_dir))
+                    except ValueError as e:
+                        st.warning(f"⚠️ {e}")
+                    else:
+                        st.caption(f"Taux de change datés : `{fx.FX_FILE}` dans le dossier de données (taux par défaut sinon)")
+                        by = st.radio("Total par", ["Acheteur", "Catégorie", "Mois"], horizontal=True, key="amounts_by")
+                        table = totals[{"Acheteur": "buyer", "Catégorie": "category", "Mois": "month"}[by]]
+                        if by == "Mois":
+                            st.bar_chart(table["Montant_MAD"])
+                        st.dataframe(
+                            table.assign(Montant_MAD=table["Montant_MAD"].map("{:+,.2f}".format))
+                            .rename(columns={"Montant_MAD": "Total (MAD)", "Sans_taux": "Dossiers sans taux"}),
+                            use_container_width=True
+                        )
+                        if not totals["unconverted"].empty:
+                            st.caption("Montants sans taux de change (non convertis, comptés dans « Dossiers sans taux ») :")
+                            st.dataframe(totals["unconverted"].rename(columns={"count": "Dossiers", "sum": "Montant"}))
+                            st.dataframe(totals["unconverted_dossiers"], hide_index=True, use_container_width=True)
+
+        kpi_amounts()
+
+        # Time travel: latest history snapshot before the date + the events after it
+        @fragment("kpi_as_of")
+        def kpi_as_of():
+            as_of = st.expander("🕰️ Charge à une date passée", key="kpi_as_of", on_change="rerun")
+            with as_of:
+                if as_of.open:
+                    day = st.date_input("Dossiers ouverts par acheteur au", value=date.today(),
+                                        format="DD/MM/YYYY", key="as_of_day")
+                    try:
+                        past = engine.workload_as_of(state, day)
+                    except ValueError as e:
+                        st.info(f"ℹ️ {e}")
+                    else:
+                        if past.empty:
+                            st.caption("Aucun dossier ouvert à cette date.")
+                        else:
+                            st.bar_chart(past)
+
+        kpi_as_of()
+
+        # Counts per month come from the archive manifest, no partition is read
+        archives = st.expander("🗄️ Archives", key="kpi_archives", on_change="rerun")
+        with archives:
+            if archives.open:
+                archived = store.archive_summary()
+                if archived.empty:
+                    st.info("Aucun dossier archivé. Archivez les dossiers anciens avec `python achat_cli.py archive`.")
+                else:
+                    st.caption(f"{int(archived.to_numpy().sum())} dossier(s) archivé(s), par mois de clôture")
+                    st.bar_chart(archived)
+                    if st.toggle("Délai de traitement des dossiers archivés", key="archive_lead_time"):
+                        st.line_chart(archive_lead_time(state, state.version))
     else:
         st.info("Aucune donnée disponible.")
 
+profile.lap("page_render")
+
 # --- FOOTER ---
 st.markdown("<hr>", unsafe_allow_html=True)
+
+# --- DEBUG PANEL ---
+if st.sidebar.toggle("🐞 Mode debug", False):
+    with st.sidebar.expander("⏱️ Performances", expanded=True):
+        # Memory is measured only when the panel is open (deep memory_usage)
+        profile.memory = store.memory_usage()
+        profiling.stop()
+        profiling.append_metrics(profiling.metrics_path(store.data_dir), profile)
+        st.metric("Ce rendu", f"{profile.total * 1000:.0f} ms")
+        st.dataframe(
+            pd.Series({name: s * 1000 for name, s in profile.sections.items()}, name="ms").round(2),
+            use_container_width=True
+        )
+        if profile.memory:
+            st.caption(" • ".join(f"{name} : {b / 2**20:.1f} Mo" for name, b in profile.memory.items()))
+        records = profiling.read_metrics(profiling.metrics_path(store.data_dir))
+        only_page = st.checkbox("Cette page uniquement", True)
+        st.caption(f"p50 / p95 (ms) sur les {len(records)} derniers rendus")
+        st.dataframe(profiling.summarize(records, menu if only_page else None), use_container_width=True)
+else:
+    profiling.stop()
+    profiling.append_metrics(profiling.metrics_path(store.data_dir), profile)
@@ -0,0 +1,268 @@
+"""Command line for Achat Assistant, without the Streamlit UI.
+
+    python achat_cli.py assign "Ordinateur portable" --category Informatique --urgency Élevée
+    python achat_cli.py import demandes.jsonl
+    python achat_cli.py stats --json
+    python achat_cli.py buyer "Fatima" --capacity 0.5 --absences "2025-08-01:2025-08-15"
+    python achat_cli.py metrics --last 1000
+    python achat_cli.py archive --days 90
+    python achat_cli.py notify --send
+    python achat_cli.py totals --by month
+    python achat_cli.py serve --port 8502
+    python achat_cli.py reassign PR-20250405-001 "Fatima" --comment "Congés de Karim"
+    python achat_cli.py history PR-20250405-001
+    python achat_cli.py workload --as-of 2025-06-30
+    python achat_cli.py search "ordinateur portable" --status Open --from 2025-01-01
+"""
+import argparse
+import json
+import logging
+import sys
+from datetime import date
+
+import engine
+import intake
+import profiling
+from batch import import_batch, read_batch
+from schema import CATEGORICAL_COLUMNS
+from storage import DATA_DIR, STORAGE_BACKEND
+
+
+def cmd_assign(state, args):
+    dossier = engine.create_dossier(
+        state, args.description, args.category, args.urgency, dossier_id=args.id,
+        type_ao=args.type_ao, devise=args.devise, montant_ajustement=args.montant
+    )
+    if args.json:
+        print(json.dumps(dossier, ensure_ascii=False))
+    else:
+        print(f"{dossier['ID']} -> {dossier['Buyer']}")
+
+
+def cmd_import(state, args):
+    created, report = import_batch(state, read_batch(args.file))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(f"{report['count']} dossiers créés et assignés en {report['seconds']:.3f} s")
+        for dossier_id, buyer in zip(created["ID"], created["Buyer"]):
+            print(f"{dossier_id} -> {buyer}")
+
+
+def cmd_stats(state, args):
+    stats = engine.stats(state)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False))
+        return
+    print(f"Dossiers : {stats['total']} (ouverts {stats['open']}, fermés {stats['closed']}, annulés {stats['cancelled']})")
+    print(f"Acheteurs : {stats['buyers']}")
+    for name, count in stats["workload"].items():
+        print(f"  {name}: {count} ouvert(s), charge pondérée {stats['weighted_workload'][name]}")
+
+
+def cmd_buyer(state, args):
+    engine.update_buyer(state, args.name, args.capacity, args.absences)
+    print(f"{args.name} : capacité {args.capacity}, absences {args.absences or 'aucune'}")
+
+
+def cmd_metrics(state, args):
+    records = profiling.read_metrics(profiling.metrics_path(state.store.data_dir), args.last)
+    summary = profiling.summarize(records, args.page)
+    if args.json:
+        print(summary.to_json(orient="index", force_ascii=False))
+    elif summary.empty:
+        print("Aucune mesure enregistrée (achat_metrics.jsonl)")
+    else:
+        print(f"Temps de rendu (ms) sur les {len(records)} derniers rendus")
+        print(summary.to_string())
+
+
+def cmd_archive(state, args):
+    n = engine.archive_dossiers(state, args.days)
+    print(f"{n} dossier(s) fermé(s) ou annulé(s) depuis plus de {args.days} jours archivé(s)")
+
+
+def cmd_notify(state, args):
+    queue = state.notifications
+    if queue is None:
+        raise ValueError("Notifications désactivées : définissez ACHAT_SMTP_HOST")
+    if args.send:
+        print(f"{queue.drain()} email(s) envoyé(s)")
+    counts = queue.counts()
+    if args.json:
+        print(json.dumps(counts))
+        return
+    print(f"En attente : {counts['pending']}, envoyés : {counts['sent']}, en échec : {counts['failed']}")
+    for row_id, buyer, email, attempts, error in queue.failures():
+        print(f"  #{row_id} {buyer} <{email}> ({attempts} essais) : {error}")
+
+
+def cmd_totals(state, args):
+    all_totals = engine.adjustment_totals(state)
+    totals, unconverted = all_totals[args.by], all_totals["unconverted_dossiers"]
+    if args.json:
+        print(json.dumps({
+            "totals": json.loads(totals.round(2).to_json(orient="index", force_ascii=False)),
+            "unconverted": unconverted.to_dict("records"),
+        }, ensure_ascii=False))
+        return
+    if totals.empty:
+        print("Aucun montant d'ajustement")
+        return
+    print(f"Ajustements en MAD par {TOTALS_BY[args.by]}")
+    print(totals.assign(Montant_MAD=totals["Montant_MAD"].map("{:+,.2f}".format)).to_string())
+    if not unconverted.empty:
+        print(f"{len(unconverted)} dossier(s) sans taux de change (non convertis) :")
+        print(unconverted.to_string(index=False))
+
+
+def cmd_reassign(state, args):
+    changes = engine.reassign_dossier(state, args.id, args.buyer, args.comment)
+    print(f"{args.id} -> {args.buyer}" if changes else f"{args.id} est déjà assigné à {args.buyer}")
+
+
+def cmd_history(state, args):
+    events = engine.dossier_history(state, args.id)
+    if args.json:
+        print(events[["Ts", "Actor", "Type", "Buyer", "Data"]].to_json(orient="records", date_format="iso", force_ascii=False))
+        return
+    if events.empty:
+        print(f"Aucun événement pour {args.id}")
+    for ts, actor, label, detail in zip(events["Ts"], events["Actor"], events["Label"], events["Detail"]):
+        print(f"{ts:%Y-%m-%d %H:%M:%S}  {actor:<12} {label} : {detail}")
+
+
+def cmd_workload(state, args):
+    if args.as_of:
+        # A bare date means the end of that day
+        when = date.fromisoformat(args.as_of) if len(args.as_of) == 10 else args.as_of
+        workload = engine.workload_as_of(state, when)
+    else:
+        workload = state.events.current_workload()
+    if args.json:
+        print(workload.to_json(force_ascii=False))
+        return
+    print(f"Dossiers ouverts par acheteur {'au ' + args.as_of if args.as_of else 'actuellement'}")
+    if workload.empty:
+        print("  aucun")
+    for name, count in workload.items():
+        print(f"  {name}: {count}")
+
+
+def cmd_search(state, args):
+    total, page = engine.search_dossiers(
+        state, args.query, buyer=args.buyer, statuses=args.status or None,
+        start=args.start, end=args.end, limit=args.limit
+    )
+    columns = ["ID", "Description", "Category", "Buyer", "Status", "Assigned_Date", "Score"]
+    if args.json:
+        print(json.dumps({"total": total, "results": json.loads(
+            page[columns].to_json(orient="records", date_format="iso", force_ascii=False) if total else "[]"
+        )}, ensure_ascii=False))
+        return
+    print(f"{total} dossier(s) correspondant(s)")
+    for row in page[columns].itertuples(index=False) if total else []:
+        print(f"  {row.ID}  {row.Score:>8.3f}  {row.Buyer} · {row.Status}  {row.Description} ({row.Category})")
+
+
+def cmd_serve(state, args):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    intake.serve(state, args.host, args.port, max_queue=args.max_queue, batch_size=args.batch_size)
+
+
+TOTALS_BY = {"buyer": "acheteur", "category": "catégorie", "month": "mois"}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="achat", description="Achat Assistant en ligne de commande")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Dossier des données (défaut : ACHAT_DATA_DIR ou .)")
+    parser.add_argument("--storage", default=STORAGE_BACKEND, choices=["csv", "sqlite"], help="Stockage utilisé")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="Sortie JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    assign = commands.add_parser("assign", parents=[output], help="Créer un dossier et l'assigner à l'acheteur le moins chargé")
+    assign.add_argument("description")
+    assign.add_argument("--category", default="Autre", choices=engine.CATEGORIES)
+    assign.add_argument("--urgency", default="Moyenne", choices=engine.URGENCIES)
+    assign.add_argument("--id", default=None, help="ID manuel (sinon généré)")
+    assign.add_argument("--type-ao", default="", choices=["", "AO Ouvert", "AO fermé"])
+    assign.add_argument("--devise", default="MAD", choices=CATEGORICAL_COLUMNS["Devise"])
+    assign.add_argument("--montant", type=float, default=0.0, help="Montant d'ajustement")
+    assign.set_defaults(func=cmd_assign)
+
+    batch_import = commands.add_parser("import", parents=[output], help="Importer et assigner un lot CSV ou JSONL")
+    batch_import.add_argument("file")
+    batch_import.set_defaults(func=cmd_import)
+
+    stats = commands.add_parser("stats", parents=[output], help="Compteurs et charge par acheteur")
+    stats.set_defaults(func=cmd_stats)
+
+    buyer = commands.add_parser("buyer", help="Définir la capacité et les absences d'un acheteur")
+    buyer.add_argument("name")
+    buyer.add_argument("--capacity", type=float, default=1.0, help="Capacité relative (défaut 1)")
+    buyer.add_argument("--absences", default="", help="Périodes AAAA-MM-JJ:AAAA-MM-JJ séparées par ;")
+    buyer.set_defaults(func=cmd_buyer)
+
+    metrics = commands.add_parser("metrics", parents=[output], help="Latences p50/p95 des rendus de l'application")
+    metrics.add_argument("--last", type=int, default=500, help="Nombre de rendus pris en compte")
+    metrics.add_argument("--page", default=None, help="Page de l'application (ex. « 📈 KPI »)")
+    metrics.set_defaults(func=cmd_metrics)
+
+    archive = commands.add_parser("archive", help="Archiver les dossiers fermés ou annulés anciens")
+    archive.add_argument("--days", type=int, default=engine.ARCHIVE_AFTER_DAYS, help="Ancienneté minimale en jours (défaut 90)")
+    archive.set_defaults(func=cmd_archive)
+
+    notify = commands.add_parser("notify", parents=[output], help="État de la file des emails aux acheteurs")
+    notify.add_argument("--send", action="store_true", help="Envoyer tout de suite les emails dus")
+    notify.set_defaults(func=cmd_notify)
+
+    totals = commands.add_parser("totals", parents=[output], help="Montants d'ajustement convertis en MAD")
+    totals.add_argument("--by", default="buyer", choices=list(TOTALS_BY))
+    totals.set_defaults(func=cmd_totals)
+
+    reassign = commands.add_parser("reassign", help="Réattribuer un dossier à un autre acheteur")
+    reassign.add_argument("id")
+    reassign.add_argument("buyer")
+    reassign.add_argument("--comment", default="", help="Commentaire gardé dans l'historique")
+    reassign.set_defaults(func=cmd_reassign)
+
+    history = commands.add_parser("history", parents=[output], help="Historique des événements d'un dossier")
+    history.add_argument("id")
+    history.set_defaults(func=cmd_history)
+
+    workload = commands.add_parser("workload", parents=[output], help="Dossiers ouverts par acheteur, à une date passée")
+    workload.add_argument("--as-of", default=None, help="Date AAAA-MM-JJ[ HH:MM] (défaut : maintenant)")
+    workload.set_defaults(func=cmd_workload)
+
+    search = commands.add_parser("search", parents=[output], help="Recherche plein texte dans les dossiers")
+    search.add_argument("query", help="Mots de la description ou de la catégorie, ou ID")
+    search.add_argument("--buyer", default=None)
+    search.add_argument("--status", action="append", choices=engine.STATUSES, help="Statut (répétable)")
+    search.add_argument("--from", dest="start", default=None, help="Attribués à partir du AAAA-MM-JJ")
+    search.add_argument("--to", dest="end", default=None, help="Attribués jusqu'au AAAA-MM-JJ inclus")
+    search.add_argument("--limit", type=int, default=20, help="Résultats affichés (défaut 20)")
+    search.set_defaults(func=cmd_search)
+
+    serve = commands.add_parser("serve", help="Recevoir les demandes en HTTP/JSON (POST /dossiers)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=intake.DEFAULT_PORT)
+    serve.add_argument("--max-queue", type=int, default=intake.MAX_QUEUE, help="Demandes en attente au-delà desquelles la réception répond 503")
+    serve.add_argument("--batch-size", type=int, default=intake.BATCH_SIZE, help="Demandes assignées par écriture")
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    state = engine.open_state(args.storage, args.data_dir)
+    try:
+        args.func(state, args)
+    except ValueError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
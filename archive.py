@@ -0,0 +1,242 @@
+"""Cold storage of terminal dossiers, one compressed partition per month.
+
+Closed and cancelled dossiers older than a cutoff are moved out of the hot
+table (``dossiers.csv`` and the in-memory frame) into
+``archive/dossiers_YYYY-MM.parquet`` (month of ``Closed_Date``, or of
+``Assigned_Date`` when the dossier was never closed). Without pyarrow the
+partitions are gzip-compressed CSV files instead.
+
+``archive/manifest.json`` keeps, per partition, the row counts per buyer and
+status and the smallest and largest ID, so counts are answered without
+reading any partition, and a lookup by ID only opens the partitions whose
+ID range contains it. Partitions are read lazily (pages of the closed
+dossiers, search, export, history) and the last few are kept in memory.
+"""
+import json
+import os
+from collections import OrderedDict
+
+import pandas as pd
+
+from ids import IdIndex, prefix_upper_bound
+from schema import apply_schema, concat_dossiers, empty_dossiers
+
+ARCHIVE_DIR = "archive"
+MANIFEST_FILE = "manifest.json"
+TERMINAL_STATUSES = ["Closed", "Cancelled"]
+# Partitions kept in memory after being read
+CACHED_PARTITIONS = 4
+NO_BUYER = ""
+
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def archive_month(dossiers):
+    """``YYYY-MM`` partition of each dossier."""
+    when = dossiers["Closed_Date"].fillna(dossiers["Assigned_Date"])
+    return when.dt.strftime("%Y-%m").fillna("0000-00")
+
+
+def _counts(frame):
+    counts = {}
+    groups = frame.groupby([frame["Buyer"].astype(object).fillna(NO_BUYER), frame["Status"].astype(object)], sort=False)
+    for (buyer, status), n in groups.size().items():
+        counts.setdefault(str(buyer), {})[str(status)] = int(n)
+    return counts
+
+
+class ColdArchive:
+    def __init__(self, data_dir):
+        self.dir = os.path.join(data_dir, ARCHIVE_DIR)
+        self.manifest_path = os.path.join(self.dir, MANIFEST_FILE)
+        self._manifest = {}
+        self._manifest_sig = None
+        self._cache = OrderedDict()  # (month, file mtime) -> frame
+        self._ids = None  # (manifest signature, IdIndex of every archived ID)
+
+    # --- Manifest ---
+    def manifest(self):
+        """Partition entries by month, re-read when another process changed them."""
+        try:
+            stat = os.stat(self.manifest_path)
+            sig = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return {}
+        if sig != self._manifest_sig:
+            with open(self.manifest_path, encoding="utf-8") as handle:
+                self._manifest = json.load(handle)["partitions"]
+            self._manifest_sig = sig
+        return self._manifest
+
+    def _write_manifest(self, partitions):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump({"partitions": partitions}, handle, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    # --- Partitions ---
+    def _path(self, entry):
+        return os.path.join(self.dir, entry["file"])
+
+    def _read(self, month):
+        entry = self.manifest()[month]
+        path = self._path(entry)
+        key = (month, os.stat(path).st_mtime_ns)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if path.endswith(".parquet"):
+            frame = pd.read_parquet(path)
+        else:
+            frame = pd.read_csv(path, dtype={"ID": str, "Description": str}, keep_default_na=False, na_values=[""])
+        frame = apply_schema(frame)
+        self._cache[key] = frame
+        while len(self._cache) > CACHED_PARTITIONS:
+            self._cache.popitem(last=False)
+        return frame
+
+    def _write(self, month, frame):
+        # Rewritten whole and renamed over the previous version
+        os.makedirs(self.dir, exist_ok=True)
+        if _parquet_available():
+            name = f"dossiers_{month}.parquet"
+            tmp_path = os.path.join(self.dir, f"{name}.tmp")
+            frame.to_parquet(tmp_path, index=False, compression="zstd")
+        else:
+            name = f"dossiers_{month}.csv.gz"
+            tmp_path = os.path.join(self.dir, f"{name}.tmp")
+            frame.to_csv(tmp_path, index=False, compression="gzip")
+        os.replace(tmp_path, os.path.join(self.dir, name))
+        ids = frame["ID"].dropna().astype(str)
+        return {
+            "file": name,
+            "rows": len(frame),
+            "counts": _counts(frame),
+            "min_id": ids.min() if len(ids) else None,
+            "max_id": ids.max() if len(ids) else None,
+        }
+
+    def add(self, dossiers):
+        """Merge terminal ``dossiers`` into their month partitions.
+
+        A dossier already archived is replaced, so re-running after a crash
+        between the archive write and the hot snapshot write is harmless.
+        """
+        partitions = dict(self.manifest())
+        for month, rows in dossiers.groupby(archive_month(dossiers), sort=True):
+            if month in partitions:
+                rows = concat_dossiers([self._read(month), rows]).drop_duplicates("ID", keep="last")
+            partitions[month] = self._write(month, rows.reset_index(drop=True))
+        self._write_manifest(partitions)
+
+    def discard(self, ids):
+        """Remove the given IDs (restored to the hot table) from the archive."""
+        ids = set(ids)
+        partitions = dict(self.manifest())
+        for month in sorted(partitions):
+            frame = self._read(month)
+            keep = ~frame["ID"].isin(ids)
+            if keep.all():
+                continue
+            if keep.any():
+                partitions[month] = self._write(month, frame[keep].reset_index(drop=True))
+            else:
+                os.remove(self._path(partitions.pop(month)))
+        self._write_manifest(partitions)
+
+    # --- Queries ---
+    def _months_with_id(self, dossier_id):
+        return [
+            month for month, entry in sorted(self.manifest().items())
+            if entry["min_id"] is not None and entry["min_id"] <= dossier_id <= entry["max_id"]
+        ]
+
+    @staticmethod
+    def _entry_count(entry, buyer=None, statuses=None):
+        groups = entry["counts"].values() if buyer is None else [entry["counts"].get(buyer, {})]
+        return sum(n for group in groups for status, n in group.items() if statuses is None or status in statuses)
+
+    def count(self, buyer=None, statuses=None):
+        return sum(self._entry_count(entry, buyer, statuses) for entry in self.manifest().values())
+
+    def find(self, buyer=None, statuses=None, offset=0, limit=None):
+        """Matching archived dossiers, oldest month first; only the partitions of the page are read."""
+        pages = []
+        for month, entry in sorted(self.manifest().items()):
+            if limit is not None and limit <= 0:
+                break
+            n = self._entry_count(entry, buyer, statuses)
+            if offset >= n:
+                offset -= n
+                continue
+            frame = self._read(month)
+            if buyer is not None:
+                frame = frame[frame["Buyer"] == buyer]
+            if statuses is not None:
+                frame = frame[frame["Status"].isin(statuses)]
+            page = frame.iloc[offset:None if limit is None else offset + limit]
+            pages.append(page)
+            offset = 0
+            if limit is not None:
+                limit -= len(page)
+        return concat_dossiers(pages).reset_index(drop=True) if pages else empty_dossiers()
+
+    def get(self, dossier_id):
+        for month in self._months_with_id(dossier_id):
+            frame = self._read(month)
+            match = frame[frame["ID"] == dossier_id]
+            if not match.empty:
+                return match.iloc[0]
+        return None
+
+    def all(self):
+        """Every archived dossier (reads all the partitions)."""
+        frames = [self._read(month) for month in sorted(self.manifest())]
+        return concat_dossiers(frames).reset_index(drop=True) if frames else empty_dossiers()
+
+    def columns(self, names):
+        """Only the ``names`` columns of every archived dossier (history KPIs)."""
+        frames = []
+        for month in sorted(self.manifest()):
+            path = self._path(self.manifest()[month])
+            if path.endswith(".parquet"):
+                frames.append(pd.read_parquet(path, columns=names))
+            else:
+                frames.append(pd.read_csv(path, usecols=names, dtype=str))
+        if not frames:
+            return empty_dossiers()[names]
+        return apply_schema(pd.concat(frames, ignore_index=True))[names]
+
+    def id_index(self, prefix=""):
+        """``IdIndex`` of the archived IDs, or None when no partition can hold ``prefix``.
+
+        Only the ID column of each partition is read, once per archive version.
+        """
+        manifest = self.manifest()
+        high = prefix_upper_bound(prefix) if prefix else None
+        if not any(
+            entry["min_id"] is not None and (high is None or entry["min_id"] < high) and entry["max_id"] >= prefix
+            for entry in manifest.values()
+        ):
+            return None
+        if self._ids is None or self._ids[0] != self._manifest_sig:
+            ids = self.columns(["ID"])["ID"]
+            self._ids = (self._manifest_sig, IdIndex(ids.dropna().astype(str)))
+        return self._ids[1]
+
+    def monthly_counts(self):
+        """Archived dossiers per month and status, from the manifest only."""
+        rows = {}
+        for month, entry in self.manifest().items():
+            for statuses in entry["counts"].values():
+                for status, n in statuses.items():
+                    rows.setdefault(month, {})[status] = rows.get(month, {}).get(status, 0) + n
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows).T.fillna(0).astype(int).sort_index()
@@ -0,0 +1,280 @@
+"""Bulk intake: assign a whole batch of purchase requests in one pass.
+
+The batch is assigned in one pass over an in-memory heap of the buyers
+instead of one ``assign_to_least_busy()`` call (and store write) per request:
+the requests are dealt most urgent first and grouped by category, each to the
+available buyer with the lowest weighted load relative to capacity, so urgent
+requests go to the least loaded buyers and each category is spread across
+buyers instead of piling up on one of them. The rows are written with a
+single store call.
+"""
+import heapq
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+from schema import CATEGORICAL_COLUMNS
+
+URGENCY_ORDER = ["Élevée", "Moyenne", "Faible"]
+
+BATCH_DEFAULTS = {
+    "Category": "Autre",
+    "Urgency": "Moyenne",
+    "Type_AO": "",
+    "Devise": "MAD",
+    "Montant_Ajustement": 0.0,
+    "Date_Ajustement": "",
+}
+
+# Coded columns checked against their known values, with the error message
+CHECKED_COLUMNS = {
+    "Urgency": "Urgence inconnue",
+    "Category": "Catégorie inconnue",
+    "Type_AO": "Type d'AO inconnu",
+    "Devise": "Devise inconnue",
+}
+
+NO_LAST_ASSIGNMENT = np.iinfo(np.int64).max
+
+
+# --- READING ---
+def read_batch(source, name=None):
+    """Read a CSV or JSONL batch of purchase requests (one per row/line)."""
+    name = (name or str(source)).lower()
+    if name.endswith((".jsonl", ".json")):
+        batch = pd.read_json(source, lines=True, dtype=False)
+    elif name.endswith(".csv"):
+        batch = pd.read_csv(source, dtype=str, keep_default_na=False)
+    else:
+        raise ValueError(f"Format de lot non reconnu : {name} (attendu .csv ou .jsonl)")
+    return validate_batch(batch)
+
+
+def _line_numbers(positions):
+    return ", ".join(str(i + 1) for i in positions[:20])
+
+
+def _check_values(col, values):
+    """Raise if ``values`` (one per row) hold a value unknown for ``col``."""
+    known = set(CATEGORICAL_COLUMNS[col])
+    bad = [i for i, value in enumerate(values) if value not in known]
+    if bad:
+        unknown = sorted({str(values[i]) for i in bad})
+        raise ValueError(f"{CHECKED_COLUMNS[col]} aux lignes {_line_numbers(bad)} : {', '.join(unknown[:20])}")
+
+
+def _adjustment_dates(values):
+    """``Date_Ajustement`` values as ``AAAA-MM-JJ`` ("" when empty); raises on an unparsable date."""
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    given = values != ""
+    dates = pd.to_datetime(values[given].astype(str), format="ISO8601", errors="coerce")
+    bad = list(dates.index[dates.isna()])
+    if bad:
+        wrong = sorted({str(values[i]) for i in bad})
+        raise ValueError(
+            f"Date d'ajustement invalide aux lignes {_line_numbers(bad)} : {', '.join(wrong[:20])} "
+            "(format attendu : AAAA-MM-JJ)"
+        )
+    values[given] = dates.dt.strftime("%Y-%m-%d")
+    return values.tolist()
+
+
+def validate_batch(batch):
+    """Cleaned copy of ``batch``, or ``ValueError`` naming the faulty rows (1-based).
+
+    Unknown urgencies, categories, currencies or AO types and unparsable
+    adjustment dates are refused here, so that every backend rejects the same
+    input before anything is written.
+    """
+    if "Description" not in batch.columns:
+        raise ValueError("Colonne 'Description' manquante dans le lot")
+    batch = batch.copy().reset_index(drop=True)
+    batch["Description"] = batch["Description"].fillna("").astype(str).str.strip()
+    empty = batch.index[batch["Description"] == ""]
+    if len(empty):
+        raise ValueError(f"Description vide aux lignes : {_line_numbers(empty)}")
+    for col, default in BATCH_DEFAULTS.items():
+        if col not in batch.columns:
+            batch[col] = default
+        else:
+            batch[col] = batch[col].replace("", np.nan).fillna(default)
+    batch["Montant_Ajustement"] = pd.to_numeric(batch["Montant_Ajustement"], errors="coerce").fillna(0.0)
+    for col in CHECKED_COLUMNS:
+        _check_values(col, batch[col].tolist())
+    batch["Date_Ajustement"] = _adjustment_dates(batch["Date_Ajustement"])
+    return batch
+
+
+def validate_requests(requests):
+    """``validate_batch()`` for a few requests given as dicts, without building a frame.
+
+    Same rules and defaults; returns the cleaned rows (the HTTP intake
+    validates each submission with it, in microseconds per row).
+    """
+    rows, empty = [], []
+    for i, request in enumerate(requests):
+        description = request.get("Description")
+        description = "" if description is None else str(description).strip()
+        if not description:
+            empty.append(i)
+        row = {"Description": description}
+        for col, default in BATCH_DEFAULTS.items():
+            value = request.get(col)
+            row[col] = default if value is None or value == "" or (isinstance(value, float) and np.isnan(value)) else value
+        amount = pd.to_numeric(row["Montant_Ajustement"], errors="coerce")
+        row["Montant_Ajustement"] = 0.0 if pd.isna(amount) else float(amount)
+        if request.get("ID") is not None:
+            row["ID"] = str(request["ID"]).strip()
+        rows.append(row)
+    if empty:
+        raise ValueError(f"Description vide aux lignes : {_line_numbers(empty)}")
+    for col in CHECKED_COLUMNS:
+        _check_values(col, [row[col] for row in rows])
+    if any(row["Date_Ajustement"] != "" for row in rows):
+        for row, date in zip(rows, _adjustment_dates([row["Date_Ajustement"] for row in rows])):
+            row["Date_Ajustement"] = date
+    return rows
+
+
+# --- ASSIGNMENT ---
+def buyer_arrays(index, now_ns):
+    """Names, relative loads, last assignments, ranks, capacities and availability."""
+    keys = index.keys()
+    names = np.array([k[3] for k in keys], dtype=object)
+    loads = np.array([k[0] for k in keys], dtype=float)
+    last = np.array([NO_LAST_ASSIGNMENT if k[1] == np.inf else k[1] for k in keys], dtype=np.int64)
+    rank = np.array([k[2] for k in keys], dtype=np.int64)
+    capacity = np.array([index.capacity(name) for name in names], dtype=float)
+    available = np.array([index.is_available(name, now_ns) for name in names], dtype=bool)
+    if not available.any():
+        # Everyone is absent: assign anyway rather than refuse the batch
+        available[:] = True
+    return names, loads, last, rank, capacity, available
+
+
+def greedy_assign(order, costs, buyers, now_ns):
+    """Buyer position of each row, the rows being taken in ``order``.
+
+    Each row goes to the available buyer with the lowest relative load (then
+    oldest last assignment, then buyer order), exactly like repeated
+    ``assign_to_least_busy()`` calls, but on a local heap.
+    """
+    _, loads, last, rank, capacity, available = buyers
+    heap = [(loads[i], int(last[i]), int(rank[i]), i) for i in np.flatnonzero(available)]
+    heapq.heapify(heap)
+    positions = np.empty(len(order), dtype=np.int64)
+    for row in order:
+        load, _, buyer_rank, pos = heapq.heappop(heap)
+        positions[row] = pos
+        heapq.heappush(heap, (round(load + costs[row] / capacity[pos], 9), now_ns, buyer_rank, pos))
+    return positions
+
+
+def assign_batch(batch, costs, buyers, now_ns):
+    """Buyer position for each row of ``batch``: urgent first, grouped by category."""
+    urgency = batch["Urgency"].map({u: i for i, u in enumerate(URGENCY_ORDER)}).to_numpy()
+    category = pd.factorize(batch["Category"], sort=True)[0]
+    return greedy_assign(np.lexsort((category, urgency)), costs, buyers, now_ns)
+
+
+def sequential_greedy(costs, buyers, now_ns):
+    """Reference: ``assign_to_least_busy()`` called once per request, in order."""
+    return greedy_assign(np.arange(len(costs)), costs, buyers, now_ns)
+
+
+def assignment_quality(buyers, positions, batch, costs):
+    """Balance of the final relative load and of urgent/category spread across buyers."""
+    _, loads, _, _, capacity, _ = buyers
+    n_buyers = len(loads)
+    final = loads + np.bincount(positions, weights=costs / capacity[positions], minlength=n_buyers)
+    urgent = np.bincount(positions[(batch["Urgency"] == URGENCY_ORDER[0]).to_numpy()], minlength=n_buyers)
+    category_spreads = [
+        np.ptp(np.bincount(positions[(batch["Category"] == cat).to_numpy()], minlength=n_buyers))
+        for cat in batch["Category"].unique()
+    ]
+    return {
+        "max_load": round(float(final.max()), 3),
+        "load_spread": round(float(np.ptp(final)), 3),
+        "load_std": round(float(final.std()), 3),
+        "urgent_spread": int(np.ptp(urgent)),
+        "category_spread": round(float(np.mean(category_spreads)), 3) if category_spreads else 0.0,
+    }
+
+
+# --- IMPORT ---
+@profiled("import_batch")
+def import_batch(state, batch, actor=None):
+    """Assign and persist ``batch`` (validated frame) in one write.
+
+    Returns the created rows and a report comparing the batch assignment with
+    sequential greedy assignment.
+    """
+    store = state.store
+    start = time.perf_counter()
+    with state.mutation():
+        if not state.workload.keys():
+            raise ValueError("Aucun acheteur configuré")
+        n = len(batch)
+        assigned_date = datetime.now().strftime("%Y-%m-%d %H:%M")
+        now_ns = pd.Timestamp(assigned_date).value
+        buyers = buyer_arrays(state.workload, now_ns)
+        costs = state.costs.costs(batch)
+
+        assign_start = time.perf_counter()
+        positions = assign_batch(batch, costs, buyers, now_ns)
+        assign_seconds = time.perf_counter() - assign_start
+
+        rows = batch[["Description"] + list(BATCH_DEFAULTS)].copy()
+        if "ID" in batch.columns:
+            ids = batch["ID"].fillna("").astype(str).str.strip()
+        else:
+            ids = pd.Series("", index=batch.index)
+        given = ids[ids != ""]
+        duplicates = sorted(set(given[given.duplicated()]) | {i for i in given if store.get_dossier(i) is not None})
+        if duplicates:
+            raise ValueError(f"IDs déjà utilisés : {', '.join(duplicates[:20])}")
+        ids = ids.to_numpy(dtype=object)
+        missing = ids == ""
+        ids[missing] = state.ids.allocate(int(missing.sum()), taken=set(given))
+        # Never write a colliding ID: the stores would drop the row without error
+        allocated = ids[missing]
+        existing = set()
+        for prefix in {dossier_id.rsplit("-", 1)[0] + "-" for dossier_id in allocated}:
+            existing.update(store.ids_with_prefix(prefix))
+        collisions = sorted(existing.intersection(allocated) | set(given).intersection(allocated))
+        if collisions:
+            raise ValueError(f"IDs déjà utilisés : {', '.join(collisions[:20])}")
+        names = buyers[0]
+
+        rows.insert(0, "ID", ids)
+        rows.insert(4, "Buyer", names[positions])
+        rows.insert(5, "Status", "Open")
+        rows.insert(6, "Assigned_Date", assigned_date)
+        rows.insert(7, "Closed_Date", "")
+        records = rows.to_dict("records")
+        store.append_dossiers(records)
+        state.workload.on_create_many(rows["Buyer"].tolist(), assigned_date, costs.tolist())
+        state.kpi.on_create_many(records)
+        state.search.on_create(records)
+        state.events.created(records, actor)
+    if state.notifications is not None:
+        # One digest per buyer for the whole batch
+        state.notifications.enqueue(state.store.buyers(), records)
+    seconds = time.perf_counter() - start
+
+    seq_start = time.perf_counter()
+    sequential = sequential_greedy(costs, buyers, now_ns)
+    sequential_seconds = time.perf_counter() - seq_start
+
+    report = {
+        "count": n,
+        "seconds": round(seconds, 4),
+        "assign_seconds": round(assign_seconds, 6),
+        "sequential_assign_seconds": round(sequential_seconds, 6),
+        "batch": assignment_quality(buyers, positions, batch, costs),
+        "sequential": assignment_quality(buyers, sequential, batch, costs),
+    }
+    return rows, report
@@ -0,0 +1,406 @@
+"""Benchmarks of Achat Assistant on synthetic data.
+
+    python benchmark.py generate --dossiers 100000 --buyers 50 --out data_test
+    python benchmark.py run --dossiers 10000 100000 --buyers 10 500 --backend csv sqlite
+    python benchmark.py compare benchmark_results_old.json benchmark_results.json
+    python benchmark.py startup --dossiers 10000 100000 --reruns 20
+
+``run`` generates a realistic dataset per scenario in a temporary directory,
+times the data helpers and each page's data preparation, and writes the
+results as JSON so that two versions can be compared with ``compare``.
+``startup`` runs the app itself in a fresh process (Streamlit's test runner)
+and reports its cold start (imports, first load, first render) and its warm
+reruns, section by section, from the app's own profile.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import engine
+import profiling
+from export import EXCEL_MAX_ROWS, dossiers_to_csv, dossiers_to_excel, dossiers_to_parquet
+from storage import open_store
+
+DESCRIPTIONS = {
+    "Informatique": [
+        "Ordinateur portable pour nouveau collaborateur", "Écran 27 pouces", "Licence logicielle annuelle",
+        "Serveur de sauvegarde", "Imprimante réseau", "Switch 48 ports",
+    ],
+    "Pièce de rechange": [
+        "Roulement pour convoyeur", "Courroie de transmission", "Joint hydraulique",
+        "Moteur de pompe", "Filtre à huile", "Capteur de pression",
+    ],
+    "Service": [
+        "Contrat de maintenance annuel", "Prestation de nettoyage", "Formation sécurité",
+        "Audit énergétique", "Transport de matériel", "Gardiennage du site",
+    ],
+    "Matériel": [
+        "Chariot élévateur", "Équipements de protection individuelle", "Mobilier de bureau",
+        "Outillage électroportatif", "Palettes et rayonnages", "Groupe électrogène",
+    ],
+    "Autre": [
+        "Fournitures de bureau", "Abonnement revue technique", "Cadeaux clients",
+        "Location de salle", "Frais d'inscription salon", "Produits d'entretien",
+    ],
+}
+CATEGORY_WEIGHTS = [0.3, 0.25, 0.2, 0.15, 0.1]
+URGENCY_WEIGHTS = [0.2, 0.5, 0.3]
+DEVISES = ["MAD", "EUR", "USD", "GBP", "Autre"]
+DEVISE_WEIGHTS = [0.6, 0.2, 0.12, 0.05, 0.03]
+
+
+# --- SYNTHETIC DATA ---
+def generate_dataset(n_dossiers, n_buyers, status_mix=(0.2, 0.7, 0.1),
+                     start="2023-01-01", end="2025-12-31", seed=0):
+    """Synthetic ``(dossiers, buyers)`` frames in the format of the CSV files.
+
+    ``status_mix`` gives the Open / Closed / Cancelled proportions. Buyers
+    receive dossiers with a skewed (Zipf-like) distribution, as in practice.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array([f"Acheteur {i:04d}" for i in range(1, n_buyers + 1)], dtype=object)
+    buyers = pd.DataFrame({
+        "Name": names,
+        "Email": [f"acheteur{i:04d}@example.com" for i in range(1, n_buyers + 1)],
+    })
+
+    start_ns, end_ns = pd.Timestamp(start).value, pd.Timestamp(end).value
+    assigned = pd.Series(np.sort(rng.integers(start_ns, end_ns, n_dossiers))).astype("datetime64[ns]").dt.floor("min")
+    day = assigned.dt.strftime("%Y%m%d")
+    seq = day.groupby(day).cumcount() + 1
+    ids = "PR-" + day + "-" + seq.astype(str).str.zfill(3)
+
+    categories = list(DESCRIPTIONS)
+    category_idx = rng.choice(len(categories), n_dossiers, p=CATEGORY_WEIGHTS)
+    templates = np.array([desc for cat in categories for desc in DESCRIPTIONS[cat]], dtype=object)
+    per_category = len(DESCRIPTIONS[categories[0]])
+    description = templates[category_idx * per_category + rng.integers(0, per_category, n_dossiers)]
+
+    buyer_weights = 1.0 / np.arange(1, n_buyers + 1) ** 0.5
+    buyer = names[rng.choice(n_buyers, n_dossiers, p=buyer_weights / buyer_weights.sum())]
+    status = np.array(engine.STATUSES, dtype=object)[rng.choice(3, n_dossiers, p=list(status_mix))]
+
+    lead_time = pd.to_timedelta(rng.exponential(10 * 24 * 60, n_dossiers).astype(np.int64), unit="min")
+    closed = (assigned + lead_time).where(status == "Closed")
+
+    adjusted = rng.random(n_dossiers) < 0.15
+    montant = np.where(adjusted, np.round(rng.normal(0, 5000, n_dossiers), 2), 0.0)
+    date_ajustement = (assigned + pd.to_timedelta(rng.integers(0, 30, n_dossiers), unit="D")).dt.strftime("%Y-%m-%d")
+
+    dossiers = pd.DataFrame({
+        "ID": ids,
+        "Description": description,
+        "Category": np.array(categories, dtype=object)[category_idx],
+        "Urgency": np.array(engine.URGENCIES, dtype=object)[rng.choice(3, n_dossiers, p=URGENCY_WEIGHTS)],
+        "Buyer": buyer,
+        "Status": status,
+        "Assigned_Date": assigned,
+        "Closed_Date": closed,
+        "Type_AO": np.array(["", "AO Ouvert", "AO fermé"], dtype=object)[rng.choice(3, n_dossiers, p=[0.5, 0.3, 0.2])],
+        "Devise": np.array(DEVISES, dtype=object)[rng.choice(len(DEVISES), n_dossiers, p=DEVISE_WEIGHTS)],
+        "Montant_Ajustement": montant,
+        "Date_Ajustement": date_ajustement.where(adjusted, ""),
+    })
+    return dossiers, buyers
+
+
+def write_dataset(data_dir, dossiers, buyers):
+    os.makedirs(data_dir, exist_ok=True)
+    dossiers.to_csv(os.path.join(data_dir, "dossiers.csv"), index=False, date_format="%Y-%m-%d %H:%M")
+    buyers.to_csv(os.path.join(data_dir, "buyers.csv"), index=False)
+
+
+# --- TIMING ---
+def time_call(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return {"min": min(durations), "median": float(np.median(durations)), "runs": repeat}
+
+
+def page_queries(state):
+    """Data preparation of each page, as the pages ask it from the store."""
+    store = state.store
+    buyer = store.buyers()["Name"].iloc[0]
+    some_id = store.dossier_ids()[-1]
+
+    def accueil():
+        return store.count_dossiers(), store.count_dossiers(status="Open"), len(store.buyers())
+
+    def suivi():
+        workload = engine.get_buyer_workload(state)
+        last_assign = engine.get_last_assignment(state)
+        total = store.count_dossiers(buyer=buyer)
+        active = store.find_dossiers(buyer=buyer, statuses=["Open"], limit=50)
+        active["Date_Ajustement"] = active["Date_Ajustement"].dt.strftime("%d/%m/%Y").fillna("")
+        active["Montant_Ajustement"].map("{:+,.2f}".format)
+        closed_total = store.count_dossiers(status=["Closed", "Cancelled"], buyer=buyer)
+        closed = store.find_dossiers(buyer=buyer, statuses=["Closed", "Cancelled"], limit=50)
+        return workload.get(buyer, 0), last_assign.get(buyer), total, active, closed_total, closed
+
+    def gestion():
+        return store.count_ids_with_prefix("PR-"), store.ids_with_prefix("PR-", 0, 50), store.get_dossier(some_id)
+
+    def kpi():
+        kpi = state.kpi
+        return (store.count_dossiers(), store.count_dossiers(status="Open"),
+                store.count_dossiers(status="Closed"), engine.get_buyer_workload(state),
+                kpi.series("created", "day", 60), kpi.series("closed", "day", 60), kpi.lead_time(),
+                kpi.backlog_age(), kpi.category_breakdown())
+
+    return {"page_accueil": accueil, "page_suivi": suivi, "page_gestion": gestion, "page_kpi": kpi}
+
+
+def run_scenario(n_dossiers, n_buyers, backend, repeat=3, skip=(), **dataset_options):
+    with tempfile.TemporaryDirectory() as data_dir:
+        dossiers, buyers = generate_dataset(n_dossiers, n_buyers, **dataset_options)
+        write_dataset(data_dir, dossiers, buyers)
+        del dossiers
+
+        timings = {}
+        start = time.perf_counter()
+        state = engine.open_state(backend, data_dir)
+        elapsed = time.perf_counter() - start
+        timings["init_state"] = {"min": elapsed, "median": elapsed, "runs": 1}
+
+        full_dossiers, full_buyers = state.store.load()
+        benchmarks = {
+            "load_data": lambda: open_store(backend, data_dir).load(),
+            "generate_dossier_id": lambda: engine.generate_dossier_id(state),
+            "get_buyer_workload": lambda: engine.get_buyer_workload(state),
+            "get_last_assignment": lambda: engine.get_last_assignment(state),
+            "assign_to_least_busy": lambda: engine.assign_to_least_busy(state),
+            "create_dossier": lambda: engine.create_dossier(state, "Dossier de test", "Informatique", "Moyenne"),
+            "save_data": lambda: engine.save_data(state, full_dossiers, full_buyers),
+            "convert_df_to_excel": lambda: dossiers_to_excel(full_dossiers),
+            "export_csv": lambda: dossiers_to_csv(full_dossiers),
+            "export_parquet": lambda: dossiers_to_parquet(full_dossiers),
+            **page_queries(state),
+        }
+        for name, fn in benchmarks.items():
+            if name in skip:
+                timings[name] = {"skipped": "--skip"}
+            elif name == "convert_df_to_excel" and len(full_dossiers) > EXCEL_MAX_ROWS:
+                timings[name] = {"skipped": "au-delà de la limite de lignes d'Excel"}
+            else:
+                timings[name] = time_call(fn, repeat)
+        # Written now rather than at exit, when the directory is gone
+        state.kpi.flush()
+
+        return {
+            "dossiers": n_dossiers,
+            "buyers": n_buyers,
+            "backend": backend,
+            "memory_mb": round(full_dossiers.memory_usage(deep=True).sum() / 2**20, 2),
+            "timings": timings,
+        }
+
+
+# Run in a fresh interpreter so that the cold start pays the imports: argv is
+# the app path and the number of warm reruns; prints the Streamlit import time
+STARTUP_PROBE = """
+import sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+print(time.perf_counter() - started)
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+for _ in range(int(sys.argv[2]) + 1):
+    app.run()
+    if app.exception:
+        sys.exit(app.exception[0].value)
+"""
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "achat.py")
+
+
+def startup_scenario(n_dossiers, n_buyers, backend, reruns=20, **dataset_options):
+    with tempfile.TemporaryDirectory() as data_dir:
+        dossiers, buyers = generate_dataset(n_dossiers, n_buyers, **dataset_options)
+        write_dataset(data_dir, dossiers, buyers)
+        del dossiers
+        env = {**os.environ, "ACHAT_DATA_DIR": data_dir, "ACHAT_STORAGE": backend}
+        probe = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE, APP_PATH, str(reruns)],
+            env=env, cwd=data_dir, capture_output=True, text=True
+        )
+        if probe.returncode:
+            raise RuntimeError(f"Échec du lancement de l'application : {probe.stderr.strip()[-2000:]}")
+        records = profiling.read_metrics(profiling.metrics_path(data_dir), last=reruns + 1)
+
+    cold = next(r for r in records if r.get("cold"))
+    warm = [r for r in records if not r.get("cold") and not r.get("fragment")]
+    sections = list(dict.fromkeys(name for r in records for name in r["sections"]))
+    return {
+        "dossiers": n_dossiers,
+        "buyers": n_buyers,
+        "backend": backend,
+        "streamlit_import_ms": round(float(probe.stdout.split()[0]) * 1000, 3),
+        "cold_start_ms": cold[profiling.TOTAL],
+        "warm_rerun_ms": {"median": float(np.median([r[profiling.TOTAL] for r in warm])),
+                          "p95": float(np.percentile([r[profiling.TOTAL] for r in warm], 95)),
+                          "runs": len(warm)},
+        "sections": {
+            name: {"cold": cold["sections"].get(name, 0.0),
+                   "warm_median": float(np.median([r["sections"].get(name, 0.0) for r in warm]))}
+            for name in sections
+        },
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _meta():
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+# --- COMMANDS ---
+def cmd_generate(args):
+    dossiers, buyers = generate_dataset(
+        args.dossiers, args.buyers, tuple(args.status_mix), args.start, args.end, args.seed
+    )
+    write_dataset(args.out, dossiers, buyers)
+    print(f"{len(dossiers)} dossiers et {len(buyers)} acheteurs écrits dans {args.out}")
+
+
+def cmd_run(args):
+    results = []
+    for n_dossiers, n_buyers, backend in itertools.product(args.dossiers, args.buyers, args.backend):
+        print(f"… {n_dossiers} dossiers, {n_buyers} acheteurs, {backend}", file=sys.stderr)
+        results.append(run_scenario(
+            n_dossiers, n_buyers, backend, repeat=args.repeat, skip=set(args.skip),
+            status_mix=tuple(args.status_mix), start=args.start, end=args.end, seed=args.seed
+        ))
+    report = {"meta": _meta(), "results": results}
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2, ensure_ascii=False)
+    for result in results:
+        print(f"\n{result['dossiers']} dossiers / {result['buyers']} acheteurs / {result['backend']}"
+              f" ({result['memory_mb']} Mo)")
+        for name, timing in result["timings"].items():
+            value = f"{timing['median'] * 1000:10.2f} ms" if "median" in timing else f"{'ignoré':>13}"
+            print(f"  {name:<22}{value}")
+    print(f"\nRésultats écrits dans {args.output}")
+
+
+def cmd_startup(args):
+    results = []
+    for n_dossiers, backend in itertools.product(args.dossiers, args.backend):
+        print(f"… {n_dossiers} dossiers, {args.buyers} acheteurs, {backend}", file=sys.stderr)
+        results.append(startup_scenario(
+            n_dossiers, args.buyers, backend, reruns=args.reruns,
+            status_mix=tuple(args.status_mix), start=args.start, end=args.end, seed=args.seed
+        ))
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump({"meta": _meta(), "results": results}, handle, indent=2, ensure_ascii=False)
+    for result in results:
+        warm = result["warm_rerun_ms"]
+        print(f"\n{result['dossiers']} dossiers / {result['buyers']} acheteurs / {result['backend']}")
+        print(f"  Import de Streamlit        {result['streamlit_import_ms']:10.2f} ms")
+        print(f"  Démarrage à froid          {result['cold_start_ms']:10.2f} ms")
+        print(f"  Rendu à chaud (médiane)    {warm['median']:10.2f} ms   (p95 {warm['p95']:.2f} ms, {warm['runs']} rendus)")
+        print(f"  {'section':<26}{'à froid':>13}{'à chaud':>13}")
+        for name, timing in result["sections"].items():
+            print(f"  {name:<26}{timing['cold']:10.2f} ms{timing['warm_median']:10.2f} ms")
+    print(f"\nRésultats écrits dans {args.output}")
+
+
+def cmd_compare(args):
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    with open(args.candidate, encoding="utf-8") as handle:
+        candidate = json.load(handle)
+    previous = {(r["dossiers"], r["buyers"], r["backend"]): r for r in baseline["results"]}
+    regressions = 0
+    for result in candidate["results"]:
+        key = (result["dossiers"], result["buyers"], result["backend"])
+        if key not in previous:
+            continue
+        print(f"\n{key[0]} dossiers / {key[1]} acheteurs / {key[2]}")
+        for name, timing in result["timings"].items():
+            before = previous[key]["timings"].get(name, {})
+            if "median" not in timing or "median" not in before:
+                continue
+            ratio = timing["median"] / before["median"] if before["median"] else float("inf")
+            flag = "  ⚠️ régression" if ratio > args.threshold else ""
+            regressions += bool(flag)
+            print(f"  {name:<22}{before['median'] * 1000:10.2f} ms → {timing['median'] * 1000:10.2f} ms"
+                  f"  x{ratio:.2f}{flag}")
+    return 1 if regressions else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks d'Achat Assistant sur données synthétiques")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dataset = argparse.ArgumentParser(add_help=False)
+    dataset.add_argument("--status-mix", nargs=3, type=float, default=[0.2, 0.7, 0.1],
+                         metavar=("OPEN", "CLOSED", "CANCELLED"), help="Proportions des statuts")
+    dataset.add_argument("--start", default="2023-01-01", help="Première date d'attribution")
+    dataset.add_argument("--end", default="2025-12-31", help="Dernière date d'attribution")
+    dataset.add_argument("--seed", type=int, default=0)
+
+    generate = commands.add_parser("generate", parents=[dataset], help="Écrire un jeu de données synthétique")
+    generate.add_argument("--dossiers", type=int, default=10_000)
+    generate.add_argument("--buyers", type=int, default=10)
+    generate.add_argument("--out", required=True, help="Dossier de sortie")
+    generate.set_defaults(func=cmd_generate)
+
+    run = commands.add_parser("run", parents=[dataset], help="Mesurer les temps d'exécution")
+    run.add_argument("--dossiers", type=int, nargs="+", default=[10_000])
+    run.add_argument("--buyers", type=int, nargs="+", default=[10])
+    run.add_argument("--backend", nargs="+", default=["csv"], choices=["csv", "sqlite"])
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--skip", nargs="*", default=[], help="Mesures à ignorer (ex. convert_df_to_excel)")
+    run.add_argument("--output", default="benchmark_results.json")
+    run.set_defaults(func=cmd_run)
+
+    startup = commands.add_parser("startup", parents=[dataset],
+                                  help="Mesurer le démarrage à froid et les rendus à chaud de l'application")
+    startup.add_argument("--dossiers", type=int, nargs="+", default=[10_000])
+    startup.add_argument("--buyers", type=int, default=10)
+    startup.add_argument("--backend", nargs="+", default=["csv"], choices=["csv", "sqlite"])
+    startup.add_argument("--reruns", type=int, default=20, help="Rendus à chaud mesurés")
+    startup.add_argument("--output", default="benchmark_results_startup.json")
+    startup.set_defaults(func=cmd_startup)
+
+    compare = commands.add_parser("compare", help="Comparer deux fichiers de résultats")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=1.2, help="Ratio au-delà duquel signaler une régression")
+    compare.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Weighted cost of a dossier and buyer availability.
+
+A dossier's cost is the product of its urgency, category and ``Type_AO``
+weights (an "Élevée" IT tender weighs more than a "Faible" spare part).
+A buyer's load is the sum of the costs of their open dossiers divided by
+their capacity (``Capacity`` column of ``buyers.csv``, 1 by default), and
+buyers are not assigned new dossiers during their absence windows
+(``Absences`` column: ``YYYY-MM-DD:YYYY-MM-DD`` periods separated by ``;``).
+
+The default weights can be overridden with an ``achat_weights.json`` file in
+the data directory, e.g. ``{"Urgency": {"Élevée": 3}, "Type_AO": {"AO Ouvert": 2.5}}``.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+WEIGHTS_FILE = "achat_weights.json"
+
+DEFAULT_WEIGHTS = {
+    "Urgency": {"Élevée": 2.0, "Moyenne": 1.0, "Faible": 0.5},
+    "Category": {"Informatique": 1.2, "Pièce de rechange": 0.8, "Service": 1.0, "Matériel": 1.0, "Autre": 1.0},
+    "Type_AO": {"": 1.0, "AO Ouvert": 2.0, "AO fermé": 1.5},
+}
+
+
+class CostModel:
+    def __init__(self, weights=None):
+        self.weights = {col: dict(values) for col, values in DEFAULT_WEIGHTS.items()}
+        for col, values in (weights or {}).items():
+            if col not in self.weights:
+                raise ValueError(f"Pondération inconnue : {col} (attendu {', '.join(self.weights)})")
+            self.weights[col].update({key: float(value) for key, value in values.items()})
+
+    def cost(self, urgency, category, type_ao=""):
+        """Cost of one dossier; unknown values weigh 1."""
+        weights = self.weights
+        return (
+            weights["Urgency"].get(urgency, 1.0)
+            * weights["Category"].get(category, 1.0)
+            * weights["Type_AO"].get(type_ao if isinstance(type_ao, str) else "", 1.0)
+        )
+
+    def costs(self, dossiers):
+        """Cost of every row of ``dossiers`` (vectorized)."""
+        total = np.ones(len(dossiers))
+        for col, weights in self.weights.items():
+            if col in dossiers.columns:
+                values = dossiers[col].astype(object)
+                if col == "Type_AO":
+                    values = values.fillna("")
+                total *= values.map(weights).astype(float).fillna(1.0).to_numpy()
+        return total
+
+
+def load_cost_model(data_dir):
+    path = os.path.join(data_dir, WEIGHTS_FILE)
+    if not os.path.exists(path):
+        return CostModel()
+    with open(path, encoding="utf-8") as handle:
+        return CostModel(json.load(handle))
+
+
+# --- AVAILABILITY ---
+def parse_absences(text):
+    """``[(start_ns, end_ns), ...]`` of ``start:end`` day periods (end day included)."""
+    windows = []
+    if not isinstance(text, str):
+        return windows
+    for period in filter(None, (part.strip() for part in text.split(";"))):
+        first, _, last = period.partition(":")
+        try:
+            start = pd.Timestamp(first.strip())
+            end = pd.Timestamp((last or first).strip()) + pd.Timedelta(days=1)
+        except ValueError:
+            raise ValueError(f"Période d'absence invalide : {period} (attendu AAAA-MM-JJ:AAAA-MM-JJ)") from None
+        if pd.isna(start) or pd.isna(end) or end <= start:
+            raise ValueError(f"Période d'absence invalide : {period} (attendu AAAA-MM-JJ:AAAA-MM-JJ)")
+        windows.append((start.value, end.value))
+    return windows
+
+
+def check_capacity(capacity):
+    try:
+        capacity = float(capacity)
+    except (TypeError, ValueError):
+        raise ValueError(f"Capacité invalide : {capacity}") from None
+    if not capacity > 0:
+        raise ValueError("La capacité doit être strictement positive")
+    return capacity
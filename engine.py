@@ -0,0 +1,260 @@
+"""Assignment engine: the business logic of Achat Assistant, without Streamlit.
+
+Every function takes the ``AchatState`` it works on explicitly, so the same
+code serves the Streamlit pages, the ``achat_cli.py`` command line and any
+integration that imports this module (cron jobs, scripts).
+"""
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import fx
+import history
+from cost_model import check_capacity, parse_absences
+from profiling import profiled
+from schema import CATEGORICAL_COLUMNS
+from state import AchatState
+from storage import DATA_DIR, STORAGE_BACKEND, open_store
+
+STATUSES = CATEGORICAL_COLUMNS["Status"]
+CATEGORIES = CATEGORICAL_COLUMNS["Category"]
+URGENCIES = CATEGORICAL_COLUMNS["Urgency"]
+
+
+@profiled("load")
+def open_state(backend=STORAGE_BACKEND, data_dir=DATA_DIR):
+    return AchatState(open_store(backend, data_dir))
+
+
+# --- ASSIGNMENT ---
+@profiled("generate_id")
+def generate_dossier_id(state):
+    # Per-day sequence; the allocator skips numbers taken by a manually entered ID
+    return state.ids.next_id()
+
+
+@profiled("workload")
+def get_buyer_workload(state):
+    return state.workload.workload()
+
+
+@profiled("last_assignment")
+def get_last_assignment(state):
+    return state.workload.last_assignment()
+
+
+@profiled("assign")
+def assign_to_least_busy(state):
+    # Lowest weighted load relative to capacity among the buyers present,
+    # then oldest last assignment: top of the index heap
+    return state.workload.pick() or "N/A"
+
+
+@profiled("save")
+def save_data(state, dossiers, buyers):
+    # Full snapshot; day-to-day mutations go through the store's single-row writes
+    state.store.save(dossiers, buyers)
+
+
+# --- MUTATIONS ---
+@profiled("create_dossier")
+def create_dossier(state, description, category="Autre", urgency="Moyenne", dossier_id=None,
+                   type_ao="", devise="MAD", montant_ajustement=0.0, date_ajustement=None, actor=None):
+    """Create a dossier, assign it to the least busy buyer and persist it.
+
+    Returns the new row. Raises ``ValueError`` for an empty description, a
+    blank ``dossier_id`` (``None`` generates one) or an ID that is already used.
+    """
+    if not description.strip():
+        raise ValueError("Veuillez entrer une description")
+    if dossier_id is not None:
+        dossier_id = dossier_id.strip()
+        if not dossier_id:
+            raise ValueError("L'ID du dossier ne peut pas être vide")
+    # ID, assignment and write happen under the shared state's lock
+    with state.mutation():
+        if dossier_id is None:
+            dossier_id = generate_dossier_id(state)
+        elif state.store.get_dossier(dossier_id) is not None:
+            raise ValueError(f"L'ID `{dossier_id}` existe déjà. Veuillez en choisir un autre.")
+
+        assigned_to = assign_to_least_busy(state)
+        assigned_date = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+        new_dossier = {
+            "ID": dossier_id,
+            "Description": description,
+            "Category": category,
+            "Urgency": urgency,
+            "Buyer": assigned_to,
+            "Status": "Open",
+            "Assigned_Date": assigned_date,
+            "Closed_Date": "",
+            "Type_AO": type_ao or "",
+            "Devise": devise,
+            "Montant_Ajustement": montant_ajustement,
+            "Date_Ajustement": date_ajustement.strftime("%Y-%m-%d") if date_ajustement else ""
+        }
+
+        # Persist (single-row write)
+        state.store.append_dossier(new_dossier)
+        state.workload.on_create(assigned_to, assigned_date, cost=state.costs.cost(urgency, category, type_ao))
+        state.kpi.on_create(new_dossier)
+        state.search.on_create([new_dossier])
+        state.events.created([new_dossier], actor)
+    # Queued only: the worker thread sends the email
+    if state.notifications is not None:
+        state.notifications.enqueue(state.store.buyers(), [new_dossier])
+    return new_dossier
+
+
+@profiled("update_status")
+def update_status(state, dossier_id, new_status, comment="", actor=None):
+    """Change the status of a dossier; returns the changed columns.
+
+    The change and the optional ``comment`` are recorded in the event history.
+    """
+    if new_status not in STATUSES:
+        raise ValueError(f"Statut inconnu : {new_status}")
+    with state.mutation():
+        dossier = state.store.get_dossier(dossier_id)
+        if dossier is None:
+            raise ValueError(f"Aucun dossier trouvé avec l'ID : `{dossier_id}`")
+        changes = {"Status": new_status}
+        if new_status == "Closed" and (pd.isna(dossier["Closed_Date"]) or dossier["Closed_Date"] == ""):
+            changes["Closed_Date"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+        state.store.update_dossier(dossier_id, changes)
+        state.workload.on_status_change(
+            dossier["Buyer"], dossier["Assigned_Date"], dossier["Status"], new_status,
+            cost=state.costs.cost(dossier["Urgency"], dossier["Category"], dossier["Type_AO"])
+        )
+        state.kpi.on_status_change(dossier, changes)
+        state.search.on_status_change(dossier_id, new_status)
+        state.events.status_changed(dossier, new_status, comment, actor)
+    return changes
+
+
+@profiled("reassign")
+def reassign_dossier(state, dossier_id, buyer, comment="", actor=None):
+    """Give a dossier to another buyer; returns the changed columns.
+
+    The assignment date is kept. The change and the optional ``comment`` are
+    recorded in the event history.
+    """
+    with state.mutation():
+        dossier = state.store.get_dossier(dossier_id)
+        if dossier is None:
+            raise ValueError(f"Aucun dossier trouvé avec l'ID : `{dossier_id}`")
+        if buyer not in state.store.buyers()["Name"].values:
+            raise ValueError(f"Acheteur inconnu : {buyer}")
+        if buyer == dossier["Buyer"]:
+            return {}
+        changes = {"Buyer": buyer}
+        state.store.update_dossier(dossier_id, changes)
+        state.workload.on_reassign(
+            dossier["Buyer"], buyer, dossier["Assigned_Date"], dossier["Status"],
+            cost=state.costs.cost(dossier["Urgency"], dossier["Category"], dossier["Type_AO"])
+        )
+        state.kpi.on_reassign(dossier, buyer)
+        state.search.on_reassign(dossier_id, buyer)
+        state.events.reassigned(dossier, buyer, comment, actor)
+    return changes
+
+
+def add_buyer(state, name, email="", capacity=1.0, absences=""):
+    name = name.strip()
+    if not name:
+        raise ValueError("Veuillez entrer un nom d'acheteur")
+    capacity = check_capacity(capacity)
+    parse_absences(absences)
+    with state.mutation():
+        if name in state.store.buyers()["Name"].values:
+            raise ValueError("Cet acheteur existe déjà")
+        state.store.append_buyer({"Name": name, "Email": email, "Capacity": capacity, "Absences": absences})
+        state.workload.add_buyer(name, capacity, absences)
+
+
+def update_buyer(state, name, capacity, absences=""):
+    """Change a buyer's capacity and absence windows (``AAAA-MM-JJ:AAAA-MM-JJ;...``)."""
+    capacity = check_capacity(capacity)
+    absences = absences.strip()
+    parse_absences(absences)
+    with state.mutation():
+        if name not in state.store.buyers()["Name"].values:
+            raise ValueError(f"Acheteur inconnu : {name}")
+        state.store.update_buyer(name, {"Capacity": capacity, "Absences": absences})
+        state.workload.set_profile(name, capacity, absences)
+
+
+# --- ARCHIVING ---
+ARCHIVE_AFTER_DAYS = 90
+
+
+@profiled("archive")
+def archive_dossiers(state, days=ARCHIVE_AFTER_DAYS):
+    """Move dossiers closed or cancelled more than ``days`` days ago to the cold archive."""
+    if days < 0:
+        raise ValueError("Le nombre de jours doit être positif")
+    before = datetime.now() - timedelta(days=days)
+    with state.mutation():
+        return state.store.archive(before)
+
+
+# --- AMOUNTS ---
+@profiled("fx")
+def adjustment_totals(state):
+    """Adjustment amounts converted to MAD, totalled per buyer, category and month."""
+    dossiers = state.store.all_dossiers()
+    mad = fx.to_mad(dossiers, fx.load_rates(state.store.data_dir))
+    return fx.totals(dossiers, mad)
+
+
+# --- HISTORY ---
+@profiled("history")
+def dossier_history(state, dossier_id):
+    """Events of a dossier, oldest first, with a French label and description."""
+    events = state.events.dossier_history(dossier_id)
+    events["Label"] = events["Type"].map(history.EVENT_LABELS)
+    events["Detail"] = [history.describe(*event) for event in zip(events["Type"], events["Buyer"], events["Data"])]
+    return events
+
+
+@profiled("workload_as_of")
+def workload_as_of(state, when):
+    """Open dossiers per buyer at ``when``, read from the history snapshots.
+
+    Raises ``ValueError`` for a date before the history starts.
+    """
+    workload = state.events.workload_as_of(when)
+    if workload is None:
+        start = state.events.starts_at()
+        raise ValueError(f"Historique disponible à partir du {start:%Y-%m-%d %H:%M}")
+    return workload
+
+
+# --- SEARCH ---
+@profiled("search")
+def search_dossiers(state, query, buyer=None, statuses=None, start=None, end=None, offset=0, limit=50):
+    """Dossiers matching ``query`` (words of the description or category, or ID), best first.
+
+    Returns the number of matches and the requested page of rows, with their
+    ``Score``.
+    """
+    total, hits = state.search.search(query, buyer, statuses, start, end, offset, limit)
+    rows = [state.store.get_dossier(dossier_id) for dossier_id, _ in hits]
+    page = pd.DataFrame([row for row in rows if row is not None]).reset_index(drop=True)
+    if not page.empty:
+        page["Score"] = [score for (_, score), row in zip(hits, rows) if row is not None]
+    return total, page
+
+
+# --- STATS ---
+def stats(state):
+    store = state.store
+    return {
+        "total": store.count_dossiers(),
+        **{status.lower(): store.count_dossiers(status=status) for status in STATUSES},
+        "buyers": len(store.buyers()),
+        "workload": {name: int(count) for name, count in get_buyer_workload(state).items()},
+        "weighted_workload": {name: round(load, 3) for name, load in state.workload.weighted_workload().items()},
+    }
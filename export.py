@@ -0,0 +1,83 @@
+"""Export of the dossier table (Excel, CSV, Parquet).
+
+Exports are built on request only. The Excel workbook is written with
+openpyxl's write-only mode, chunk by chunk, so memory stays flat whatever the
+history size; CSV is written in chunks as well. openpyxl is only imported by
+the first Excel export.
+"""
+import io
+from datetime import timedelta
+
+import pandas as pd
+
+from profiling import profiled
+
+EXPORT_FORMATS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/octet-stream"),
+}
+EXCEL_MAX_ROWS = 1_048_575
+CHUNK_ROWS = 50_000
+
+
+# --- SELECTION ---
+def filter_dossiers(df, start=None, end=None, buyers=None, statuses=None):
+    """Dossiers assigned between ``start`` and ``end`` (dates, inclusive)."""
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df["Assigned_Date"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["Assigned_Date"] < pd.Timestamp(end + timedelta(days=1))
+    if buyers:
+        mask &= df["Buyer"].isin(buyers)
+    if statuses:
+        mask &= df["Status"].isin(statuses)
+    return df if mask.all() else df[mask]
+
+
+# --- WRITERS ---
+def dossiers_to_excel(df):
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"Trop de lignes pour Excel ({len(df)}) : filtrez l'export ou choisissez CSV/Parquet")
+    # Imported on the first Excel export only: openpyxl weighs ~0.2 s on the app's cold start
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Dossiers")
+    sheet.append(list(df.columns))
+    for begin in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[begin:begin + CHUNK_ROWS]
+        # NaN / NaT become empty cells
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def dossiers_to_csv(df):
+    buffer = io.BytesIO()
+    # utf-8-sig so that Excel opens accents correctly
+    df.to_csv(buffer, index=False, encoding="utf-8-sig", date_format="%Y-%m-%d %H:%M", chunksize=CHUNK_ROWS)
+    return buffer.getvalue()
+
+
+def dossiers_to_parquet(df):
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+    except ImportError:
+        raise ValueError("L'export Parquet nécessite pyarrow (pip install pyarrow)") from None
+    return buffer.getvalue()
+
+
+WRITERS = {"Excel": dossiers_to_excel, "CSV": dossiers_to_csv, "Parquet": dossiers_to_parquet}
+
+
+@profiled("export")
+def export_dossiers(df, fmt):
+    """``(data, file_extension, mime)`` of ``df`` in format ``fmt``."""
+    extension, mime = EXPORT_FORMATS[fmt]
+    return WRITERS[fmt](df), extension, mime
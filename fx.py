@@ -0,0 +1,139 @@
+"""Conversion of the adjustment amounts to MAD with dated exchange rates.
+
+Rates are read from ``achat_fx.csv`` in the data directory (columns ``Date``,
+``Devise``, ``Taux``: MAD for one unit of the currency, valid from that date
+on). Without that file, ``DEFAULT_RATES`` are used; a file that exists but
+cannot be used is an error, not a silent fallback to the defaults. Each
+amount takes the latest rate of its currency on or before its
+``Date_Ajustement`` (the assignment date when it has none), or the earliest
+rate for older dates: one ``merge_asof`` over the whole column, no per-row
+Python. Currency codes are compared trimmed and upper-cased on both sides. Amounts in a currency without
+any rate ("Autre") are left unconverted (NaN): the totals count them per
+group and list them, rather than leave them out.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+FX_FILE = "achat_fx.csv"
+BASE_CURRENCY = "MAD"
+# MAD per unit, used when the data directory has no rate table
+DEFAULT_RATES = [
+    ("2023-01-01", "EUR", 11.0),
+    ("2023-01-01", "USD", 10.3),
+    ("2023-01-01", "GBP", 12.5),
+    ("2024-01-01", "EUR", 10.9),
+    ("2024-01-01", "USD", 9.9),
+    ("2024-01-01", "GBP", 12.6),
+    ("2025-01-01", "EUR", 10.5),
+    ("2025-01-01", "USD", 10.1),
+    ("2025-01-01", "GBP", 12.6),
+]
+
+
+def rates_path(data_dir):
+    return os.path.join(data_dir, FX_FILE)
+
+
+def rates_signature(data_dir):
+    """Changes when the rate table file does (cache key)."""
+    try:
+        stat = os.stat(rates_path(data_dir))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def normalize_currency(values):
+    """Currency codes as matched between dossiers and rates: trimmed, upper case."""
+    return values.astype(str).str.strip().str.upper()
+
+
+def load_rates(data_dir):
+    """Rate table sorted by date, with one ``MAD`` row at 1.
+
+    Raises ``ValueError`` when ``achat_fx.csv`` exists but cannot be used
+    (unreadable, empty, missing columns or invalid rows), rather than
+    converting with the default rates.
+    """
+    path = rates_path(data_dir)
+    if os.path.exists(path):
+        try:
+            rates = pd.read_csv(path, dtype={"Devise": str})
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{FX_FILE} illisible : {e}") from None
+    else:
+        rates = pd.DataFrame(DEFAULT_RATES, columns=["Date", "Devise", "Taux"])
+    missing = {"Date", "Devise", "Taux"} - set(rates.columns)
+    if missing:
+        raise ValueError(f"{FX_FILE} : colonnes manquantes : {', '.join(sorted(missing))}")
+    if rates.empty:
+        raise ValueError(f"{FX_FILE} ne contient aucun taux")
+    rates = rates.assign(
+        Date=pd.to_datetime(rates["Date"], format="ISO8601", errors="coerce"),
+        Devise=normalize_currency(rates["Devise"].fillna("")),
+        Taux=pd.to_numeric(rates["Taux"], errors="coerce"),
+    )
+    invalid = rates["Date"].isna() | (rates["Devise"] == "") | ~(rates["Taux"] > 0)
+    if invalid.any():
+        # Line numbers of the file (header on line 1)
+        lines = ", ".join(str(i + 2) for i in np.flatnonzero(invalid.to_numpy())[:10])
+        raise ValueError(f"{FX_FILE} : date, devise ou taux invalide ligne(s) {lines}")
+    base = pd.DataFrame({"Date": [pd.Timestamp("1900-01-01")], "Devise": [BASE_CURRENCY], "Taux": [1.0]})
+    rates = pd.concat([rates[rates["Devise"] != BASE_CURRENCY], base], ignore_index=True)
+    rates["Date"] = rates["Date"].astype("datetime64[us]")
+    return rates.sort_values("Date", kind="stable").reset_index(drop=True)
+
+
+def to_mad(dossiers, rates):
+    """``Montant_Ajustement`` of each dossier in MAD (NaN when no rate applies)."""
+    amounts = dossiers["Montant_Ajustement"].to_numpy(dtype=float)
+    result = np.zeros(len(dossiers))
+    nonzero = np.flatnonzero(amounts != 0)
+    if not len(nonzero):
+        return pd.Series(result, index=dossiers.index, name="Montant_MAD")
+    subset = dossiers.iloc[nonzero]
+    left = pd.DataFrame({
+        "Date": subset["Date_Ajustement"].fillna(subset["Assigned_Date"]).fillna(rates["Date"].iloc[-1])
+                .astype("datetime64[us]").to_numpy(),
+        "Devise": normalize_currency(subset["Devise"]).to_numpy(),
+        "pos": nonzero,
+    }).sort_values("Date", kind="stable")
+    matched = pd.merge_asof(left, rates, on="Date", by="Devise", direction="backward")
+    # Dates before a currency's first rate take that first rate
+    earliest = rates.drop_duplicates("Devise").set_index("Devise")["Taux"]
+    taux = matched["Taux"].fillna(matched["Devise"].map(earliest)).to_numpy()
+    result[matched["pos"].to_numpy()] = amounts[matched["pos"].to_numpy()] * taux
+    return pd.Series(result, index=dossiers.index, name="Montant_MAD")
+
+
+def totals(dossiers, mad):
+    """Totals in MAD per buyer, per category and per month, and the unconverted amounts.
+
+    Each total is a frame with the converted sum (``Montant_MAD``) and the
+    number of dossiers of the group whose amount has no rate (``Sans_taux``).
+    Months come from ``Date_Ajustement`` (assignment date when missing).
+    ``unconverted`` sums the amounts without a rate per currency and
+    ``unconverted_dossiers`` lists those dossiers.
+    """
+    missing = mad.isna()
+    kept = missing | (mad != 0)
+    frame = dossiers.loc[kept, ["Buyer", "Category"]].assign(
+        Montant_MAD=mad[kept].fillna(0.0), Sans_taux=missing[kept].astype(int)
+    )
+    when = dossiers.loc[kept, "Date_Ajustement"].fillna(dossiers.loc[kept, "Assigned_Date"])
+    # Grouped on month-truncated datetimes; only the group labels are formatted
+    frame["Mois"] = when.to_numpy().astype("datetime64[M]")
+    columns = ["Montant_MAD", "Sans_taux"]
+    by_month = frame.groupby("Mois")[columns].sum().sort_index()
+    by_month.index = pd.DatetimeIndex(by_month.index).strftime("%Y-%m")
+    unconverted = dossiers.loc[missing]
+    return {
+        "buyer": frame.groupby("Buyer", observed=True)[columns].sum().sort_values("Montant_MAD"),
+        "category": frame.groupby("Category", observed=True)[columns].sum().sort_values("Montant_MAD"),
+        "month": by_month,
+        "unconverted": unconverted.groupby("Devise", observed=True)["Montant_Ajustement"].agg(["count", "sum"]),
+        "unconverted_dossiers": unconverted[["ID", "Buyer", "Category", "Devise", "Montant_Ajustement"]]
+                                .reset_index(drop=True),
+    }
@@ -0,0 +1,259 @@
+"""Event history of the dossiers, with workload snapshots for time travel.
+
+Every mutation made through the engine is also recorded as an event in
+``achat_events.db`` (SQLite, shared by all processes): ``created``,
+``assigned``, ``unassigned`` (the previous buyer of a reassigned dossier),
+``status_changed`` (from/to) and ``comment``, each with its time and actor (``ACHAT_ACTOR`` or the system user by default, the name
+entered in the app). Each event also carries the dossier's buyer and its
+effect on that buyer's open dossiers (``Delta``), so the workload is replayed
+with one ``SUM ... GROUP BY`` over the events, without decoding them.
+
+Every ``SNAPSHOT_EVERY`` events, the open workload per buyer is saved as a
+snapshot. The current workload is the latest snapshot plus the events after
+it; ``workload_as_of(when)`` starts from the latest snapshot taken before
+``when`` and replays the events up to ``when``, so neither reads the whole
+log. When the log starts on existing data, a first snapshot of the
+current workload is taken: the history goes back to that moment only.
+"""
+import getpass
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time
+
+import pandas as pd
+
+EVENTS_FILE = "achat_events.db"
+SNAPSHOT_EVERY = 1000
+EVENT_LABELS = {
+    "created": "Création",
+    "assigned": "Attribution",
+    "unassigned": "Retrait",
+    "status_changed": "Changement de statut",
+    "comment": "Commentaire",
+}
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    Ts TEXT NOT NULL,
+    Actor TEXT NOT NULL,
+    Type TEXT NOT NULL,
+    Dossier TEXT NOT NULL,
+    Buyer TEXT,
+    Delta INTEGER NOT NULL DEFAULT 0,
+    Data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_dossier ON events (Dossier, Seq);
+CREATE TABLE IF NOT EXISTS snapshots (
+    Seq INTEGER PRIMARY KEY,
+    Ts TEXT NOT NULL,
+    Kind TEXT NOT NULL,
+    Workload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots (Ts);
+"""
+
+
+def default_actor():
+    try:
+        user = getpass.getuser()
+    except Exception:  # no user name in the environment
+        user = "inconnu"
+    return os.environ.get("ACHAT_ACTOR") or user
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+_encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+
+def open_delta(event_type, data):
+    """Change of the buyer's open dossiers made by an event."""
+    if event_type == "assigned":
+        return int(data.get("status", "Open") == "Open")
+    if event_type == "unassigned":
+        return -int(data.get("status", "Open") == "Open")
+    if event_type == "status_changed":
+        return int(data["to"] == "Open") - int(data["from"] == "Open")
+    return 0
+
+
+# --- EVENT LOG ---
+class EventLog:
+    def __init__(self, data_dir, store=None):
+        self.path = os.path.join(data_dir, EVENTS_FILE)
+        self._local = threading.local()
+        self._conn().executescript(EVENTS_SCHEMA)
+        if store is not None:
+            self._bootstrap(store)
+
+    def _conn(self):
+        # One connection per thread (sessions, intake worker)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bootstrap(self, store):
+        # Dossiers created before the log existed: their open workload is the starting point
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM snapshots LIMIT 1").fetchone() or \
+                    conn.execute("SELECT 1 FROM events LIMIT 1").fetchone():
+                return
+            if store.count_dossiers():
+                workload = {str(k): int(v) for k, v in store.open_workload().items()}
+                conn.execute("INSERT INTO snapshots (Seq, Ts, Kind, Workload) VALUES (0, ?, 'bootstrap', ?)",
+                             (_now(), _encode(workload)))
+
+    # --- Recording ---
+    def record(self, events, actor=None):
+        """Append ``(type, dossier_id, buyer, data)`` events in one transaction."""
+        if not events:
+            return
+        actor = actor or default_actor()
+        # A batch shares a few data dicts between its events: each is encoded once
+        encoded = {}
+
+        def encode(event_type, data):
+            key = (event_type, id(data))
+            if key not in encoded:
+                encoded[key] = (open_delta(event_type, data), _encode(data))
+            return encoded[key]
+
+        with self._transaction() as conn:
+            ts = _now()
+            conn.executemany(
+                "INSERT INTO events (Ts, Actor, Type, Dossier, Buyer, Delta, Data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(ts, actor, event_type, dossier_id, None if pd.isna(buyer) else str(buyer), *encode(event_type, data))
+                 for event_type, dossier_id, buyer, data in events]
+            )
+            last_seq = conn.execute("SELECT MAX(Seq) FROM events").fetchone()[0]
+            snapshot = self._latest_snapshot(conn)
+            if last_seq - (snapshot[0] if snapshot else 0) >= SNAPSHOT_EVERY:
+                workload = self._replay(conn, snapshot, last_seq)
+                conn.execute("INSERT INTO snapshots (Seq, Ts, Kind, Workload) VALUES (?, ?, 'periodic', ?)",
+                             (last_seq, ts, _encode(workload)))
+
+    def created(self, rows, actor=None):
+        """Events of newly created (and assigned) dossiers."""
+        events, shared = [], {}
+        for row in rows:
+            created = (row.get("Category"), row.get("Urgency"))
+            assigned = row.get("Status", "Open")
+            if created not in shared:
+                shared[created] = {"Category": created[0], "Urgency": created[1]}
+            if assigned not in shared:
+                shared[assigned] = {"status": assigned}
+            events.append(("created", row["ID"], row.get("Buyer"), shared[created]))
+            events.append(("assigned", row["ID"], row.get("Buyer"), shared[assigned]))
+        self.record(events, actor)
+
+    def status_changed(self, dossier, new_status, comment="", actor=None):
+        events = [("status_changed", dossier["ID"], dossier["Buyer"], {"from": dossier["Status"], "to": new_status})]
+        if comment.strip():
+            events.append(("comment", dossier["ID"], dossier["Buyer"], {"text": comment.strip()}))
+        self.record(events, actor)
+
+    def reassigned(self, dossier, buyer, comment="", actor=None):
+        # Two events: the replay sums each buyer's deltas separately
+        status = dossier["Status"]
+        events = [("unassigned", dossier["ID"], dossier["Buyer"], {"to": buyer, "status": status}),
+                  ("assigned", dossier["ID"], buyer, {"from": dossier["Buyer"], "status": status})]
+        if comment.strip():
+            events.append(("comment", dossier["ID"], buyer, {"text": comment.strip()}))
+        self.record(events, actor)
+
+    # --- Replay ---
+    @staticmethod
+    def _latest_snapshot(conn, before=None):
+        if before is None:
+            return conn.execute("SELECT Seq, Ts, Kind, Workload FROM snapshots ORDER BY Seq DESC LIMIT 1").fetchone()
+        return conn.execute(
+            "SELECT Seq, Ts, Kind, Workload FROM snapshots WHERE Ts <= ? ORDER BY Seq DESC LIMIT 1", (before,)
+        ).fetchone()
+
+    @staticmethod
+    def _replay(conn, snapshot, last_seq=None, until=None):
+        workload = json.loads(snapshot[3]) if snapshot else {}
+        sql = "SELECT Buyer, SUM(Delta) FROM events WHERE Seq > ? AND Delta != 0"
+        params = [snapshot[0] if snapshot else 0]
+        if last_seq is not None:
+            sql += " AND Seq <= ?"
+            params.append(last_seq)
+        if until is not None:
+            sql += " AND Ts <= ?"
+            params.append(until)
+        for buyer, delta in conn.execute(sql + " GROUP BY Buyer", params):
+            if buyer is not None:
+                workload[buyer] = workload.get(buyer, 0) + delta
+        return {buyer: n for buyer, n in workload.items() if n}
+
+    def current_workload(self):
+        """Open dossiers per buyer: latest snapshot plus the events after it."""
+        conn = self._conn()
+        return pd.Series(self._replay(conn, self._latest_snapshot(conn)), dtype="int64").sort_index()
+
+    def workload_as_of(self, when):
+        """Open dossiers per buyer at ``when``, or None before the history starts.
+
+        A ``date`` (without time) means the end of that day.
+        """
+        if isinstance(when, date) and not isinstance(when, datetime):
+            when = datetime.combine(when, time.max)
+        until = pd.Timestamp(when).strftime("%Y-%m-%d %H:%M:%S.%f")
+        conn = self._conn()
+        snapshot = self._latest_snapshot(conn, until)
+        if snapshot is None and conn.execute("SELECT 1 FROM snapshots WHERE Kind = 'bootstrap'").fetchone():
+            return None
+        return pd.Series(self._replay(conn, snapshot, until=until), dtype="int64").sort_index()
+
+    def starts_at(self):
+        """Time of the first snapshot or event (None for an empty log)."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT MIN(Ts) FROM (SELECT MIN(Ts) AS Ts FROM snapshots UNION ALL SELECT MIN(Ts) FROM events)"
+        ).fetchone()
+        return pd.Timestamp(row[0]) if row[0] else None
+
+    # --- Queries ---
+    def dossier_history(self, dossier_id):
+        """Events of one dossier, oldest first."""
+        rows = self._conn().execute(
+            "SELECT Ts, Actor, Type, Buyer, Data FROM events WHERE Dossier = ? ORDER BY Seq", (dossier_id,)
+        ).fetchall()
+        events = pd.DataFrame(rows, columns=["Ts", "Actor", "Type", "Buyer", "Data"])
+        events["Ts"] = pd.to_datetime(events["Ts"], format="ISO8601")
+        events["Data"] = events["Data"].map(json.loads)
+        return events
+
+
+def describe(event_type, buyer, data):
+    """French one-line description of an event."""
+    if event_type == "created":
+        return f"{data.get('Category') or ''} · urgence {data.get('Urgency') or ''}".strip(" ·")
+    if event_type == "assigned":
+        return f"{data['from']} → {buyer}" if data.get("from") else f"→ {buyer}"
+    if event_type == "unassigned":
+        return f"{buyer} → {data['to']}"
+    if event_type == "status_changed":
+        return f"{data['from']} → {data['to']}"
+    return data.get("text", "")
@@ -0,0 +1,100 @@
+"""Dossier ID allocation: ``PR-<YYYYMMDD>-<NNN>`` with one sequence per day.
+
+Sequence numbers are reserved through the storage backend (file lock for the
+CSV store, an immediate transaction for SQLite), so concurrent sessions and
+processes never receive the same ID. The first allocation of a day seeds the
+counter from the IDs already using that day's prefix, and every allocation
+skips the numbers that an ID entered by hand has taken since, so such an ID
+is never handed out again.
+
+``IdIndex`` is the in-memory lookup of the CSV store: a hash map from ID to
+row position and a sorted list of IDs for prefix search.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime
+
+ID_PREFIX = "PR"
+
+
+def format_dossier_id(day, num):
+    return f"{ID_PREFIX}-{day}-{num:03d}"
+
+
+class DossierIdAllocator:
+    def __init__(self, store):
+        self.store = store
+
+    def _last_used(self, day):
+        last = 0
+        for dossier_id in self.store.ids_with_prefix(f"{ID_PREFIX}-{day}-"):
+            suffix = dossier_id.rsplit("-", 1)[-1]
+            if suffix.isdigit():
+                last = max(last, int(suffix))
+        return last
+
+    def allocate(self, n=1, day=None, taken=()):
+        """Reserve ``n`` unused IDs for ``day`` (``YYYYMMDD``, default today), in increasing order.
+
+        ``taken`` holds IDs not written yet that must not be handed out either
+        (manual IDs of the same batch, requests still queued).
+        """
+        if n < 1:
+            return []
+        day = day or datetime.now().strftime("%Y%m%d")
+        ids = []
+        while len(ids) < n:
+            missing = n - len(ids)
+            first = self.store.reserve_sequence(day, missing, lambda: self._last_used(day))
+            reserved = [format_dossier_id(day, num) for num in range(first, first + missing)]
+            # Numbers entered by hand after the counter was seeded: reserve more instead
+            used = set(reserved).intersection(self.store.ids_with_prefix(f"{ID_PREFIX}-{day}-"))
+            ids.extend(dossier_id for dossier_id in reserved if dossier_id not in used and dossier_id not in taken)
+        return ids
+
+    def next_id(self, day=None):
+        return self.allocate(1, day)[0]
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class IdIndex:
+    def __init__(self, ids=()):
+        ids = list(ids)
+        # First occurrence wins, like a boolean-mask lookup
+        self._positions = dict(zip(reversed(ids), range(len(ids) - 1, -1, -1)))
+        self._sorted = sorted(i for i in self._positions if isinstance(i, str))
+        self._size = len(ids)
+
+    def position(self, dossier_id):
+        return self._positions.get(dossier_id)
+
+    def add(self, ids):
+        """Register IDs appended at the end of the table, in order."""
+        for dossier_id in ids:
+            if isinstance(dossier_id, str) and dossier_id not in self._positions:
+                self._positions[dossier_id] = self._size
+                # New IDs are mostly the largest ones: insertion at the end
+                if not self._sorted or dossier_id > self._sorted[-1]:
+                    self._sorted.append(dossier_id)
+                else:
+                    insort(self._sorted, dossier_id)
+            self._size += 1
+
+    def _range(self, prefix):
+        if not prefix:
+            return 0, len(self._sorted)
+        return bisect_left(self._sorted, prefix), bisect_left(self._sorted, prefix_upper_bound(prefix))
+
+    def count_prefix(self, prefix):
+        low, high = self._range(prefix)
+        return high - low
+
+    def with_prefix(self, prefix, offset=0, limit=None):
+        """IDs starting with ``prefix``, largest (most recent) first."""
+        low, high = self._range(prefix)
+        high -= offset
+        start = low if limit is None else max(low, high - limit)
+        return self._sorted[start:high][::-1] if high > start else []
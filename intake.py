@@ -0,0 +1,389 @@
+"""Local HTTP/JSON intake of purchase requests, for the ERP.
+
+    python achat_cli.py serve --port 8502
+
+``POST /dossiers`` takes one request (JSON object) or several (JSON array),
+with the columns of a batch file (``Description`` required, ``Category``,
+``Urgency``, ``ID``, ``Type_AO``, ``Devise``, ``Montant_Ajustement``,
+``Date_Ajustement``). The submission is validated like a batch import, given
+its dossier IDs, appended to the durable queue ``achat_intake.jsonl`` and
+acknowledged (202) with the IDs; the buyers are assigned later. When the queue
+already holds ``max_queue`` requests the server answers 503 with a
+``Retry-After`` header instead (back-pressure). ``GET /status`` reports the
+queue depth and the throughput in dossiers per second.
+
+A worker task drains the queue in micro-batches: it waits ``BATCH_WAIT``
+seconds after the first queued request for more to arrive, then assigns and
+persists up to ``BATCH_SIZE`` requests with one ``import_batch()`` call (one
+store write). The offset of the last persisted request is kept in
+``achat_intake.offset``; after a crash, the requests past it are imported
+again, minus those already stored (same ID, description, category and
+urgency), so none is lost or duplicated. A request whose ID was taken by
+another dossier in the meantime is refused, not skipped.
+Storage errors (lock, disk) and an empty buyer list are retried every
+``RETRY_DELAY`` seconds. Any other failure comes from the requests
+themselves: the batch is imported again one request at a time and the
+requests that still fail are moved, with their error, to
+``achat_intake.dead.jsonl`` so that the queue moves on.
+
+The server is plain ``asyncio`` (no web framework); run one per data
+directory.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, deque
+from datetime import datetime
+from http import HTTPStatus
+
+import pandas as pd
+
+from batch import import_batch, validate_requests
+
+QUEUE_FILE = "achat_intake.jsonl"
+OFFSET_FILE = "achat_intake.offset"
+DEAD_FILE = "achat_intake.dead.jsonl"
+DEFAULT_PORT = 8502
+MAX_QUEUE = 10000
+BATCH_SIZE = 500
+# Seconds the worker waits for a micro-batch to fill up
+BATCH_WAIT = 0.05
+MAX_BODY = 10 * 2**20
+# Window of the reported throughput, in seconds
+THROUGHPUT_WINDOW = 60.0
+# Delay before retrying a batch that could not be imported
+RETRY_DELAY = 5.0
+# Actor of the dossiers created through the service, in the event history
+INTAKE_ACTOR = "erp"
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class NoBuyers(Exception):
+    """Nothing to assign the requests to yet; retried like a storage error."""
+
+
+# Errors that a later attempt can get past; any other one sends the request to DEAD_FILE
+RETRIED_ERRORS = (OSError, sqlite3.OperationalError, NoBuyers)
+
+
+class IntakeQueue:
+    """Append-only file of validated requests and the offset already imported."""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, QUEUE_FILE)
+        self.offset_path = os.path.join(data_dir, OFFSET_FILE)
+        self.dead_path = os.path.join(data_dir, DEAD_FILE)
+        try:
+            with open(self.offset_path, encoding="utf-8") as handle:
+                self.offset = int(handle.read().strip() or 0)
+        except (OSError, ValueError):
+            self.offset = 0
+        rows, _ = self.read(None)
+        self.pending = len(rows)
+        self.queued_ids = {row["ID"] for row in rows}
+        try:
+            with open(self.dead_path, "rb") as handle:
+                self.dead = sum(1 for _ in handle)
+        except OSError:
+            self.dead = 0
+
+    def append(self, rows):
+        data = b"".join((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8") for row in rows)
+        with open(self.path, "ab") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        self.pending += len(rows)
+        self.queued_ids.update(row["ID"] for row in rows)
+
+    def read(self, limit):
+        """Up to ``limit`` requests past the offset, and the offset after them."""
+        rows, end = [], self.offset
+        try:
+            with open(self.path, "rb") as handle:
+                handle.seek(self.offset)
+                for line in handle:
+                    if not line.endswith(b"\n") or (limit is not None and len(rows) >= limit):
+                        break
+                    end += len(line)
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn write from a crash, never acknowledged
+        except OSError:
+            pass
+        return rows, end
+
+    def reject(self, rejected):
+        """Set aside ``(request, error)`` pairs that cannot be imported."""
+        ts = datetime.now().isoformat(timespec="seconds")
+        data = b"".join(
+            (json.dumps({"ts": ts, "error": error, "row": row}, ensure_ascii=False) + "\n").encode("utf-8")
+            for row, error in rejected
+        )
+        with open(self.dead_path, "ab") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        self.dead += len(rejected)
+
+    def commit(self, rows, end):
+        """Mark the requests up to ``end`` as imported."""
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(str(end))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.offset_path)
+        self.offset = end
+        self.pending -= len(rows)
+        self.queued_ids.difference_update(row["ID"] for row in rows)
+        if not self.pending:
+            # Drained: start the file over rather than let it grow
+            open(self.path, "wb").close()
+            with open(self.offset_path, "w", encoding="utf-8") as handle:
+                handle.write("0")
+            self.offset = 0
+
+
+def _same_request(stored, row):
+    """Whether the stored dossier was created from the queued request ``row``."""
+    return all(str(stored[col]) == str(row[col]) for col in ("Description", "Category", "Urgency"))
+
+
+class IntakeService:
+    def __init__(self, state, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT):
+        self.state = state
+        self.queue = IntakeQueue(state.store.data_dir)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.processed = 0
+        self.skipped = 0
+        self.batches = 0
+        self.last_batch = None
+        self.last_error = None
+        self._history = deque()  # (end time, dossiers) of the recent batches
+        self._started = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        if self.queue.pending:
+            self._ready.set()
+
+    # --- Submissions ---
+    def _validate(self, payload):
+        items = payload if isinstance(payload, list) else [payload]
+        if not items or not all(isinstance(item, dict) for item in items):
+            raise ValueError("Corps attendu : un objet JSON ou une liste d'objets")
+        rows = validate_requests(items)
+        given = [row["ID"] for row in rows if row.get("ID")]
+        store = self.state.store
+        counts = Counter(given)
+        taken = sorted(
+            {i for i, n in counts.items() if n > 1}
+            | {i for i in counts if i in self.queue.queued_ids or store.get_dossier(i) is not None}
+        )
+        if taken:
+            raise ValueError(f"IDs déjà utilisés : {', '.join(taken[:20])}")
+        missing = [row for row in rows if not row.get("ID")]
+        allocated = self.state.ids.allocate(len(missing), taken=self.queue.queued_ids | set(given))
+        for row, dossier_id in zip(missing, allocated):
+            row["ID"] = dossier_id
+        return rows
+
+    async def submit(self, payload):
+        """Queue a submission; returns its dossier IDs."""
+        async with self._lock:
+            n = len(payload) if isinstance(payload, list) else 1
+            if self.queue.pending + n > self.max_queue:
+                raise QueueFull()
+            rows = await asyncio.to_thread(self._validate, payload)
+            await asyncio.to_thread(self.queue.append, rows)
+        self._ready.set()
+        return [row["ID"] for row in rows]
+
+    # --- Worker ---
+    def _import(self, rows):
+        # Requests already persisted before a crash are not imported again
+        self.state.sync()
+        store = self.state.store
+        fresh, taken = [], []
+        for row in rows:
+            stored = store.get_dossier(row["ID"])
+            if stored is None:
+                fresh.append(row)
+            elif not _same_request(stored, row):
+                taken.append(row["ID"])
+        if taken:
+            raise ValueError(f"IDs pris par un autre dossier : {', '.join(taken[:20])}")
+        if fresh:
+            if not self.state.workload.keys():
+                raise NoBuyers("Aucun acheteur configuré")
+            import_batch(self.state, pd.DataFrame(fresh), actor=INTAKE_ACTOR)
+        return len(fresh)
+
+    def _process(self, rows):
+        """Import ``rows``; returns the number imported and the ``(request, error)`` pairs refused.
+
+        Raises the ``RETRIED_ERRORS``. After any other error the requests are
+        imported one at a time, so that only the faulty ones are refused.
+        """
+        try:
+            return self._import(rows), []
+        except RETRIED_ERRORS:
+            raise
+        except Exception as e:
+            logger.warning("Lot refusé (%s: %s), import des demandes une à une", type(e).__name__, e)
+        imported, rejected = 0, []
+        for row in rows:
+            try:
+                imported += self._import([row])
+            except RETRIED_ERRORS:
+                raise
+            except Exception as e:
+                rejected.append((row, f"{type(e).__name__}: {e}"))
+                logger.error("Demande %s écartée dans %s : %s", row["ID"], DEAD_FILE, rejected[-1][1])
+        return imported, rejected
+
+    async def worker(self):
+        while True:
+            await self._ready.wait()
+            # Let a micro-batch build up behind the first request
+            await asyncio.sleep(self.batch_wait)
+            async with self._lock:
+                rows, end = self.queue.read(self.batch_size)
+                if not rows:
+                    self._ready.clear()
+                    continue
+            start = time.perf_counter()
+            try:
+                imported, rejected = await asyncio.to_thread(self._process, rows)
+            except RETRIED_ERRORS as e:  # keep the requests queued and retry
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Import du lot impossible (%s), nouvel essai dans %g s", self.last_error, RETRY_DELAY)
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            seconds = time.perf_counter() - start
+            async with self._lock:
+                if rejected:
+                    # Written before the offset moves past them: never lost
+                    await asyncio.to_thread(self.queue.reject, rejected)
+                await asyncio.to_thread(self.queue.commit, rows, end)
+                if not self.queue.pending:
+                    self._ready.clear()
+            self._record(imported, len(rows) - imported - len(rejected), seconds)
+
+    def _record(self, imported, skipped, seconds):
+        now = time.monotonic()
+        self.processed += imported
+        self.skipped += skipped
+        self.batches += 1
+        self.last_error = None
+        self.last_batch = {"count": imported, "seconds": round(seconds, 4),
+                           "dossiers_per_second": round(imported / seconds, 1) if seconds else None}
+        self._history.append((now, imported))
+        while self._history and self._history[0][0] < now - THROUGHPUT_WINDOW:
+            self._history.popleft()
+        logger.info("Lot de %d dossier(s) assigné(s) en %.3f s (%s dossiers/s)",
+                    imported, seconds, self.last_batch["dossiers_per_second"])
+
+    def status(self):
+        now = time.monotonic()
+        recent = sum(n for t, n in self._history if t >= now - THROUGHPUT_WINDOW)
+        window = min(THROUGHPUT_WINDOW, now - self._started) or 1.0
+        return {
+            "queued": self.queue.pending,
+            "max_queue": self.max_queue,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "rejected": self.queue.dead,
+            "batches": self.batches,
+            "dossiers_per_second": round(recent / window, 2),
+            "last_batch": self.last_batch,
+            "last_error": self.last_error,
+        }
+
+    # --- HTTP ---
+    async def _respond(self, writer, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(data)}", *headers]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _handle(self, method, path, body):
+        if path == "/status" and method == "GET":
+            return HTTPStatus.OK, self.status(), ()
+        if path != "/dossiers":
+            return HTTPStatus.NOT_FOUND, {"error": f"Chemin inconnu : {path}"}, ()
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Utilisez POST"}, ("Allow: POST",)
+        try:
+            payload = json.loads(body)
+            ids = await self.submit(payload)
+        except QueueFull:
+            return (HTTPStatus.SERVICE_UNAVAILABLE,
+                    {"error": "File d'attente pleine", "queued": self.queue.pending}, ("Retry-After: 1",))
+        except ValueError as e:  # invalid JSON or request
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}, ()
+        return HTTPStatus.ACCEPTED, {"accepted": len(ids), "ids": ids, "queued": self.queue.pending}, ()
+
+    async def connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive: one request after the other on the connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Requête invalide"})
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    # The body cannot be delimited: answer and drop the connection
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Content-Length invalide"})
+                    break
+                length = int(length)
+                if length > MAX_BODY:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Corps trop volumineux"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, response, extra = await self._handle(method, target.split("?", 1)[0], body)
+                await self._respond(writer, status, response, extra)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.connection, host, port)
+        worker = asyncio.create_task(self.worker())
+        logger.info("Réception des demandes sur http://%s:%d/dossiers", host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+
+
+def serve(state, host="127.0.0.1", port=DEFAULT_PORT, **options):
+    asyncio.run(IntakeService(state, **options).serve(host, port))
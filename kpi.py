@@ -0,0 +1,301 @@
+"""Materialized KPI rollups, updated on each create, status change and reassignment.
+
+``KpiRollups`` keeps small aggregates instead of the dossiers themselves:
+
+* dossiers created and closed per day and per week (Monday), per buyer;
+* the lead time distribution (``Closed_Date - Assigned_Date``) as a
+  histogram in days, with its sum for the mean;
+* the open backlog per urgency and assignment day, from which the backlog
+  age is read at display time;
+* dossier counts per category and status.
+
+The KPI page reads these aggregates, so its cost depends on the number of
+days and buyers shown, not on the history length. The rollups are saved in
+``achat_kpi.json`` next to the data, with the store generation they reflect
+(CSV: snapshot files and journal offset; SQLite: last change record). On
+start they are rebuilt from the full table unless the saved generation is
+the store's (file missing, written by an older version, or another process
+wrote or compacted since). Archived dossiers stay counted in the rollups, so
+a rebuild is the only time the KPI page reads the whole archive.
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from schema import CATEGORICAL_COLUMNS
+
+KPI_FILE = "achat_kpi.json"
+# Lower bounds (days) of the lead time histogram bins; the last bin is open
+LEAD_TIME_BINS = [0, 1, 2, 3, 5, 7, 14, 30, 60, 90]
+BACKLOG_AGE_BINS = [0, 8, 31, 91]
+BACKLOG_AGE_LABELS = ["0-7 j", "8-30 j", "31-90 j", "> 90 j"]
+# Minimum delay between two saves; the file is also written at exit
+SAVE_INTERVAL = 10.0
+NO_CATEGORY = "—"
+STATUSES = CATEGORICAL_COLUMNS["Status"]
+URGENCIES = CATEGORICAL_COLUMNS["Urgency"]
+
+
+def _ts(value):
+    if value is None or value == "":
+        return None
+    ts = pd.Timestamp(value)
+    return None if pd.isna(ts) else ts
+
+
+def _day(ts):
+    return ts.strftime("%Y-%m-%d")
+
+
+def _week(ts):
+    return _day(ts - pd.Timedelta(days=ts.weekday()))
+
+
+def _bump(table, outer, inner, n=1):
+    row = table.setdefault(outer, {})
+    row[inner] = row.get(inner, 0) + n
+    if row[inner] == 0:
+        del row[inner]
+        if not row:
+            del table[outer]
+
+
+def _nested_counts(keys_outer, keys_inner):
+    """``{outer: {inner: count}}`` from two aligned Series, vectorized."""
+    counts = pd.Series(1, index=pd.MultiIndex.from_arrays([keys_outer, keys_inner])).groupby(level=[0, 1]).sum()
+    table = {}
+    for (outer, inner), n in counts.items():
+        table.setdefault(str(outer), {})[str(inner)] = int(n)
+    return table
+
+
+def _lead_days(assigned, closed):
+    return (closed - assigned) / pd.Timedelta(days=1)
+
+
+def _lead_bin(days):
+    return max(int(np.searchsorted(LEAD_TIME_BINS, days, side="right")) - 1, 0)
+
+
+class KpiRollups:
+    def __init__(self, path=None):
+        self.path = path
+        self.created_day = {}    # day -> {buyer -> n}
+        self.created_week = {}   # Monday -> {buyer -> n}
+        self.closed_day = {}
+        self.closed_week = {}
+        self.lead_counts = [0] * len(LEAD_TIME_BINS)
+        self.lead_sum = 0.0
+        self.backlog = {}        # urgency -> {assigned day -> open dossiers}
+        self.categories = {}     # category -> {status -> n}
+        # Store generation the rollups include (updated by the state on each sync)
+        self.generation = None
+        self._dirty = False
+        self._saved_at = 0.0
+
+    # --- Building ---
+    @classmethod
+    def build(cls, dossiers, path=None):
+        """Rollups computed from the full dossier table."""
+        rollups = cls(path)
+        assigned = dossiers["Assigned_Date"]
+        dated = dossiers[assigned.notna()]
+        days = dated["Assigned_Date"].dt.strftime("%Y-%m-%d")
+        weeks = (dated["Assigned_Date"] - pd.to_timedelta(dated["Assigned_Date"].dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+        buyers = dated["Buyer"].astype(object)
+        rollups.created_day = _nested_counts(days, buyers)
+        rollups.created_week = _nested_counts(weeks, buyers)
+
+        closed = dossiers[(dossiers["Status"] == "Closed") & dossiers["Closed_Date"].notna()]
+        closed_buyers = closed["Buyer"].astype(object)
+        rollups.closed_day = _nested_counts(closed["Closed_Date"].dt.strftime("%Y-%m-%d"), closed_buyers)
+        closed_mondays = closed["Closed_Date"] - pd.to_timedelta(closed["Closed_Date"].dt.weekday, unit="D")
+        rollups.closed_week = _nested_counts(closed_mondays.dt.strftime("%Y-%m-%d"), closed_buyers)
+
+        lead = _lead_days(closed["Assigned_Date"], closed["Closed_Date"]).dropna()
+        bins = np.maximum(np.searchsorted(LEAD_TIME_BINS, lead.to_numpy(), side="right") - 1, 0)
+        rollups.lead_counts = np.bincount(bins, minlength=len(LEAD_TIME_BINS)).tolist()
+        rollups.lead_sum = float(lead.sum())
+
+        open_files = dated[dated["Status"] == "Open"]
+        rollups.backlog = _nested_counts(
+            open_files["Urgency"].astype(object), open_files["Assigned_Date"].dt.strftime("%Y-%m-%d")
+        )
+        rollups.categories = _nested_counts(
+            dossiers["Category"].astype(object).fillna(NO_CATEGORY), dossiers["Status"].astype(object)
+        )
+        rollups._dirty = True
+        return rollups
+
+    @classmethod
+    def open(cls, data_dir, store):
+        """Saved rollups if they match the store, otherwise rebuilt ones."""
+        path = os.path.join(data_dir, KPI_FILE)
+        try:
+            with open(path, encoding="utf-8") as handle:
+                saved = json.load(handle)
+            rollups = cls(path)
+            for name in ("created_day", "created_week", "closed_day", "closed_week",
+                         "lead_counts", "lead_sum", "backlog", "categories", "generation"):
+                setattr(rollups, name, saved[name])
+            if len(rollups.lead_counts) == len(LEAD_TIME_BINS) and rollups.matches(store):
+                rollups._saved_at = time.monotonic()
+                return rollups
+        except (OSError, ValueError, KeyError):
+            pass
+        generation = store.generation()
+        rollups = cls.build(store.all_dossiers(), path)
+        rollups.generation = generation
+        rollups.save()
+        return rollups
+
+    def matches(self, store):
+        """Whether the rollups include every change ``store`` reflects."""
+        return self.generation is not None and self.generation == store.generation()
+
+    # --- Updates ---
+    def set_generation(self, generation):
+        """The rollups include every change of the store up to ``generation``."""
+        if generation != self.generation:
+            self.generation = generation
+            self._dirty = True
+
+    def on_create(self, row):
+        ts = _ts(row.get("Assigned_Date"))
+        buyer = str(row.get("Buyer"))
+        if ts is not None:
+            _bump(self.created_day, _day(ts), buyer)
+            _bump(self.created_week, _week(ts), buyer)
+        status = row.get("Status", "Open")
+        category = row.get("Category") if pd.notna(row.get("Category")) else NO_CATEGORY
+        _bump(self.categories, str(category), status)
+        if status == "Open" and ts is not None:
+            _bump(self.backlog, str(row.get("Urgency")), _day(ts))
+        self._dirty = True
+
+    def on_create_many(self, rows):
+        for row in rows:
+            self.on_create(row)
+
+    def on_status_change(self, dossier, changes):
+        """``dossier`` is the row before the change, ``changes`` the new values."""
+        old, new = dossier["Status"], changes.get("Status", dossier["Status"])
+        if old == new:
+            return
+        buyer = str(dossier["Buyer"])
+        category = dossier["Category"] if pd.notna(dossier["Category"]) else NO_CATEGORY
+        _bump(self.categories, str(category), old, -1)
+        _bump(self.categories, str(category), new)
+
+        assigned = _ts(dossier["Assigned_Date"])
+        if assigned is not None and old == "Open":
+            _bump(self.backlog, str(dossier["Urgency"]), _day(assigned), -1)
+        if assigned is not None and new == "Open":
+            _bump(self.backlog, str(dossier["Urgency"]), _day(assigned))
+
+        if old == "Closed":
+            self._count_closed(buyer, assigned, _ts(dossier["Closed_Date"]), -1)
+        if new == "Closed":
+            self._count_closed(buyer, assigned, _ts(changes.get("Closed_Date", dossier["Closed_Date"])), 1)
+        self._dirty = True
+
+    def on_reassign(self, dossier, buyer):
+        """``dossier`` is the row before the change, ``buyer`` its new buyer."""
+        old, new = str(dossier["Buyer"]), str(buyer)
+        if old == new:
+            return
+        moved = []
+        assigned = _ts(dossier["Assigned_Date"])
+        if assigned is not None:
+            moved += [(self.created_day, _day(assigned)), (self.created_week, _week(assigned))]
+        closed = _ts(dossier["Closed_Date"])
+        if dossier["Status"] == "Closed" and closed is not None:
+            moved += [(self.closed_day, _day(closed)), (self.closed_week, _week(closed))]
+        for table, period in moved:
+            _bump(table, period, old, -1)
+            _bump(table, period, new)
+        self._dirty = True
+
+    def _count_closed(self, buyer, assigned, closed, n):
+        if closed is None:
+            return
+        _bump(self.closed_day, _day(closed), buyer, n)
+        _bump(self.closed_week, _week(closed), buyer, n)
+        if assigned is not None:
+            lead = _lead_days(assigned, closed)
+            self.lead_counts[_lead_bin(lead)] += n
+            self.lead_sum += n * lead
+
+    # --- Persistence ---
+    def save(self):
+        if self.path is None:
+            return
+        data = {name: getattr(self, name) for name in (
+            "created_day", "created_week", "closed_day", "closed_week",
+            "lead_counts", "lead_sum", "backlog", "categories", "generation"
+        )}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(data, handle, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def save_if_due(self):
+        if self._dirty and time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self.save()
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    # --- Views ---
+    def status_counts(self):
+        counts = {}
+        for statuses in self.categories.values():
+            for status, n in statuses.items():
+                counts[status] = counts.get(status, 0) + n
+        return counts
+
+    def series(self, kind, period="day", last=None):
+        """Buyer x period frame of ``kind`` ("created" or "closed") counts."""
+        table = getattr(self, f"{kind}_{period}")
+        keys = sorted(table)[-last:] if last else sorted(table)
+        if not keys:
+            return pd.DataFrame()
+        frame = pd.DataFrame({key: table[key] for key in keys}).T.fillna(0).astype(int)
+        frame.index = pd.to_datetime(frame.index)
+        return frame
+
+    def lead_time(self):
+        """Histogram (Series by bin label), mean and approximate median (days)."""
+        labels = [f"{low}-{high} j" for low, high in zip(LEAD_TIME_BINS, LEAD_TIME_BINS[1:])]
+        labels.append(f"> {LEAD_TIME_BINS[-1]} j")
+        counts = pd.Series(self.lead_counts, index=labels)
+        total = int(counts.sum())
+        if not total:
+            return counts, None, None
+        median_bin = int(np.searchsorted(np.cumsum(self.lead_counts), total / 2))
+        return counts, self.lead_sum / total, labels[median_bin]
+
+    def backlog_age(self, today=None):
+        """Open dossiers per urgency and age bucket."""
+        today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+        rows = {}
+        for urgency, days in self.backlog.items():
+            ages = (today - pd.to_datetime(list(days))).days.to_numpy()
+            buckets = np.maximum(np.searchsorted(BACKLOG_AGE_BINS, ages, side="right") - 1, 0)
+            rows[urgency] = np.bincount(buckets, weights=list(days.values()), minlength=len(BACKLOG_AGE_BINS))
+        frame = pd.DataFrame(rows, index=BACKLOG_AGE_LABELS).T.astype(int)
+        return frame.reindex(_ordered(frame.index, URGENCIES))
+
+    def category_breakdown(self):
+        frame = pd.DataFrame(self.categories).T.fillna(0).astype(int)
+        return frame[_ordered(frame.columns, STATUSES)]
+
+
+def _ordered(labels, known):
+    return [label for label in known if label in labels] + [label for label in labels if label not in known]
@@ -0,0 +1,296 @@
+"""Email notification of buyers, off the request path.
+
+Creating a dossier only inserts a row in a persistent outbox
+(``achat_outbox.db``, SQLite): the form submit never waits for the SMTP
+server. A background worker thread drains the outbox: it claims the due
+messages in batches, merges those of the same recipient into one digest
+email and sends the batch over a single SMTP connection. A failed delivery is
+retried with exponential backoff, up to ``MAX_ATTEMPTS`` times.
+
+Messages become due ``DIGEST_DELAY`` seconds after they are queued, so the
+dossiers assigned to a buyer in quick succession arrive as one email; a bulk
+import queues one message per buyer listing all of their new dossiers.
+
+A claimed message is leased for ``LEASE`` seconds: if the process dies before
+the delivery is recorded, another worker (or the next start) sends it again.
+Delivery is therefore at least once. Several server processes can share the
+outbox.
+
+Notifications are enabled by setting ``ACHAT_SMTP_HOST`` (and optionally
+``ACHAT_SMTP_PORT``, ``ACHAT_SMTP_USER``, ``ACHAT_SMTP_PASSWORD``,
+``ACHAT_SMTP_FROM``, ``ACHAT_SMTP_STARTTLS=1``).
+"""
+import json
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.message import EmailMessage
+
+from profiling import profiled
+
+OUTBOX_FILE = "achat_outbox.db"
+SMTP_HOST = os.environ.get("ACHAT_SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("ACHAT_SMTP_PORT", "25"))
+SMTP_USER = os.environ.get("ACHAT_SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("ACHAT_SMTP_PASSWORD", "")
+SMTP_FROM = os.environ.get("ACHAT_SMTP_FROM", "achat-assistant@localhost")
+SMTP_STARTTLS = os.environ.get("ACHAT_SMTP_STARTTLS", "") == "1"
+
+# Seconds a queued message waits for others to the same buyer
+DIGEST_DELAY = 5.0
+# Messages claimed (and sent over one connection) per batch
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+# Retry delays: BACKOFF_BASE * 2 ** (attempt - 1), at most BACKOFF_MAX
+BACKOFF_BASE = 30.0
+BACKOFF_MAX = 3600.0
+LEASE = 120.0
+# Longest sleep of the worker between two looks at the outbox
+POLL_INTERVAL = 30.0
+# Sent messages are kept this long for the status report
+KEEP_SENT = 7 * 86400
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Buyer TEXT NOT NULL,
+    Email TEXT NOT NULL,
+    Dossiers TEXT NOT NULL,
+    Created REAL NOT NULL,
+    Due REAL NOT NULL,
+    Attempts INTEGER NOT NULL DEFAULT 0,
+    Status TEXT NOT NULL DEFAULT 'pending',
+    Error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON outbox (Status, Due);
+"""
+
+# Dossier fields carried by a notification
+NOTIFIED_FIELDS = ["ID", "Description", "Category", "Urgency", "Assigned_Date"]
+
+
+def backoff(attempts):
+    """Delay before the next try of a message that failed ``attempts`` times."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+# --- MESSAGES ---
+def build_message(email, buyer, dossiers, sender=SMTP_FROM):
+    """One email listing every dossier of ``dossiers`` (a digest when several)."""
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = email
+    if len(dossiers) == 1:
+        message["Subject"] = f"Nouveau dossier d'achat : {dossiers[0]['ID']}"
+    else:
+        message["Subject"] = f"{len(dossiers)} nouveaux dossiers d'achat"
+    lines = [f"Bonjour {buyer},", "", "Les dossiers suivants vous ont été attribués :", ""]
+    for dossier in dossiers:
+        lines.append(
+            f"- {dossier['ID']} : {dossier['Description']} "
+            f"({dossier.get('Category') or 'Autre'}, urgence {dossier.get('Urgency') or 'Moyenne'})"
+        )
+    lines += ["", "Achat Assistant"]
+    message.set_content("\n".join(lines))
+    return message
+
+
+class SmtpSender:
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 sender=SMTP_FROM, starttls=SMTP_STARTTLS, timeout=10.0):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.sender, self.starttls, self.timeout = sender, starttls, timeout
+
+    def send_many(self, messages):
+        """Send ``(key, EmailMessage)`` pairs over one connection.
+
+        Returns ``{key: error}`` for the messages that were refused; a
+        connection failure raises.
+        """
+        errors = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            for key, message in messages:
+                try:
+                    smtp.send_message(message)
+                except smtplib.SMTPRecipientsRefused as e:
+                    errors[key] = str(e)
+                except smtplib.SMTPDataError as e:
+                    errors[key] = str(e)
+        return errors
+
+
+# --- OUTBOX ---
+class NotificationQueue:
+    def __init__(self, data_dir, sender=None):
+        self.path = os.path.join(data_dir, OUTBOX_FILE)
+        self.sender = sender or SmtpSender()
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._worker = None
+        self._stopping = False
+        self._conn().executescript(OUTBOX_SCHEMA)
+
+    def _conn(self):
+        # One connection per thread (the app's sessions and the worker)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # --- Queueing ---
+    @profiled("notify_enqueue")
+    def enqueue(self, buyers, dossiers):
+        """Queue one message per buyer for the newly assigned ``dossiers`` (dicts).
+
+        Buyers without an email address are skipped. Returns the number of
+        messages queued.
+        """
+        emails = dict(zip(buyers["Name"], buyers["Email"].fillna("").astype(str).str.strip()))
+        per_buyer = {}
+        for dossier in dossiers:
+            if emails.get(dossier["Buyer"]):
+                fields = {field: str(dossier.get(field) or "") for field in NOTIFIED_FIELDS}
+                per_buyer.setdefault(dossier["Buyer"], []).append(fields)
+        if not per_buyer:
+            return 0
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO outbox (Buyer, Email, Dossiers, Created, Due) VALUES (?, ?, ?, ?, ?)",
+                    [(buyer, emails[buyer], json.dumps(items, ensure_ascii=False), now, now + DIGEST_DELAY)
+                     for buyer, items in per_buyer.items()]
+                )
+        except sqlite3.Error:
+            # The dossiers are saved already: a notification is not worth failing the request
+            return 0
+        self._wake.set()
+        return len(per_buyer)
+
+    # --- Delivery ---
+    def _claim(self, now):
+        # Due messages are leased to this worker before the (slow) delivery
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT Id, Buyer, Email, Dossiers, Attempts FROM outbox"
+                " WHERE Status = 'pending' AND Due <= ? ORDER BY Due LIMIT ?",
+                (now, BATCH_SIZE)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET Due = ?, Attempts = Attempts + 1 WHERE Id = ?",
+                [(now + LEASE, row[0]) for row in rows]
+            )
+        return rows
+
+    def _record(self, rows, errors, now):
+        sent, retry, failed = [], [], []
+        for row_id, _, _, _, attempts in rows:
+            error = errors.get(row_id)
+            if error is None:
+                sent.append((now, row_id))
+            elif attempts + 1 >= MAX_ATTEMPTS:
+                failed.append((error, row_id))
+            else:
+                retry.append((now + backoff(attempts + 1), error, row_id))
+        with self._transaction() as conn:
+            conn.executemany("UPDATE outbox SET Status = 'sent', Due = ?, Error = NULL WHERE Id = ?", sent)
+            conn.executemany("UPDATE outbox SET Due = ?, Error = ? WHERE Id = ?", retry)
+            conn.executemany("UPDATE outbox SET Status = 'failed', Error = ? WHERE Id = ?", failed)
+            conn.execute("DELETE FROM outbox WHERE Status = 'sent' AND Due < ?", (now - KEEP_SENT,))
+
+    def drain(self):
+        """Send every due message, batch by batch; returns the number of emails sent."""
+        sent = 0
+        while True:
+            now = time.time()
+            rows = self._claim(now)
+            if not rows:
+                return sent
+            # Digest: the claimed messages of one recipient become one email
+            digests = {}
+            for row_id, buyer, email, dossiers, _ in rows:
+                digest = digests.setdefault(email, {"buyer": buyer, "ids": [], "dossiers": []})
+                digest["ids"].append(row_id)
+                digest["dossiers"].extend(json.loads(dossiers))
+            messages = [
+                (email, build_message(email, d["buyer"], d["dossiers"], self.sender.sender))
+                for email, d in digests.items()
+            ]
+            try:
+                refused = self.sender.send_many(messages)
+            except (OSError, smtplib.SMTPException) as e:
+                refused = {email: f"{type(e).__name__}: {e}" for email in digests}
+            errors = {row_id: refused[email] for email, d in digests.items() if email in refused for row_id in d["ids"]}
+            self._record(rows, errors, time.time())
+            sent += len(digests) - len(refused)
+            if refused and len(refused) == len(digests):
+                # The server is unreachable: leave the rest for the next round
+                return sent
+
+    def _next_due(self):
+        row = self._conn().execute("SELECT MIN(Due) FROM outbox WHERE Status = 'pending'").fetchone()
+        return row[0]
+
+    # --- Worker ---
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.drain()
+                next_due = self._next_due()
+            except sqlite3.Error:
+                next_due = None
+            wait = POLL_INTERVAL if next_due is None else min(max(next_due - time.time(), 0.05), POLL_INTERVAL)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def start_worker(self):
+        """Drain the outbox from a daemon thread (once per process)."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stopping = False
+        self._worker = threading.Thread(target=self._run, name="achat-notifications", daemon=True)
+        self._worker.start()
+
+    def stop_worker(self, timeout=5.0):
+        self._stopping = True
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    # --- Status ---
+    def counts(self):
+        """Messages per status (pending, sent, failed)."""
+        rows = self._conn().execute("SELECT Status, COUNT(*) FROM outbox GROUP BY Status").fetchall()
+        return {"pending": 0, "sent": 0, "failed": 0, **dict(rows)}
+
+    def failures(self, limit=20):
+        return self._conn().execute(
+            "SELECT Id, Buyer, Email, Attempts, Error FROM outbox WHERE Status = 'failed' ORDER BY Id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+
+def open_queue(data_dir):
+    """The outbox of ``data_dir``, or None when no SMTP server is configured."""
+    return NotificationQueue(data_dir) if SMTP_HOST else None
@@ -0,0 +1,54 @@
+"""Row positions of the dossier table grouped by buyer and status.
+
+The CSV store keeps a ``BuyerPartitions`` next to its frames so that the
+per-buyer pages count and page through a buyer's dossiers without scanning
+the whole table: counts are list lengths, and a page of rows is read with
+``iloc`` on the merged positions of the requested statuses.
+"""
+import heapq
+from bisect import bisect_left, insort
+from itertools import islice
+
+import pandas as pd
+
+
+class BuyerPartitions:
+    def __init__(self, dossiers):
+        self._rows = {}  # buyer -> {status -> sorted row positions}
+        groups = dossiers.groupby(["Buyer", "Status"], observed=True, sort=False).indices
+        for (buyer, status), positions in groups.items():
+            self._rows.setdefault(buyer, {})[status] = positions.tolist()
+
+    def add(self, start, buyers, statuses):
+        """Register rows appended at positions ``start``, ``start + 1``..."""
+        for pos, (buyer, status) in enumerate(zip(buyers, statuses), start):
+            if pd.notna(buyer):
+                self._rows.setdefault(buyer, {}).setdefault(status, []).append(pos)
+
+    def move(self, pos, old_key, new_key):
+        """Row ``pos`` changed from ``(buyer, status)`` ``old_key`` to ``new_key``."""
+        if old_key == new_key:
+            return
+        if pd.notna(old_key[0]):
+            positions = self._rows.get(old_key[0], {}).get(old_key[1], [])
+            i = bisect_left(positions, pos)
+            if i < len(positions) and positions[i] == pos:
+                del positions[i]
+        if pd.notna(new_key[0]):
+            insort(self._rows.setdefault(new_key[0], {}).setdefault(new_key[1], []), pos)
+
+    def count(self, buyer, statuses=None):
+        groups = self._rows.get(buyer, {})
+        if statuses is None:
+            return sum(len(positions) for positions in groups.values())
+        return sum(len(groups.get(status, ())) for status in statuses)
+
+    def positions(self, buyer, statuses=None, offset=0, limit=None):
+        """Row positions of ``buyer`` in table order, ``limit`` of them after ``offset``."""
+        groups = self._rows.get(buyer, {})
+        lists = list(groups.values()) if statuses is None else [groups.get(s, []) for s in statuses]
+        lists = [positions for positions in lists if positions]
+        if len(lists) == 1:
+            return lists[0][offset:None if limit is None else offset + limit]
+        # Merge only as far as the requested page
+        return list(islice(heapq.merge(*lists), offset, None if limit is None else offset + limit))
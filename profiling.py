@@ -0,0 +1,194 @@
+"""Per-rerun timing of the app's sections and of the engine hot paths.
+
+Each Streamlit rerun opens a ``RerunProfile``; the app's ``lap()`` marks
+(CSS, data init, sidebar, export, page render) and the functions decorated
+with ``@profiled`` (load, workload, assignment, save, export...) add their
+duration to it while it is active in the current thread (one thread per
+session), and cost a single attribute lookup otherwise (CLI, benchmarks). At the end of the rerun the
+profile is appended as one JSON line to ``achat_metrics.jsonl`` in the data
+directory; ``summarize()`` reads the latest lines back as p50/p95 latencies.
+The first rerun of a server process, which pays the imports and the one-time
+initialization, is marked cold and summarized apart from the warm reruns.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+METRICS_FILE = "achat_metrics.jsonl"
+# The metrics file is rotated to ``.1`` past this size
+METRICS_MAX_BYTES = 5 * 2**20
+TOTAL = "total"
+COLD_START = "cold_start"
+
+_active = threading.local()
+
+
+class RerunProfile:
+    def __init__(self, page=None, started=None, cold=False):
+        self.page = page
+        self.sections = {}  # name -> seconds (summed over the calls)
+        self.calls = {}     # name -> number of calls
+        self.memory = {}    # table -> bytes
+        self.fragment = None  # name of the fragment when only it re-ran
+        self.cold = cold    # first rerun of the server process
+        self._start = self._lap = started if started is not None else time.perf_counter()
+        self.total = None
+
+    def add(self, name, seconds):
+        self.sections[name] = self.sections.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def lap(self, name):
+        """Time since the previous lap (or the start) under ``name``."""
+        now = time.perf_counter()
+        self.add(name, now - self._lap)
+        self._lap = now
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+        return self
+
+    def record(self):
+        """JSON-serializable line of the metrics file (durations in ms)."""
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "page": self.page,
+            "fragment": self.fragment,
+            "cold": self.cold,
+            TOTAL: round(self.total * 1000, 3),
+            "sections": {name: round(s * 1000, 3) for name, s in self.sections.items()},
+            "calls": self.calls,
+            "memory_mb": {name: round(b / 2**20, 2) for name, b in self.memory.items()},
+        }
+
+
+# --- ACTIVE PROFILE ---
+_cold = True
+
+
+def start(page=None, started=None):
+    """Open the profile of this thread's rerun, timed from ``started`` (perf_counter) if given.
+
+    The first profile of the process is marked cold: its imports and one-time
+    initialization are paid by that rerun only.
+    """
+    global _cold
+    _active.profile = RerunProfile(page, started, _cold)
+    _cold = False
+    return _active.profile
+
+
+def stop():
+    profile = getattr(_active, "profile", None)
+    _active.profile = None
+    return profile.finish() if profile is not None else None
+
+
+@contextmanager
+def section_or_rerun(name, page, path):
+    """Time ``name`` as a section of the current rerun or, when it re-runs on
+    its own (Streamlit fragment), as a rerun of its own appended to ``path``."""
+    profile = getattr(_active, "profile", None)
+    if profile is not None:
+        with profile.section(name):
+            yield
+        return
+    profile = start(page)
+    profile.fragment = name
+    try:
+        with profile.section(name):
+            yield
+    finally:
+        stop()
+        append_metrics(path, profile)
+
+
+def profiled(name):
+    """Decorator: time the calls made during a profiled rerun under ``name``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = getattr(_active, "profile", None)
+            if profile is None:
+                return fn(*args, **kwargs)
+            with profile.section(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- METRICS FILE ---
+def metrics_path(data_dir):
+    return os.path.join(data_dir, METRICS_FILE)
+
+
+def append_metrics(path, profile):
+    line = json.dumps(profile.record(), ensure_ascii=False) + "\n"
+    try:
+        if os.path.getsize(path) > METRICS_MAX_BYTES:
+            os.replace(path, f"{path}.1")
+    except OSError:
+        pass
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write(line)
+
+
+def read_metrics(path, last=500):
+    """The ``last`` records of the metrics file (oldest first)."""
+    try:
+        with open(path, encoding="utf-8") as handle:
+            lines = deque(handle, maxlen=last)
+    except OSError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue  # line cut by a concurrent write
+    return records
+
+
+def summarize(records, page=None):
+    """p50/p95/max (ms) of the rerun total and of each section, slowest first.
+
+    Fragment reruns are reported apart from full reruns, as ``fragment:<name>``,
+    and the first rerun of each server process as ``cold_start`` with its
+    sections as ``cold:<name>``.
+    """
+    if page is not None:
+        records = [r for r in records if r.get("page") == page]
+    samples = {TOTAL: []}
+    for record in records:
+        fragment = record.get("fragment")
+        cold = record.get("cold", False)
+        samples.setdefault(f"fragment:{fragment}" if fragment else COLD_START if cold else TOTAL, []).append(record[TOTAL])
+        for name, ms in record["sections"].items():
+            samples.setdefault(f"cold:{name}" if cold else name, []).append(ms)
+    rows = {
+        name: {
+            "n": len(values),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "max": float(np.max(values)),
+        }
+        for name, values in samples.items() if values
+    }
+    frame = pd.DataFrame.from_dict(rows, orient="index", columns=["n", "p50", "p95", "max"])
+    return frame.sort_values("p95", ascending=False).round(2)
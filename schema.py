@@ -0,0 +1,108 @@
+"""Typed in-memory schema of the dossier table.
+
+Every frame of dossiers goes through ``apply_schema()`` when it is loaded and
+when rows are appended, so the pages and the engine can rely on the dtypes:
+low-cardinality text columns are categoricals (a few bytes per row, fast
+``== "Open"`` filters and groupbys), dates are ``datetime64`` parsed once with
+a fixed (ISO 8601) format, and amounts are floats.
+"""
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+DOSSIER_COLUMNS = [
+    "ID", "Description", "Category", "Urgency",
+    "Buyer", "Status", "Assigned_Date", "Closed_Date"
+]
+PROCUREMENT_COLUMNS = ["Type_AO", "Devise", "Montant_Ajustement", "Date_Ajustement"]
+ALL_COLUMNS = DOSSIER_COLUMNS + PROCUREMENT_COLUMNS
+
+# Known values come first; values found in the data are added after them
+CATEGORICAL_COLUMNS = {
+    "Category": ["Informatique", "Pièce de rechange", "Service", "Matériel", "Autre"],
+    "Urgency": ["Élevée", "Moyenne", "Faible"],
+    "Status": ["Open", "Closed", "Cancelled"],
+    "Buyer": [],
+    "Type_AO": ["", "AO Ouvert", "AO fermé"],
+    "Devise": ["MAD", "EUR", "USD", "GBP", "Autre"],
+}
+DATETIME_COLUMNS = ["Assigned_Date", "Closed_Date", "Date_Ajustement"]
+FLOAT_COLUMNS = ["Montant_Ajustement"]
+
+# Values of columns absent from older files (written before the procurement fields)
+COLUMN_DEFAULTS = {"Type_AO": "", "Devise": "MAD", "Montant_Ajustement": 0.0}
+
+
+def parse_dates(values):
+    """Fixed-format parse; empty strings and unparsable values become NaT."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values.replace("", None), format="ISO8601", errors="coerce")
+
+
+def _categorical(values, known):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        extra = [c for c in values.cat.categories if c not in known]
+        return values.cat.set_categories(known + extra)
+    observed = pd.unique(values.dropna())
+    return pd.Categorical(values, categories=known + [v for v in observed if v not in known])
+
+
+def apply_schema(df):
+    """``df`` with every dossier column present and typed (in place when possible)."""
+    for col in ALL_COLUMNS:
+        if col not in df.columns:
+            df[col] = COLUMN_DEFAULTS.get(col)
+    for col, known in CATEGORICAL_COLUMNS.items():
+        df[col] = _categorical(df[col], known)
+        if col in COLUMN_DEFAULTS:
+            df[col] = df[col].fillna(COLUMN_DEFAULTS[col])
+    for col in DATETIME_COLUMNS:
+        df[col] = parse_dates(df[col])
+    for col in FLOAT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0).astype("float64")
+    return df
+
+
+# --- BUYERS ---
+BUYER_COLUMNS = ["Name", "Email", "Capacity", "Absences"]
+
+
+def apply_buyer_schema(df):
+    """Buyers with a float ``Capacity`` (1 by default) and text ``Absences``."""
+    if "Email" not in df.columns:
+        df["Email"] = ""
+    df["Capacity"] = pd.to_numeric(df["Capacity"], errors="coerce").fillna(1.0) if "Capacity" in df.columns else 1.0
+    df["Absences"] = df["Absences"].fillna("").astype(str) if "Absences" in df.columns else ""
+    return df
+
+
+def empty_buyers():
+    return apply_buyer_schema(pd.DataFrame(columns=BUYER_COLUMNS))
+
+
+def empty_dossiers():
+    return apply_schema(pd.DataFrame(columns=ALL_COLUMNS))
+
+
+def dossiers_frame(rows):
+    return apply_schema(pd.DataFrame(list(rows)))
+
+
+def concat_dossiers(frames):
+    """Concatenate typed frames, keeping the categoricals (union of categories)."""
+    frames = [df for df in frames if len(df)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(
+        [df.drop(columns=list(CATEGORICAL_COLUMNS)) for df in frames], ignore_index=True
+    )
+    for col in CATEGORICAL_COLUMNS:
+        combined[col] = union_categoricals([df[col] for df in frames], ignore_order=True)
+    return combined[[col for col in frames[0].columns]]
+
+
+def ensure_category(df, col, value):
+    """Let ``df[col]`` hold ``value``: a new value is added to its categories."""
+    column = df[col]
+    if isinstance(column.dtype, pd.CategoricalDtype) and pd.notna(value) and value not in column.cat.categories:
+        df[col] = column.cat.add_categories([value])
@@ -0,0 +1,251 @@
+"""Full-text search over the dossiers: an inverted index kept up to date.
+
+``SearchIndex`` maps every word of ``Description`` and ``Category`` to the
+(sorted) ordinals of the dossiers containing it. Words are lowercased and
+stripped of their accents, so "materiel" finds "Matériel"; hyphenated words
+are indexed whole and by part, and a few French stop words are ignored. The
+last word of a query also matches as a prefix ("ordi" finds "ordinateur"),
+for search as you type. ``ID`` is matched whole through the index, and by
+prefix through the store's sorted ID index.
+
+Results are ranked by the number of query words they contain, then BM25
+(rarer words and shorter descriptions first), then the most recent. The
+buyer, status and assignment date of every dossier are kept in NumPy columns
+next to the index, so filters apply to the matching ordinals without
+reading the store; only the page of results shown is fetched.
+
+The index is built from the store on the first search (distinct texts are
+tokenized once), then updated on each create, status change and
+reassignment like the workload index. A full reload of the store drops it;
+the next search rebuilds it.
+"""
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+from schema import CATEGORICAL_COLUMNS
+
+STATUSES = CATEGORICAL_COLUMNS["Status"]
+STOP_WORDS = frozenset({
+    "a", "au", "aux", "avec", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les",
+    "ou", "par", "pour", "sur", "un", "une",
+})
+# Prefix matches of the last query word taken into account
+MAX_PREFIX_WORDS = 200
+BM25_K1 = 1.2
+BM25_B = 0.75
+NO_DATE = np.iinfo(np.int64).min
+_WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def normalize(text):
+    """Lowercase ``text`` without accents (é -> e, œ -> oe)."""
+    text = unicodedata.normalize("NFKD", str(text).lower().replace("œ", "oe").replace("æ", "ae"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Distinct indexed words of ``text``."""
+    words = set()
+    for word in _WORD.findall(normalize(text)):
+        words.add(word)
+        if "-" in word:
+            words.update(word.split("-"))
+    return words - STOP_WORDS
+
+
+class _Column:
+    """Growable NumPy column (amortized appends, values set in place)."""
+
+    def __init__(self, dtype, values=()):
+        values = np.asarray(values, dtype=dtype)
+        self._data = np.empty(max(len(values) * 2, 1024), dtype=dtype)
+        self._data[:len(values)] = values
+        self.size = len(values)
+
+    def append(self, value):
+        if self.size == len(self._data):
+            self._data = np.resize(self._data, 2 * self.size)
+        self._data[self.size] = value
+        self.size += 1
+
+    def __setitem__(self, pos, value):
+        self._data[pos] = value
+
+    def view(self):
+        return self._data[:self.size]
+
+
+class SearchIndex:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._built = False
+
+    # --- Building ---
+    def _build(self):
+        dossiers = self.store.all_dossiers()
+        n = len(dossiers)
+        self._ids = dossiers["ID"].astype(str).tolist()
+        self._ordinal = dict(zip(self._ids, range(n)))
+        self._buyer_codes = {}
+        self._buyer = _Column(np.int32, [self._buyer_code(b) for b in dossiers["Buyer"].astype(object)])
+        self._status = _Column(np.int8, dossiers["Status"].astype(object).map(
+            {s: i for i, s in enumerate(STATUSES)}).fillna(-1).to_numpy())
+        assigned = dossiers["Assigned_Date"]
+        self._date = _Column(np.int64, np.where(assigned.isna(), NO_DATE, assigned.to_numpy().astype("datetime64[ns]").astype(np.int64)))
+
+        # Each distinct text is tokenized once (many requests share a description)
+        text = dossiers["Description"].astype(object).fillna("") + " " + dossiers["Category"].astype(object).fillna("")
+        codes, uniques = pd.factorize(text)
+        words = [tokenize(u) for u in uniques]
+        lengths = np.array([len(w) for w in words], dtype=np.int16)
+        self._length = _Column(np.int16, lengths[codes] if n else [])
+        self._length_sum = int(self._length.view().sum())
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        groups = {}
+        for u, unique_words in enumerate(words):
+            docs = order[bounds[u]:bounds[u + 1]]
+            for word in unique_words:
+                groups.setdefault(word, []).append(docs)
+        self._postings = {
+            word: array("i", np.sort(np.concatenate(parts)).astype(np.int32).tobytes())
+            for word, parts in groups.items()
+        }
+        self._vocabulary = sorted(self._postings)
+        self._built = True
+
+    def _buyer_code(self, buyer):
+        if pd.isna(buyer):
+            return -1
+        return self._buyer_codes.setdefault(str(buyer), len(self._buyer_codes))
+
+    def invalidate(self):
+        """Drop the index (the store reloaded everything); rebuilt on the next search."""
+        with self._lock:
+            self._built = False
+            self._postings = self._ordinal = self._ids = None
+
+    # --- Updates ---
+    def on_create(self, rows):
+        with self._lock:
+            if not self._built:
+                return
+            for row in rows:
+                ordinal = len(self._ids)
+                self._ids.append(str(row["ID"]))
+                self._ordinal[self._ids[-1]] = ordinal
+                self._buyer.append(self._buyer_code(row.get("Buyer")))
+                status = row.get("Status", "Open")
+                self._status.append(STATUSES.index(status) if status in STATUSES else -1)
+                assigned = pd.Timestamp(row["Assigned_Date"]) if row.get("Assigned_Date") else pd.NaT
+                self._date.append(NO_DATE if pd.isna(assigned) else assigned.value)
+                words = tokenize(f"{row.get('Description') or ''} {row.get('Category') or ''}")
+                self._length.append(len(words))
+                self._length_sum += len(words)
+                for word in words:
+                    if word not in self._postings:
+                        self._postings[word] = array("i")
+                        self._vocabulary.insert(bisect_left(self._vocabulary, word), word)
+                    self._postings[word].append(ordinal)
+
+    def on_status_change(self, dossier_id, status):
+        with self._lock:
+            if self._built and dossier_id in self._ordinal:
+                self._status[self._ordinal[dossier_id]] = STATUSES.index(status) if status in STATUSES else -1
+
+    def on_reassign(self, dossier_id, buyer):
+        with self._lock:
+            if self._built and dossier_id in self._ordinal:
+                self._buyer[self._ordinal[dossier_id]] = self._buyer_code(buyer)
+
+    # --- Queries ---
+    def _terms(self, query):
+        """Matching ordinals of each query word, the last one also as a prefix.
+
+        The arrays are copies: a view on a postings array would keep it from
+        growing once the lock is released.
+        """
+        parts = [part for word in _WORD.findall(normalize(query))
+                 for part in (word.split("-") if "-" in word else [word]) if part not in STOP_WORDS]
+        terms = []
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1 and not query[-1:].isspace():
+                start = bisect_left(self._vocabulary, part)
+                end = min(bisect_right(self._vocabulary, part + "\uffff"), start + MAX_PREFIX_WORDS)
+                words = self._vocabulary[start:end]
+            else:
+                words = [part] if part in self._postings else []
+            # An ordinal repeated across prefix matches counts once (boolean mask)
+            terms.append(np.concatenate([np.frombuffer(self._postings[w], dtype=np.int32) for w in words])
+                         if words else np.empty(0, dtype=np.int32))
+        return terms
+
+    def search(self, query, buyer=None, statuses=None, start=None, end=None, offset=0, limit=50):
+        """``(total, [(dossier ID, score), ...])`` of the matches, best first.
+
+        ``buyer`` and ``statuses`` filter on the current values, ``start`` and
+        ``end`` (dates, end day included) on ``Assigned_Date``.
+        """
+        text = (query or "").strip()
+        if not text:
+            return 0, []
+        with self._lock:
+            if not self._built:
+                self._build()
+            n = len(self._ids)
+            weighted = [(docs, np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)))
+                        for docs in self._terms(query) if len(docs)]
+            # A typed ID comes first, then the IDs it starts ("PR-20250405")
+            if " " not in text:
+                prefixed = [self._ordinal[i] for i in self.store.ids_with_prefix(text, limit=1000) if i in self._ordinal]
+                weighted.append((np.array(prefixed, dtype=np.int32), 1e3))
+            exact = [self._ordinal[i] for i in {text, text.upper()} & self._ordinal.keys()]
+            weighted.append((np.array(exact, dtype=np.int32), 1e6))
+
+            # Candidates from one mask, then each term's hits among them
+            # (boolean scatter/gather, much cheaper than fancy-index +=)
+            mask = np.zeros(n, dtype=bool)
+            for docs, _ in weighted:
+                mask[docs] = True
+            docs = np.flatnonzero(mask)
+            score = np.zeros(len(docs))
+            coverage = np.zeros(len(docs), dtype=np.int16)
+            for ordinals, weight in weighted:
+                mask[:] = False
+                mask[ordinals] = True
+                hit = mask[docs]
+                coverage += hit
+                score += hit * weight
+
+            # Filters and length normalization on the matches only
+            keep = np.ones(len(docs), dtype=bool)
+            if buyer is not None:
+                keep &= self._buyer.view()[docs] == self._buyer_codes.get(str(buyer), -2)
+            if statuses is not None:
+                keep &= np.isin(self._status.view()[docs], [STATUSES.index(s) for s in statuses if s in STATUSES])
+            if start is not None or end is not None:
+                dates = self._date.view()[docs]
+                if start is not None:
+                    keep &= dates >= pd.Timestamp(start).value
+                if end is not None:
+                    keep &= (dates < (pd.Timestamp(end) + pd.Timedelta(days=1)).value) & (dates != NO_DATE)
+            docs, score, coverage = docs[keep], score[keep], coverage[keep]
+            total = len(docs)
+            if offset >= total or limit <= 0:
+                return total, []
+            lengths = self._length.view()[docs]
+            score = score * (BM25_K1 + 1) / (
+                1 + BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(self._length_sum / n, 1.0)))
+            # Most query words, then BM25 score, then most recent (highest ordinal)
+            rank = coverage * 1e9 + score
+            page_end = min(offset + limit, total)
+            best = np.argpartition(-rank, page_end - 1)[:page_end] if page_end < total else np.arange(total)
+            best = best[np.lexsort((-docs[best], -rank[best]))][offset:page_end]
+            return total, [(self._ids[d], round(float(score[i]), 3)) for i, d in zip(best, docs[best])]
@@ -0,0 +1,308 @@
+"""Discrete-event simulation of the assignment policies, offline.
+
+    python simulate.py run --days 180 --buyers 10 --arrivals 25
+    python simulate.py sweep --arrivals 15 25 35 --buyers 5 10 20 --seeds 20 --workers 8
+
+Purchase requests arrive as a Poisson process (``arrivals`` per day), with
+the category, urgency and ``Type_AO`` mix of the benchmark data. Each
+request needs ``days_per_cost`` days of work per unit of its cost (the cost
+model of the data directory, so ``achat_weights.json`` applies), with
+lognormal noise. A buyer works on their dossiers one at a time, in the order
+they were assigned, at the speed of their capacity; the completion time of a
+dossier is therefore known when it is assigned, and the event loop only
+processes arrivals and the completions due before each of them.
+
+Policies, all run on the same arrivals of a scenario:
+
+* ``least_busy``: fewest open dossiers, then oldest last assignment;
+* ``weighted``: lowest open cost relative to capacity, then oldest last
+  assignment (``assign_to_least_busy()`` of the app);
+* ``round_robin``: buyers in turn;
+* ``batch``: requests wait for the daily batch, assigned like an
+  ``import_batch()`` (urgent first, grouped by category, weighted load).
+
+Per arrival the buyer state is held in NumPy arrays (one ``argmin`` per
+decision); the arrivals, work times and metrics are generated and computed
+for the whole scenario at once. ``sweep`` runs every combination of the
+parameters over a process pool and writes one CSV row per scenario and
+policy.
+"""
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch import greedy_assign
+from benchmark import CATEGORY_WEIGHTS, DESCRIPTIONS, URGENCY_WEIGHTS
+from cost_model import load_cost_model
+from schema import CATEGORICAL_COLUMNS
+
+POLICIES = ["least_busy", "weighted", "round_robin", "batch"]
+URGENCIES = CATEGORICAL_COLUMNS["Urgency"]
+CATEGORIES = list(DESCRIPTIONS)
+TYPES_AO = ["", "AO Ouvert", "AO fermé"]
+TYPE_AO_WEIGHTS = [0.5, 0.3, 0.2]
+URGENT = URGENCIES.index("Élevée")
+
+DEFAULTS = {
+    "days": 180,
+    "buyers": 10,
+    "arrivals": 25.0,
+    "days_per_cost": 0.25,
+    "work_sigma": 0.6,
+    # Capacities drawn uniformly in [1 - spread, 1 + spread]
+    "capacity_spread": 0.3,
+    # Hour of the day at which the batch policy assigns the waiting requests
+    "batch_hour": 17,
+    "seed": 0,
+}
+METRICS = ["lead_mean", "lead_p50", "lead_p95", "urgent_p95", "backlog_mean", "backlog_max", "backlog_end",
+           "utilization_max", "fairness", "buyer_lead_spread"]
+
+
+# --- SCENARIO ---
+def generate_arrivals(days, arrivals, days_per_cost, work_sigma, rng, cost_model):
+    """Arrival times (days), urgency codes, costs and work (days at capacity 1)."""
+    n = rng.poisson(arrivals * days)
+    times = np.sort(rng.uniform(0, days, n))
+    category = rng.choice(len(CATEGORIES), n, p=CATEGORY_WEIGHTS)
+    urgency = rng.choice(len(URGENCIES), n, p=URGENCY_WEIGHTS)
+    type_ao = rng.choice(len(TYPES_AO), n, p=TYPE_AO_WEIGHTS)
+    costs = cost_model.costs(pd.DataFrame({
+        "Urgency": np.array(URGENCIES, dtype=object)[urgency],
+        "Category": np.array(CATEGORIES, dtype=object)[category],
+        "Type_AO": np.array(TYPES_AO, dtype=object)[type_ao],
+    }))
+    # Mean-one lognormal noise around the cost-proportional work
+    noise = rng.lognormal(-work_sigma ** 2 / 2, work_sigma, n)
+    return {"time": times, "category": category, "urgency": urgency, "cost": costs,
+            "work": costs * days_per_cost * noise}
+
+
+class _Buyers:
+    """Open dossiers, open cost, queue end and last assignment of every buyer."""
+
+    def __init__(self, capacity):
+        n = len(capacity)
+        self.capacity = capacity
+        self.open = np.zeros(n)
+        self.load = np.zeros(n)
+        self.free_at = np.zeros(n)
+        self.last = np.full(n, -np.inf)
+        self._due = []  # (completion, buyer, cost)
+
+    def advance(self, now):
+        """Close the dossiers completed by ``now``."""
+        due = self._due
+        while due and due[0][0] <= now:
+            _, buyer, cost = heapq.heappop(due)
+            self.open[buyer] -= 1
+            self.load[buyer] -= cost
+
+    def pick(self, key):
+        # Lowest key, then oldest last assignment, then buyer order
+        candidates = np.flatnonzero(key <= key.min() + 1e-9)
+        return candidates[np.argmin(self.last[candidates])]
+
+    def assign(self, buyer, now, cost, work):
+        """Queue a dossier on ``buyer``; returns its completion time."""
+        done = max(now, self.free_at[buyer]) + work / self.capacity[buyer]
+        self.free_at[buyer] = done
+        self.open[buyer] += 1
+        self.load[buyer] += cost
+        self.last[buyer] = now
+        heapq.heappush(self._due, (done, buyer, cost))
+        return done
+
+
+def simulate(policy, arrivals, capacity, batch_hour=DEFAULTS["batch_hour"]):
+    """Buyer and completion time of every arrival under ``policy``."""
+    times, costs, work = arrivals["time"], arrivals["cost"], arrivals["work"]
+    n = len(times)
+    buyers = _Buyers(capacity)
+    assigned = np.empty(n, dtype=np.int64)
+    done = np.empty(n)
+    if policy == "batch":
+        # Requests of (previous batch, batch time] are assigned together
+        batch_times = np.floor(times - batch_hour / 24) + 1 + batch_hour / 24
+        starts = np.flatnonzero(np.r_[True, batch_times[1:] != batch_times[:-1]])
+        ranks = np.arange(len(capacity))
+        for start, end in zip(starts, np.r_[starts[1:], n]):
+            now = batch_times[start]
+            buyers.advance(now)
+            rows = np.arange(start, end)
+            order = np.lexsort((arrivals["category"][rows], arrivals["urgency"][rows]))
+            # greedy_assign() orders the last assignments as integers: seconds here
+            last = np.where(np.isfinite(buyers.last), buyers.last * 86400, -1).astype(np.int64)
+            state = (None, np.round(buyers.load / capacity, 9), last, ranks, capacity,
+                     np.ones(len(capacity), dtype=bool))
+            positions = greedy_assign(order, costs[rows], state, int(now * 86400))
+            # Each buyer takes the batch in the assignment order (urgent first)
+            for row in order:
+                i = rows[row]
+                assigned[i] = positions[row]
+                done[i] = buyers.assign(positions[row], now, costs[i], work[i])
+        return assigned, done
+    for i in range(n):
+        now = times[i]
+        buyers.advance(now)
+        if policy == "least_busy":
+            buyer = buyers.pick(buyers.open)
+        elif policy == "weighted":
+            buyer = buyers.pick(buyers.load / capacity)
+        elif policy == "round_robin":
+            buyer = i % len(capacity)
+        else:
+            raise ValueError(f"Politique inconnue : {policy} (attendu {', '.join(POLICIES)})")
+        assigned[i] = buyer
+        done[i] = buyers.assign(buyer, now, costs[i], work[i])
+    return assigned, done
+
+
+def measure(arrivals, capacity, assigned, done, days):
+    """Lead time (days), backlog and fairness of one simulated run."""
+    times = arrivals["time"]
+    lead = done - times
+    urgent = arrivals["urgency"] == URGENT
+    # Open dossiers at the end of each simulated day
+    grid = np.arange(1, days + 1)
+    backlog = np.searchsorted(times, grid, side="right") - np.searchsorted(np.sort(done), grid, side="right")
+    n_buyers = len(capacity)
+    # Work received relative to capacity: equal for every buyer when the split is fair
+    relative = np.bincount(assigned, weights=arrivals["work"], minlength=n_buyers) / capacity
+    fairness = relative.sum() ** 2 / (n_buyers * (relative ** 2).sum()) if relative.any() else 1.0
+    per_buyer = np.bincount(assigned, weights=lead, minlength=n_buyers) / np.maximum(
+        np.bincount(assigned, minlength=n_buyers), 1)
+    return {
+        "dossiers": len(times),
+        "lead_mean": float(lead.mean()) if len(lead) else 0.0,
+        "lead_p50": float(np.percentile(lead, 50)) if len(lead) else 0.0,
+        "lead_p95": float(np.percentile(lead, 95)) if len(lead) else 0.0,
+        "urgent_p95": float(np.percentile(lead[urgent], 95)) if urgent.any() else 0.0,
+        "backlog_mean": float(backlog.mean()),
+        "backlog_max": int(backlog.max()),
+        "backlog_end": int(backlog[-1]),
+        "utilization_max": float((relative / days).max()),
+        "fairness": float(fairness),
+        "buyer_lead_spread": float(np.ptp(per_buyer)),
+    }
+
+
+def run_scenario(params):
+    """Every policy on the arrivals of one scenario; one result row per policy."""
+    params = {**DEFAULTS, **params}
+    rng = np.random.default_rng(params["seed"])
+    cost_model = load_cost_model(params.get("data_dir", "."))
+    capacity = rng.uniform(1 - params["capacity_spread"], 1 + params["capacity_spread"], params["buyers"])
+    arrivals = generate_arrivals(params["days"], params["arrivals"], params["days_per_cost"],
+                                 params["work_sigma"], rng, cost_model)
+    rows = []
+    for policy in params.get("policies", POLICIES):
+        start = time.perf_counter()
+        assigned, done = simulate(policy, arrivals, capacity, params["batch_hour"])
+        rows.append({
+            **{key: params[key] for key in DEFAULTS},
+            "policy": policy,
+            **measure(arrivals, capacity, assigned, done, params["days"]),
+            "seconds": round(time.perf_counter() - start, 4),
+        })
+    return rows
+
+
+def sweep(grid, workers=None, chunksize=4):
+    """Results frame of every scenario of ``grid`` (list of parameter dicts)."""
+    if workers == 1:
+        results = map(run_scenario, grid)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(run_scenario, grid, chunksize=chunksize)
+    try:
+        return pd.DataFrame([row for rows in results for row in rows])
+    finally:
+        if workers != 1:
+            pool.shutdown()
+
+
+def summarize(results, by=("policy",)):
+    """Mean of the metrics per policy (and per parameter of ``by``)."""
+    return results.groupby(list(by), sort=False)[METRICS].mean().round(3)
+
+
+# --- COMMANDS ---
+def _scenario_args(args):
+    return {"days": args.days, "days_per_cost": args.days_per_cost, "work_sigma": args.work_sigma,
+            "capacity_spread": args.capacity_spread, "batch_hour": args.batch_hour,
+            "data_dir": args.data_dir, "policies": args.policies}
+
+
+def cmd_run(args):
+    rows = run_scenario({**_scenario_args(args), "buyers": args.buyers, "arrivals": args.arrivals, "seed": args.seed})
+    results = pd.DataFrame(rows).set_index("policy")
+    print(f"{results['dossiers'].iloc[0]} demandes sur {args.days} jours, {args.buyers} acheteurs "
+          f"(délais et files en jours / dossiers)")
+    print(results[METRICS + ["seconds"]].round(3).T.to_string())
+
+
+def cmd_sweep(args):
+    grid = [
+        {**_scenario_args(args), "arrivals": arrivals, "buyers": buyers, "capacity_spread": spread, "seed": seed}
+        for arrivals, buyers, spread, seed in itertools.product(
+            args.arrivals, args.buyers, args.capacity_spread, range(args.seed, args.seed + args.seeds))
+    ]
+    print(f"{len(grid)} scénarios x {len(args.policies)} politiques sur {args.workers or os.cpu_count()} processus…",
+          file=sys.stderr)
+    start = time.perf_counter()
+    results = sweep(grid, args.workers)
+    elapsed = time.perf_counter() - start
+    results.to_csv(args.output, index=False)
+    by = ["arrivals", "buyers", "policy"] if len(args.arrivals) * len(args.buyers) > 1 else ["policy"]
+    print(summarize(results, by).to_string())
+    print(f"\n{len(results)} simulations en {elapsed:.1f} s, résultats écrits dans {args.output}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Simulation des politiques d'attribution")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scenario = argparse.ArgumentParser(add_help=False)
+    scenario.add_argument("--days", type=int, default=DEFAULTS["days"], help="Durée simulée en jours")
+    scenario.add_argument("--days-per-cost", type=float, default=DEFAULTS["days_per_cost"],
+                          help="Jours de travail par unité de coût d'un dossier")
+    scenario.add_argument("--work-sigma", type=float, default=DEFAULTS["work_sigma"],
+                          help="Dispersion (lognormale) du temps de traitement")
+    scenario.add_argument("--batch-hour", type=int, default=DEFAULTS["batch_hour"],
+                          help="Heure du lot quotidien de la politique batch")
+    scenario.add_argument("--policies", nargs="+", default=POLICIES, choices=POLICIES)
+    scenario.add_argument("--data-dir", default=".", help="Dossier dont la pondération des coûts est utilisée")
+    scenario.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("run", parents=[scenario], help="Comparer les politiques sur un scénario")
+    run.add_argument("--buyers", type=int, default=DEFAULTS["buyers"])
+    run.add_argument("--arrivals", type=float, default=DEFAULTS["arrivals"], help="Demandes par jour")
+    run.add_argument("--capacity-spread", type=float, default=DEFAULTS["capacity_spread"])
+    run.set_defaults(func=cmd_run)
+
+    sweep_parser = commands.add_parser("sweep", parents=[scenario], help="Balayer des paramètres en parallèle")
+    sweep_parser.add_argument("--buyers", type=int, nargs="+", default=[DEFAULTS["buyers"]])
+    sweep_parser.add_argument("--arrivals", type=float, nargs="+", default=[DEFAULTS["arrivals"]])
+    sweep_parser.add_argument("--capacity-spread", type=float, nargs="+", default=[DEFAULTS["capacity_spread"]])
+    sweep_parser.add_argument("--seeds", type=int, default=10, help="Répétitions de chaque combinaison")
+    sweep_parser.add_argument("--workers", type=int, default=None, help="Processus (défaut : tous les cœurs)")
+    sweep_parser.add_argument("--output", default="simulation_results.csv")
+    sweep_parser.set_defaults(func=cmd_sweep)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
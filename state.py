@@ -0,0 +1,112 @@
+"""Dossier data shared by every session of one server process.
+
+``AchatState`` owns the storage backend, the cost model, the workload index,
+the KPI rollups, the ID allocator, the notification outbox, the event history
+and the full-text index. The app keeps a single instance per process
+(``st.cache_resource``) instead of one DataFrame copy per browser session.
+Writes go through ``mutation()``, which serializes them and bumps
+``version`` so that other sessions notice the change on their next rerun.
+Appends and updates replace the store's frames instead of editing them, so a
+frame a reader already holds never changes under it.
+
+Writes made by other processes (another server, the CLI) are picked up by
+``sync()``, called on every rerun and before each write: the store reports
+only the changes made since the last call, and the workload index, KPI
+rollups and search index are updated from them instead of being rebuilt.
+"""
+import atexit
+import threading
+from contextlib import contextmanager
+
+from cost_model import load_cost_model
+from history import EventLog
+from ids import DossierIdAllocator
+from kpi import KpiRollups
+from notify import open_queue
+from search import SearchIndex
+from workload import WorkloadIndex
+
+
+class AchatState:
+    def __init__(self, store):
+        self.store = store
+        self.store.init()
+        self.costs = load_cost_model(store.data_dir)
+        self.workload = WorkloadIndex.build(
+            store.buyers(), store.find_dossiers(statuses=["Open"]), self.costs
+        )
+        self.kpi = KpiRollups.open(store.data_dir, store)
+        atexit.register(lambda: self.kpi.flush())
+        self.ids = DossierIdAllocator(store)
+        # Buyer emails (None when no SMTP server is configured)
+        self.notifications = open_queue(store.data_dir)
+        self.events = EventLog(store.data_dir, store)
+        # Full-text index, built on the first search
+        self.search = SearchIndex(store)
+        self.version = 0
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def mutation(self):
+        """Serialize a write and publish it as a new data version."""
+        with self._lock:
+            self.sync()
+            yield self
+            self.version += 1
+            # Also applies what the write caught up from other processes,
+            # so that the saved rollups match the generation saved with them
+            self.sync()
+            self.kpi.save_if_due()
+
+    # --- Changes from other processes ---
+    def sync(self):
+        """Apply what other processes wrote; True when something changed."""
+        with self._lock:
+            # Read first: a compaction running meanwhile may read past the changes returned
+            generation = self.store.generation()
+            changes = self.store.refresh()
+            if changes is None:
+                # The store reloaded everything: so do the derived indexes
+                self.workload = WorkloadIndex.build(
+                    self.store.buyers(), self.store.find_dossiers(statuses=["Open"]), self.costs
+                )
+                # Rollups saved at the store's generation are reused: rebuilding
+                # them would read the whole archive
+                self.kpi = KpiRollups.open(self.store.data_dir, self.store)
+                self.search.invalidate()
+            else:
+                for change in changes:
+                    self._apply(change)
+                self.kpi.set_generation(generation)
+            if changes == []:
+                return False
+            self.version += 1
+            return True
+
+    def _apply(self, change):
+        op = change["op"]
+        if op == "add_dossier":
+            row = change["row"]
+            cost = self.costs.cost(row.get("Urgency"), row.get("Category"), row.get("Type_AO", ""))
+            self.workload.on_create(row.get("Buyer"), row.get("Assigned_Date"), row.get("Status", "Open"), cost)
+            self.kpi.on_create(row)
+            self.search.on_create([row])
+        elif op == "update_dossier":
+            before = change["before"]
+            cost = self.costs.cost(before["Urgency"], before["Category"], before["Type_AO"])
+            new_status = change["changes"].get("Status", before["Status"])
+            self.workload.on_status_change(before["Buyer"], before["Assigned_Date"], before["Status"], new_status, cost)
+            self.kpi.on_status_change(before, change["changes"])
+            self.search.on_status_change(before["ID"], new_status)
+            new_buyer = change["changes"].get("Buyer", before["Buyer"])
+            if new_buyer != before["Buyer"]:
+                # Status first (on the previous buyer), then the move with the new status
+                after = {**dict(before), **change["changes"]}
+                self.workload.on_reassign(before["Buyer"], new_buyer, before["Assigned_Date"], new_status, cost)
+                self.kpi.on_reassign({**after, "Buyer": before["Buyer"]}, new_buyer)
+                self.search.on_reassign(before["ID"], new_buyer)
+        elif op in ("add_buyer", "update_buyer"):
+            name = change["row"]["Name"] if op == "add_buyer" else change["name"]
+            buyer = self.store.buyers().set_index("Name").loc[name]
+            self.workload.add_buyer(name)
+            self.workload.set_profile(name, buyer["Capacity"], buyer["Absences"])
@@ -0,0 +1,1036 @@
+"""Persistence for Achat Assistant.
+
+Two interchangeable backends implement the ``DossierStore`` interface used by
+the pages (selected with the ``ACHAT_STORAGE`` environment variable):
+
+* ``CsvStore`` (default): CSV snapshots plus an append-only journal. Every
+  mutation (new dossier, status change, new buyer) is appended to the journal
+  as one JSON line instead of rewriting ``dossiers.csv`` and ``buyers.csv``.
+  ``compact()`` folds the journal back into the CSV snapshots, either on demand
+  or from a background thread once the journal grows past
+  ``COMPACT_THRESHOLD`` records. Replaying the journal is idempotent (a dossier
+  or buyer that already exists is not added twice, updates simply set values
+  again), so a crash at any point of an append or a compaction leaves a
+  dataset that loads to the same state. ``archive()`` moves old closed and
+  cancelled dossiers out of the CSV snapshot into monthly cold partitions
+  (``archive.ColdArchive``): only the hot table is loaded at startup, and the
+  queries read the partitions they need when they ask for terminal statuses.
+* ``SqliteStore``: a single ``achat.db`` file with indexes on ``ID``,
+  ``Buyer``, ``Status`` and ``Assigned_Date``. Page queries run in SQLite and
+  only return the rows they need; a status change is a single-row UPDATE.
+
+Both backends return frames typed by ``schema.apply_schema()``.
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+import pandas as pd
+
+from archive import TERMINAL_STATUSES, ColdArchive
+from schema import (
+    ALL_COLUMNS, BUYER_COLUMNS, DATETIME_COLUMNS, apply_buyer_schema, apply_schema, concat_dossiers,
+    dossiers_frame, empty_buyers, empty_dossiers, ensure_category, parse_dates,
+)
+from ids import IdIndex, prefix_upper_bound
+from partitions import BuyerPartitions
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DATA_DIR = os.environ.get("ACHAT_DATA_DIR", ".")
+STORAGE_BACKEND = os.environ.get("ACHAT_STORAGE", "csv")
+
+
+# Number of journal records after which a background compaction is started
+COMPACT_THRESHOLD = 1000
+
+
+# --- FILE HELPERS ---
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock held on ``path`` for the duration of the block."""
+    with open(path, "a+") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_csv(df, path):
+    """Write ``df`` next to ``path`` and rename it over the original once synced."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as handle:
+        df.to_csv(handle, index=False)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def _json_default(value):
+    if pd.isna(value):
+        return None
+    return str(value)
+
+
+def _encode_record(record):
+    return (json.dumps(record, default=_json_default, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+# --- STORE INTERFACE ---
+class DossierStore:
+    """Backend-independent access to dossiers and buyers.
+
+    Pages only go through these methods, so a backend can answer them with
+    indexed queries instead of loading the whole history.
+    """
+
+    def init(self):
+        raise NotImplementedError
+
+    # Full frames (export, compaction, migration)
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, dossiers, buyers):
+        raise NotImplementedError
+
+    # Mutations
+    def append_dossier(self, row):
+        self.append_dossiers([row])
+
+    def append_dossiers(self, rows):
+        """Add several dossiers in one write."""
+        raise NotImplementedError
+
+    def update_dossier(self, dossier_id, changes):
+        raise NotImplementedError
+
+    def append_buyer(self, row):
+        raise NotImplementedError
+
+    def update_buyer(self, name, changes):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Pick up what other processes wrote since the last call.
+
+        Returns the change records (journal format; updates carry the dossier
+        as it was in ``before``), or None when everything had to be reloaded.
+        Reading only the new changes keeps this proportional to them.
+        """
+        raise NotImplementedError
+
+    def generation(self):
+        """Marker of the data the store reflects, different after any write (from any process)."""
+        raise NotImplementedError
+
+    # Queries
+    def buyers(self):
+        raise NotImplementedError
+
+    def all_dossiers(self):
+        raise NotImplementedError
+
+    def count_dossiers(self, status=None, buyer=None):
+        """Number of dossiers; ``status`` is one status or a list of them."""
+        raise NotImplementedError
+
+    def get_dossier(self, dossier_id):
+        """The dossier as a Series, or None if the ID is unknown."""
+        raise NotImplementedError
+
+    def find_dossiers(self, buyer=None, statuses=None, offset=0, limit=None):
+        """Matching dossiers in table order; ``offset``/``limit`` select one page."""
+        raise NotImplementedError
+
+    def dossier_ids(self):
+        raise NotImplementedError
+
+    def ids_with_prefix(self, prefix, offset=0, limit=None):
+        """IDs starting with ``prefix``, in descending order (most recent first)."""
+        raise NotImplementedError
+
+    def count_ids_with_prefix(self, prefix):
+        raise NotImplementedError
+
+    def open_workload(self):
+        """Number of open dossiers per buyer (buyers without any are absent)."""
+        raise NotImplementedError
+
+    def last_assignment(self):
+        """Latest ``Assigned_Date`` of the open dossiers, per buyer."""
+        raise NotImplementedError
+
+    def memory_usage(self):
+        """Bytes held in memory per table (empty when nothing is kept in memory)."""
+        return {}
+
+    def archive(self, before):
+        """Move closed/cancelled dossiers older than ``before`` to cold storage; returns their number."""
+        raise ValueError("L'archivage n'est disponible qu'avec le stockage CSV")
+
+    def archive_summary(self):
+        """Archived dossiers per month and status (empty frame without archive)."""
+        return pd.DataFrame()
+
+    def archived(self, columns):
+        """The given columns of the archived dossiers."""
+        return empty_dossiers()[columns]
+
+    # Sequences
+    def reserve_sequence(self, key, n, seed):
+        """Atomically reserve ``n`` consecutive numbers of sequence ``key``.
+
+        Returns the first reserved number. ``seed()`` gives the last number
+        already in use when ``key`` has never been reserved before.
+        """
+        raise NotImplementedError
+
+
+# --- CSV STORE ---
+class CsvStore(DossierStore):
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.dossiers_path = os.path.join(data_dir, "dossiers.csv")
+        self.buyers_path = os.path.join(data_dir, "buyers.csv")
+        self.journal_path = os.path.join(data_dir, "achat_journal.jsonl")
+        self.lock_path = os.path.join(data_dir, "achat.lock")
+        self.sequences_path = os.path.join(data_dir, "achat_sequences.json")
+        self._lock = threading.RLock()
+        self._journal_records = None
+        self._compactor = None
+        self._dossiers = None
+        self._buyers = None
+        self._ids = None
+        self._partitions = None
+        self._archive = ColdArchive(data_dir)
+        # What the in-memory frames reflect: snapshot files and journal bytes read
+        self._snapshot_sig = None
+        self._journal_offset = 0
+        # Changes written by other processes, not yet handed to refresh()
+        self._external = []
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, file_lock(self.lock_path):
+            yield
+
+    def init(self):
+        if not os.path.exists(self.dossiers_path):
+            empty_dossiers().to_csv(self.dossiers_path, index=False)
+        if not os.path.exists(self.buyers_path):
+            empty_buyers().to_csv(self.buyers_path, index=False)
+
+    # --- Reading ---
+    def _read_snapshot(self):
+        try:
+            dossiers = apply_schema(pd.read_csv(self.dossiers_path, dtype={"ID": str, "Description": str}))
+        except Exception:
+            dossiers = empty_dossiers()
+        try:
+            buyers = apply_buyer_schema(pd.read_csv(self.buyers_path, dtype={"Name": str, "Email": str}))
+        except Exception:
+            buyers = empty_buyers()
+        return dossiers, buyers
+
+    def _read_journal(self, start=0):
+        """Records from byte ``start`` on, and the offset just after the last complete line."""
+        if not os.path.exists(self.journal_path):
+            return [], 0
+        with open(self.journal_path, "rb") as handle:
+            handle.seek(start)
+            data = handle.read()
+        # A line still being written by another process is read next time
+        end = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Torn write from a crash: the record was never acknowledged
+                continue
+        return records, start + end
+
+    def _snapshot_signature(self):
+        signature = []
+        for path in (self.dossiers_path, self.buyers_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def load(self):
+        with self._locked():
+            dossiers, buyers = self._read_snapshot()
+            records, _ = self._read_journal()
+        self._journal_records = len(records)
+        return replay(dossiers, buyers, records)
+
+    def _reload(self):
+        # Under the file lock: full read, remembering what the frames reflect
+        self._snapshot_sig = self._snapshot_signature()
+        dossiers, buyers = self._read_snapshot()
+        records, self._journal_offset = self._read_journal()
+        self._journal_records = len(records)
+        self._set_frames(*replay(dossiers, buyers, records))
+
+    def _frames(self):
+        # In-memory copy of the dataset, kept current by the mutations below.
+        # Every change swaps in a new frame: a frame handed out earlier is never modified.
+        if self._dossiers is None:
+            with self._locked():
+                if self._dossiers is None:
+                    self._reload()
+        return self._dossiers, self._buyers
+
+    def _set_frames(self, dossiers, buyers):
+        self._ids = IdIndex(dossiers["ID"])
+        self._partitions = BuyerPartitions(dossiers)
+        self._dossiers, self._buyers = dossiers, buyers
+
+    # --- Writing ---
+    def _append(self, op, data):
+        self._append_many(op, [data])
+
+    def _append_many(self, op, items):
+        ts = datetime.now().isoformat(timespec="seconds")
+        lines = b"".join(_encode_record({"ts": ts, "op": op, **data}) for data in items)
+        with self._locked():
+            # Records other processes appended since our last read go first
+            self._catch_up()
+            with open(self.journal_path, "ab+") as handle:
+                # Never glue a record onto the torn tail of a previous crash
+                handle.seek(0, os.SEEK_END)
+                if handle.tell() > 0:
+                    handle.seek(-1, os.SEEK_END)
+                    if handle.read(1) != b"\n":
+                        handle.write(b"\n")
+                handle.write(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+                if self._dossiers is not None:
+                    self._journal_offset = handle.tell()
+        if self._journal_records is None:
+            self._journal_records = len(self._read_journal()[0])
+        else:
+            self._journal_records += len(items)
+        if self._journal_records >= COMPACT_THRESHOLD:
+            self.compact_in_background()
+
+    def append_dossiers(self, rows):
+        if not rows:
+            return
+        self._append_many("add_dossier", [{"row": row} for row in rows])
+        if self._dossiers is not None:
+            self._add_rows(rows)
+
+    def update_dossier(self, dossier_id, changes):
+        self._frames()
+        if self._ids.position(dossier_id) is None:
+            self._restore(dossier_id)
+        self._append("update_dossier", {"id": dossier_id, "changes": changes})
+        if self._dossiers is not None:
+            pos = self._ids.position(dossier_id)
+            if pos is not None:
+                self._set_values(pos, changes)
+
+    def append_buyer(self, row):
+        self._append("add_buyer", {"row": row})
+        if self._buyers is not None:
+            self._add_buyer_row(row)
+
+    def update_buyer(self, name, changes):
+        self._append("update_buyer", {"name": name, "changes": changes})
+        if self._buyers is not None:
+            self._set_buyer_values(name, changes)
+
+    def save(self, dossiers, buyers):
+        """Full snapshot of the given frames; the journal becomes empty."""
+        with self._locked():
+            atomic_write_csv(dossiers, self.dossiers_path)
+            atomic_write_csv(buyers, self.buyers_path)
+            self._truncate_journal()
+            self._snapshot_sig = self._snapshot_signature()
+        self._set_frames(apply_schema(dossiers.copy(deep=False)), apply_buyer_schema(buyers.copy()))
+
+    def _restore(self, dossier_id):
+        # An archived dossier that changes goes back to the hot table: journal
+        # first, so that a crash in between leaves it in both places (the hot
+        # copy wins) rather than in neither
+        row = self._archive.get(dossier_id)
+        if row is None:
+            return
+        record = {col: (None if pd.isna(value) else value) for col, value in row.items()}
+        self._append("restore_dossier", {"row": record})
+        self._add_rows([record])
+        with self._locked():
+            self._archive.discard([dossier_id])
+
+    # --- In-memory frames ---
+    def _add_rows(self, rows):
+        start = len(self._dossiers)
+        self._dossiers = concat_dossiers([self._dossiers, dossiers_frame(rows)])
+        self._ids.add(row["ID"] for row in rows)
+        self._partitions.add(start, [row.get("Buyer") for row in rows], [row.get("Status") for row in rows])
+
+    def _set_values(self, pos, changes):
+        # Swap on write: a shallow copy of the frame with new copies of the
+        # changed columns only (O(rows) per changed column, the row found
+        # through the ID index), so a reader holding the old frame never sees
+        # a half-applied change.
+        dossiers = self._dossiers.copy(deep=False)
+        key_columns = [dossiers.columns.get_loc("Buyer"), dossiers.columns.get_loc("Status")]
+        old_key = tuple(dossiers.iat[pos, j] for j in key_columns)
+        for col, value in changes.items():
+            if col in DATETIME_COLUMNS:
+                value = pd.Timestamp(value) if value else pd.NaT
+            if col not in dossiers.columns:
+                dossiers[col] = None
+            ensure_category(dossiers, col, value)
+            column = dossiers[col].copy()
+            column.iat[pos] = value
+            dossiers[col] = column
+        self._partitions.move(pos, old_key, tuple(dossiers.iat[pos, j] for j in key_columns))
+        self._dossiers = dossiers
+
+    def _add_buyer_row(self, row):
+        self._buyers = apply_buyer_schema(pd.concat([self._buyers, pd.DataFrame([row])], ignore_index=True))
+
+    def _set_buyer_values(self, name, changes):
+        buyers = self._buyers.copy()
+        mask = (buyers["Name"] == name).to_numpy()
+        for col, value in changes.items():
+            buyers.loc[mask, col] = value
+        self._buyers = apply_buyer_schema(buyers)
+
+    # --- Changes from other processes ---
+    def _apply_records(self, records):
+        """Apply journal records to the frames; returns the ones that changed something.
+
+        Update records get the dossier as it was before (``before``).
+        """
+        applied = []
+        new_rows = []
+        for record in records:
+            op = record.get("op")
+            if op in ("add_dossier", "restore_dossier"):
+                row = record["row"]
+                if self._ids.position(row["ID"]) is None and all(r["ID"] != row["ID"] for r in new_rows):
+                    new_rows.append(row)
+                    # A restored dossier was already counted when it was created
+                    if op == "add_dossier":
+                        applied.append(record)
+                continue
+            if new_rows:
+                # Consecutive appends are concatenated at once
+                self._add_rows(new_rows)
+                new_rows = []
+            if op == "update_dossier":
+                pos = self._ids.position(record["id"])
+                if pos is not None:
+                    before = self._dossiers.iloc[pos].copy()
+                    self._set_values(pos, record["changes"])
+                    applied.append({**record, "before": before})
+            elif op == "add_buyer":
+                if record["row"]["Name"] not in self._buyers["Name"].values:
+                    self._add_buyer_row(record["row"])
+                    applied.append(record)
+            elif op == "update_buyer":
+                self._set_buyer_values(record["name"], record["changes"])
+                applied.append(record)
+        if new_rows:
+            self._add_rows(new_rows)
+        return applied
+
+    def _catch_up(self):
+        # Under the file lock: bring the frames up to date with what other
+        # processes wrote since our last read, reading only the new records
+        if self._dossiers is None:
+            return
+        size = self._journal_size()
+        if self._snapshot_signature() != self._snapshot_sig or size < self._journal_offset:
+            # Snapshots rewritten or journal truncated elsewhere (compaction)
+            self._reload()
+            self._external = None
+        elif size > self._journal_offset:
+            records, self._journal_offset = self._read_journal(self._journal_offset)
+            self._journal_records = (self._journal_records or 0) + len(records)
+            applied = self._apply_records(records)
+            if self._external is not None:
+                self._external.extend(applied)
+
+    def refresh(self):
+        # Two stat() calls when nothing changed
+        if self._dossiers is not None and (
+            self._journal_size() != self._journal_offset or self._snapshot_signature() != self._snapshot_sig
+        ):
+            with self._locked():
+                self._catch_up()
+        with self._lock:
+            external, self._external = self._external, []
+        return external
+
+    def generation(self):
+        # Snapshot files read and journal bytes applied
+        self._frames()
+        with self._lock:
+            return f"{self._snapshot_sig}:{self._journal_offset}"
+
+    # --- Compaction ---
+    def _truncate_journal(self):
+        if os.path.exists(self.journal_path):
+            open(self.journal_path, "w").close()
+        self._journal_records = 0
+        self._journal_offset = 0
+
+    def compact(self):
+        """Fold the journal into the CSV snapshots."""
+        with self._locked():
+            self._catch_up()
+            dossiers, buyers = self._read_snapshot()
+            records, _ = self._read_journal()
+            if not records:
+                return
+            dossiers, buyers = replay(dossiers, buyers, records)
+            # Snapshots first, journal last: a crash in between only leaves
+            # records that replay as no-ops on the new snapshot.
+            atomic_write_csv(dossiers, self.dossiers_path)
+            atomic_write_csv(buyers, self.buyers_path)
+            self._truncate_journal()
+            self._snapshot_sig = self._snapshot_signature()
+
+    def compact_in_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="achat-compaction", daemon=True)
+        self._compactor.start()
+
+    # --- Archiving ---
+    def archive(self, before):
+        self._frames()
+        with self._locked():
+            self._catch_up()
+            dossiers, buyers = self._dossiers, self._buyers
+            when = dossiers["Closed_Date"].fillna(dossiers["Assigned_Date"])
+            old = (dossiers["Status"].isin(TERMINAL_STATUSES) & (when < pd.Timestamp(before))).to_numpy()
+            archived = self._archive.id_index()
+            if archived is not None:
+                # Left in both places by a crash: the hot copy wins
+                stale = [i for i in dossiers["ID"] if isinstance(i, str) and archived.position(i) is not None]
+                if stale:
+                    self._archive.discard(stale)
+            if not old.any():
+                return 0
+            # Partitions first, hot snapshot last: a crash in between leaves
+            # the dossiers in both places, and the next run finishes the move
+            self._archive.add(dossiers[old])
+            hot = dossiers[~old].reset_index(drop=True)
+            atomic_write_csv(hot, self.dossiers_path)
+            atomic_write_csv(buyers, self.buyers_path)
+            self._truncate_journal()
+            self._snapshot_sig = self._snapshot_signature()
+            self._set_frames(hot, buyers)
+        return int(old.sum())
+
+    def archive_summary(self):
+        return self._archive.monthly_counts()
+
+    def archived(self, columns):
+        return self._archive.columns(columns)
+
+    # --- Queries ---
+    def buyers(self):
+        return self._frames()[1]
+
+    def all_dossiers(self):
+        # The archive, oldest, comes first in table order
+        hot = self._frames()[0]
+        return concat_dossiers([self._archive.all(), hot]) if self._archive.manifest() else hot
+
+    def count_dossiers(self, status=None, buyer=None):
+        dossiers = self._frames()[0]
+        statuses = [status] if isinstance(status, str) else status
+        # Archived counts come from the manifest, without reading a partition
+        archived = self._archive.count(buyer, statuses)
+        if buyer is not None:
+            return archived + self._partitions.count(buyer, statuses)
+        if statuses is None:
+            return archived + len(dossiers)
+        return archived + int(dossiers["Status"].isin(statuses).sum())
+
+    def get_dossier(self, dossier_id):
+        dossiers = self._frames()[0]
+        pos = self._ids.position(dossier_id)
+        return dossiers.iloc[pos] if pos is not None else self._archive.get(dossier_id)
+
+    def _find_hot(self, buyer, statuses, offset, limit):
+        dossiers = self._frames()[0]
+        end = None if limit is None else offset + limit
+        if buyer is not None:
+            return dossiers.iloc[self._partitions.positions(buyer, statuses, offset, limit)].copy()
+        if statuses is None:
+            return dossiers.iloc[offset:end].copy()
+        return dossiers[dossiers["Status"].isin(statuses)].iloc[offset:end].copy()
+
+    def find_dossiers(self, buyer=None, statuses=None, offset=0, limit=None):
+        self._frames()
+        archived = self._archive.count(buyer, statuses)
+        if offset >= archived:
+            # Open dossiers and pages past the archive never read a partition
+            return self._find_hot(buyer, statuses, offset - archived, limit)
+        cold = self._archive.find(buyer, statuses, offset, limit)
+        rest = None if limit is None else limit - len(cold)
+        if rest == 0:
+            return cold
+        return concat_dossiers([cold, self._find_hot(buyer, statuses, 0, rest)]).reset_index(drop=True)
+
+    def dossier_ids(self):
+        hot = self._frames()[0]["ID"].tolist()
+        archived = self._archive.id_index()
+        return (archived.with_prefix("")[::-1] + hot) if archived is not None else hot
+
+    def ids_with_prefix(self, prefix, offset=0, limit=None):
+        self._frames()
+        archived = self._archive.id_index(prefix)
+        if archived is None:
+            return self._ids.with_prefix(prefix, offset, limit)
+        end = None if limit is None else offset + limit
+        merged = heapq.merge(self._ids.with_prefix(prefix, 0, end), archived.with_prefix(prefix, 0, end), reverse=True)
+        return list(islice(merged, offset, end))
+
+    def count_ids_with_prefix(self, prefix):
+        self._frames()
+        archived = self._archive.id_index(prefix)
+        return self._ids.count_prefix(prefix) + (archived.count_prefix(prefix) if archived is not None else 0)
+
+    # --- Sequences ---
+    def reserve_sequence(self, key, n, seed):
+        with self._locked():
+            try:
+                with open(self.sequences_path, encoding="utf-8") as handle:
+                    sequences = json.load(handle)
+            except (OSError, ValueError):
+                sequences = {}
+            last = sequences[key] if key in sequences else seed()
+            sequences[key] = last + n
+            tmp_path = f"{self.sequences_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(sequences, handle)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self.sequences_path)
+        return last + 1
+
+    def open_workload(self):
+        dossiers = self._frames()[0]
+        counts = dossiers.loc[dossiers["Status"] == "Open", "Buyer"].value_counts()
+        # Categorical counts include every known buyer, even at zero
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(object)
+        return counts.rename_axis(None)
+
+    def last_assignment(self):
+        dossiers = self._frames()[0]
+        open_files = dossiers[dossiers["Status"] == "Open"].dropna(subset=["Assigned_Date"])
+        if open_files.empty:
+            return pd.Series(dtype="datetime64[ns]")
+        return open_files.groupby("Buyer", observed=True)["Assigned_Date"].max()
+
+    def memory_usage(self):
+        dossiers, buyers = self._frames()
+        return {
+            "dossiers": int(dossiers.memory_usage(deep=True).sum()),
+            "buyers": int(buyers.memory_usage(deep=True).sum()),
+        }
+
+
+# --- JOURNAL REPLAY ---
+def replay(dossiers, buyers, records):
+    """Apply journal ``records`` on top of snapshot frames."""
+    if not records:
+        return dossiers, buyers
+
+    known_ids = set(dossiers["ID"].astype(str))
+    new_dossiers = {}
+    snapshot_updates = {}
+    known_buyers = set(buyers["Name"].astype(str))
+    new_buyers = []
+    buyer_updates = {}
+
+    for record in records:
+        op = record.get("op")
+        if op in ("add_dossier", "restore_dossier"):
+            row = record["row"]
+            if row["ID"] not in known_ids and row["ID"] not in new_dossiers:
+                new_dossiers[row["ID"]] = dict(row)
+        elif op == "update_dossier":
+            if record["id"] in new_dossiers:
+                new_dossiers[record["id"]].update(record["changes"])
+            elif record["id"] in known_ids:
+                snapshot_updates.setdefault(record["id"], {}).update(record["changes"])
+        elif op == "add_buyer":
+            row = record["row"]
+            if row["Name"] not in known_buyers:
+                known_buyers.add(row["Name"])
+                new_buyers.append(row)
+        elif op == "update_buyer":
+            buyer_updates.setdefault(record["name"], {}).update(record["changes"])
+
+    if snapshot_updates:
+        dossiers = dossiers.copy()
+        # Updated columns are set as plain objects, then typed again below
+        for col in {col for changes in snapshot_updates.values() for col in changes}:
+            dossiers[col] = dossiers[col].astype(object) if col in dossiers.columns else None
+        positions = pd.Index(dossiers["ID"].astype(str)).get_indexer(list(snapshot_updates))
+        for pos, changes in zip(positions, snapshot_updates.values()):
+            for col, value in changes.items():
+                dossiers.iat[pos, dossiers.columns.get_loc(col)] = value
+
+        apply_schema(dossiers)
+
+    if new_dossiers:
+        dossiers = concat_dossiers([dossiers, dossiers_frame(new_dossiers.values())])
+
+    if new_buyers:
+        buyers = apply_buyer_schema(pd.concat([buyers, pd.DataFrame(new_buyers)], ignore_index=True))
+    if buyer_updates:
+        buyers = buyers.copy()
+        for name, changes in buyer_updates.items():
+            mask = (buyers["Name"] == name).to_numpy()
+            for col, value in changes.items():
+                buyers.loc[mask, col] = value
+        apply_buyer_schema(buyers)
+
+    return dossiers, buyers
+
+
+# --- SQLITE STORE ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dossiers (
+    ID TEXT PRIMARY KEY,
+    Description TEXT,
+    Category TEXT,
+    Urgency TEXT,
+    Buyer TEXT,
+    Status TEXT,
+    Assigned_Date TEXT,
+    Closed_Date TEXT,
+    Type_AO TEXT,
+    Devise TEXT,
+    Montant_Ajustement REAL,
+    Date_Ajustement TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_dossiers_buyer_status ON dossiers (Buyer, Status);
+CREATE INDEX IF NOT EXISTS idx_dossiers_status_buyer_date ON dossiers (Status, Buyer, Assigned_Date);
+CREATE INDEX IF NOT EXISTS idx_dossiers_assigned_date ON dossiers (Assigned_Date);
+CREATE TABLE IF NOT EXISTS buyers (
+    Name TEXT PRIMARY KEY,
+    Email TEXT,
+    Capacity REAL NOT NULL DEFAULT 1,
+    Absences TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    Key TEXT PRIMARY KEY,
+    Last INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    Data TEXT NOT NULL
+);
+"""
+
+# Change records kept for the other processes' refresh(); older ones are pruned
+CHANGES_KEPT = 10000
+
+SQL_DOSSIER_COLUMNS = ALL_COLUMNS
+# Fixed-width text so that string order is chronological order
+SQL_DATE_FORMATS = {
+    "Assigned_Date": "%Y-%m-%d %H:%M:%S",
+    "Closed_Date": "%Y-%m-%d %H:%M:%S",
+    "Date_Ajustement": "%Y-%m-%d",
+}
+
+
+def _sql_value(col, value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if col in SQL_DATE_FORMATS:
+        if value == "":
+            return None
+        return pd.Timestamp(value).strftime(SQL_DATE_FORMATS[col])
+    if hasattr(value, "item"):  # numpy scalar
+        return value.item()
+    return value
+
+
+class SqliteStore(DossierStore):
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.db_path = os.path.join(data_dir, "achat.db")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._last_seq = 0       # latest change record applied or written
+        self._data_version = None
+        self._external = []
+
+    def init(self):
+        with self._lock, self._conn:
+            self._conn.executescript(SQLITE_SCHEMA)
+            self._last_seq = self._conn.execute("SELECT COALESCE(MAX(Seq), 0) FROM changes").fetchone()[0]
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            # Databases created before the capacity columns
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(buyers)")}
+            if "Capacity" not in columns:
+                self._conn.execute("ALTER TABLE buyers ADD COLUMN Capacity REAL NOT NULL DEFAULT 1")
+            if "Absences" not in columns:
+                self._conn.execute("ALTER TABLE buyers ADD COLUMN Absences TEXT NOT NULL DEFAULT ''")
+        # First start on an existing CSV dataset: import it once
+        if self.count_dossiers() == 0 and self.buyers().empty:
+            csv_store = CsvStore(self.data_dir)
+            if os.path.exists(csv_store.dossiers_path) or os.path.exists(csv_store.buyers_path):
+                # Archived dossiers too: load() only reads the hot table
+                dossiers, buyers = csv_store.all_dossiers(), csv_store.buyers()
+                if not dossiers.empty or not buyers.empty:
+                    self.save(dossiers, buyers)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def _dossiers_query(self, sql, params=()):
+        return apply_schema(self._query(sql, params))
+
+    def _scalar(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    # --- Full frames ---
+    def load(self):
+        return self.all_dossiers(), self.buyers()
+
+    def save(self, dossiers, buyers):
+        with self._write([{"op": "reload"}]):
+            self._conn.execute("DELETE FROM dossiers")
+            self._conn.execute("DELETE FROM buyers")
+            self._insert_dossiers(dossiers.to_dict("records"))
+            for row in buyers.to_dict("records"):
+                self._insert_buyer(row)
+
+    # --- Writing ---
+    @contextmanager
+    def _write(self, records):
+        """Transaction that also logs ``records`` for the other processes."""
+        with self._lock, self._conn:
+            # Write lock up front: nobody logs between our catch-up and our records
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._catch_up()
+            yield
+            ts = datetime.now().isoformat(timespec="seconds")
+            self._conn.executemany(
+                "INSERT INTO changes (Data) VALUES (?)",
+                [(json.dumps({"ts": ts, **record}, default=_json_default, ensure_ascii=False),) for record in records]
+            )
+            self._last_seq = self._conn.execute("SELECT MAX(Seq) FROM changes").fetchone()[0]
+            if self._last_seq // 1000 != (self._last_seq - len(records)) // 1000:
+                self._conn.execute("DELETE FROM changes WHERE Seq <= ?", (self._last_seq - CHANGES_KEPT,))
+
+    def _insert_dossiers(self, rows):
+        placeholders = ", ".join("?" for _ in SQL_DOSSIER_COLUMNS)
+        self._conn.executemany(
+            f"INSERT OR IGNORE INTO dossiers ({', '.join(SQL_DOSSIER_COLUMNS)}) VALUES ({placeholders})",
+            [[_sql_value(col, row.get(col)) for col in SQL_DOSSIER_COLUMNS] for row in rows]
+        )
+
+    def _insert_buyer(self, row):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO buyers (Name, Email, Capacity, Absences) VALUES (?, ?, ?, ?)",
+            (row["Name"], _sql_value("Email", row.get("Email")),
+             _sql_value("Capacity", row.get("Capacity")) or 1.0, _sql_value("Absences", row.get("Absences")) or "")
+        )
+
+    def append_dossiers(self, rows):
+        with self._write([{"op": "add_dossier", "row": row} for row in rows]):
+            self._insert_dossiers(rows)
+
+    def update_dossier(self, dossier_id, changes):
+        columns = [col for col in changes if col in SQL_DOSSIER_COLUMNS]
+        if not columns:
+            return
+        assignments = ", ".join(f"{col} = ?" for col in columns)
+        record = {"op": "update_dossier", "id": dossier_id, "changes": changes}
+        with self._write([record]):
+            cursor = self._conn.execute("SELECT * FROM dossiers WHERE ID = ?", (dossier_id,))
+            before = cursor.fetchone()
+            if before is not None:
+                record["before"] = dict(zip([d[0] for d in cursor.description], before))
+            self._conn.execute(
+                f"UPDATE dossiers SET {assignments} WHERE ID = ?",
+                [_sql_value(col, changes[col]) for col in columns] + [dossier_id]
+            )
+
+    def append_buyer(self, row):
+        with self._write([{"op": "add_buyer", "row": row}]):
+            self._insert_buyer(row)
+
+    def update_buyer(self, name, changes):
+        columns = [col for col in changes if col in BUYER_COLUMNS and col != "Name"]
+        if not columns:
+            return
+        with self._write([{"op": "update_buyer", "name": name, "changes": changes}]):
+            self._conn.execute(
+                f"UPDATE buyers SET {', '.join(f'{col} = ?' for col in columns)} WHERE Name = ?",
+                [_sql_value(col, changes[col]) for col in columns] + [name]
+            )
+
+    # --- Changes from other processes ---
+    def _catch_up(self):
+        rows = self._conn.execute("SELECT Seq, Data FROM changes WHERE Seq > ? ORDER BY Seq", (self._last_seq,)).fetchall()
+        if not rows:
+            return
+        records = [json.loads(data) for _, data in rows]
+        # Sequence numbers are contiguous: a gap means records we never saw were pruned
+        if rows[0][0] != self._last_seq + 1 or any(record["op"] == "reload" for record in records):
+            self._external = None
+        elif self._external is not None:
+            self._external.extend(record for record in records if record["op"] != "update_dossier" or "before" in record)
+        self._last_seq = rows[-1][0]
+
+    def refresh(self):
+        with self._lock:
+            # Changes only when another connection committed
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._catch_up()
+            external, self._external = self._external, []
+        return external
+
+    def generation(self):
+        # Latest change record applied or written (MAX(Seq) of the changes table)
+        with self._lock:
+            return self._last_seq
+
+    # --- Queries ---
+    def buyers(self):
+        return apply_buyer_schema(self._query(f"SELECT {', '.join(BUYER_COLUMNS)} FROM buyers ORDER BY rowid"))
+
+    def all_dossiers(self):
+        return self._dossiers_query("SELECT * FROM dossiers ORDER BY rowid")
+
+    def count_dossiers(self, status=None, buyer=None):
+        clauses, params = [], []
+        if status is not None:
+            statuses = [status] if isinstance(status, str) else status
+            clauses.append(f"Status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if buyer is not None:
+            clauses.append("Buyer = ?")
+            params.append(buyer)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._scalar(f"SELECT COUNT(*) FROM dossiers{where}", params)
+
+    def get_dossier(self, dossier_id):
+        match = self._dossiers_query("SELECT * FROM dossiers WHERE ID = ?", (dossier_id,))
+        return match.iloc[0] if not match.empty else None
+
+    def find_dossiers(self, buyer=None, statuses=None, offset=0, limit=None):
+        clauses, params = [], []
+        if buyer is not None:
+            clauses.append("Buyer = ?")
+            params.append(buyer)
+        if statuses is not None:
+            clauses.append(f"Status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._dossiers_query(
+            f"SELECT * FROM dossiers{where} ORDER BY rowid LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, offset]
+        )
+
+    def dossier_ids(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT ID FROM dossiers ORDER BY rowid")]
+
+    @staticmethod
+    def _prefix_clause(prefix):
+        # Range scan on the primary key index
+        if not prefix:
+            return "", []
+        return " WHERE ID >= ? AND ID < ?", [prefix, prefix_upper_bound(prefix)]
+
+    def ids_with_prefix(self, prefix, offset=0, limit=None):
+        where, params = self._prefix_clause(prefix)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT ID FROM dossiers{where} ORDER BY ID DESC LIMIT ? OFFSET ?",
+                params + [-1 if limit is None else limit, offset]
+            )
+            return [row[0] for row in rows]
+
+    def count_ids_with_prefix(self, prefix):
+        where, params = self._prefix_clause(prefix)
+        return self._scalar(f"SELECT COUNT(*) FROM dossiers{where}", params)
+
+    # --- Sequences ---
+    def reserve_sequence(self, key, n, seed):
+        with self._lock, self._conn:
+            # Take the write lock up front so concurrent processes serialize here
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT Last FROM sequences WHERE Key = ?", (key,)).fetchone()
+            last = row[0] if row is not None else seed()
+            self._conn.execute(
+                "INSERT INTO sequences (Key, Last) VALUES (?, ?) "
+                "ON CONFLICT (Key) DO UPDATE SET Last = excluded.Last",
+                (key, last + n)
+            )
+        return last + 1
+
+    def open_workload(self):
+        df = self._query(
+            "SELECT Buyer, COUNT(*) AS count FROM dossiers WHERE Status = 'Open' GROUP BY Buyer"
+        )
+        return df.set_index("Buyer")["count"].rename_axis(None)
+
+    def last_assignment(self):
+        df = self._query(
+            "SELECT Buyer, MAX(Assigned_Date) AS Assigned_Date FROM dossiers "
+            "WHERE Status = 'Open' AND Assigned_Date IS NOT NULL GROUP BY Buyer"
+        )
+        return parse_dates(df.set_index("Buyer")["Assigned_Date"]).rename_axis(None)
+
+
+def open_store(backend=STORAGE_BACKEND, data_dir=DATA_DIR):
+    """Instantiate the configured storage backend (``csv`` or ``sqlite``)."""
+    if backend == "sqlite":
+        return SqliteStore(data_dir)
+    if backend == "csv":
+        return CsvStore(data_dir)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
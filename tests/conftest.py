@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+
+
+@pytest.fixture
+def make_state(tmp_path):
+    """Factory of states on ``tmp_path`` (same directory: several processes' view)."""
+    def make(backend="csv", buyers=("Alice", "Bob", "Chloé")):
+        state = engine.open_state(backend, str(tmp_path))
+        for name in buyers:
+            if name not in state.store.buyers()["Name"].values:
+                engine.add_buyer(state, name)
+        return state
+    return make
+
+
+@pytest.fixture
+def state(make_state):
+    return make_state()
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import engine
+from storage import open_store
+
+RECENT = (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d %H:%M")
+KPI_FIELDS = ("created_day", "created_week", "closed_day", "closed_week",
+              "lead_counts", "lead_sum", "backlog", "categories")
+
+
+@pytest.fixture
+def seeded(make_state, tmp_path):
+    """Five dossiers: closed and cancelled long ago, open long ago, closed and open recently."""
+    state = make_state(buyers=("Alice", "Bob"))
+    ids = [engine.create_dossier(state, f"Demande {word}", category=category)["ID"]
+           for word, category in [("écran", "IT"), ("chaises", "Autre"), ("serveur", "IT"),
+                                  ("clavier", "IT"), ("bureaux", "Autre")]]
+    # Another process backdates them
+    store = open_store("csv", str(tmp_path))
+    store.init()
+    store.update_dossier(ids[0], {"Status": "Closed", "Assigned_Date": "2024-01-02 09:00", "Closed_Date": "2024-01-10 17:00"})
+    store.update_dossier(ids[1], {"Status": "Cancelled", "Assigned_Date": "2024-02-01 09:00", "Closed_Date": ""})
+    store.update_dossier(ids[2], {"Assigned_Date": "2024-01-05 09:00"})
+    store.update_dossier(ids[3], {"Status": "Closed", "Assigned_Date": RECENT, "Closed_Date": RECENT})
+    return make_state(buyers=("Alice", "Bob")), ids
+
+
+def _kpi(state):
+    return {name: getattr(state.kpi, name) for name in KPI_FIELDS}
+
+
+def test_only_terminal_dossiers_older_than_the_limit_are_archived(seeded):
+    state, ids = seeded
+    assert engine.archive_dossiers(state, days=90) == 2
+    assert state.store.load()[0]["ID"].tolist() == ids[2:]
+    assert sorted(state.store.archived(["ID"])["ID"]) == sorted(ids[:2])
+    # Still readable one by one
+    assert state.store.get_dossier(ids[0])["Status"] == "Closed"
+    assert engine.archive_dossiers(state, days=90) == 0
+
+
+def test_an_archived_dossier_that_changes_goes_back_to_the_hot_table(seeded, make_state):
+    state, ids = seeded
+    engine.archive_dossiers(state, days=90)
+    engine.update_status(state, ids[0], "Open")
+
+    assert ids[0] in state.store.load()[0]["ID"].values
+    assert ids[0] not in state.store.archived(["ID"])["ID"].values
+    # A fresh process sees it once, with its new status
+    other = make_state(buyers=("Alice", "Bob"))
+    assert other.store.all_dossiers()["ID"].tolist().count(ids[0]) == 1
+    assert other.store.get_dossier(ids[0])["Status"] == "Open"
+    assert engine.stats(other)["total"] == 5
+
+
+def test_counts_and_pages_span_the_hot_and_cold_tables(seeded):
+    state, ids = seeded
+    before_stats = engine.stats(state)
+    before_counts = {(status, buyer): state.store.count_dossiers(status=status, buyer=buyer)
+                     for status in (None, "Open", "Closed", "Cancelled") for buyer in (None, "Alice", "Bob")}
+    before_search = engine.search_dossiers(state, "demande")[0]
+
+    engine.archive_dossiers(state, days=90)
+
+    assert engine.stats(state) == before_stats
+    assert {key: state.store.count_dossiers(status=key[0], buyer=key[1]) for key in before_counts} == before_counts
+    pages = [state.store.find_dossiers(offset=offset, limit=2)["ID"].tolist() for offset in (0, 2, 4)]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == sorted(ids)
+    for buyer in ("Alice", "Bob"):
+        closed = state.store.find_dossiers(buyer=buyer, statuses=["Closed", "Cancelled"])
+        assert len(closed) == before_counts[("Closed", buyer)] + before_counts[("Cancelled", buyer)]
+    assert engine.search_dossiers(state, "demande")[0] == before_search == 5
+    assert engine.search_dossiers(state, "écran")[1]["ID"].tolist() == [ids[0]]
+
+
+def test_archiving_leaves_the_kpi_rollups_unchanged(seeded, make_state):
+    state, _ = seeded
+    before = _kpi(state)
+    engine.archive_dossiers(state, days=90)
+    state.sync()
+    assert _kpi(state) == before
+    assert _kpi(make_state(buyers=("Alice", "Bob"))) == before
@@ -0,0 +1,117 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+from batch import (buyer_arrays, greedy_assign, import_batch, sequential_greedy, validate_batch,
+                   validate_requests)
+
+
+def make_batch(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return validate_batch(pd.DataFrame({
+        "Description": [f"Demande {i}" for i in range(n)],
+        "Category": rng.choice(engine.CATEGORIES, n),
+        "Urgency": rng.choice(engine.URGENCIES, n),
+        "Type_AO": rng.choice(["", "AO Ouvert", "AO fermé"], n),
+    }))
+
+
+def test_sequential_greedy_matches_one_assignment_per_request(state):
+    engine.update_buyer(state, "Bob", 0.5, "")
+    engine.update_buyer(state, "Chloé", 2.0, "")
+    engine.create_dossier(state, "Déjà ouvert", "Service", "Élevée")
+    batch = make_batch(40)
+    costs = state.costs.costs(batch)
+    # As in import_batch(): the batch is dated now, after the open dossiers
+    assigned_date = datetime.now().strftime("%Y-%m-%d %H:%M")
+    now_ns = pd.Timestamp(assigned_date).value
+    buyers = buyer_arrays(state.workload, now_ns)
+    expected = list(buyers[0][sequential_greedy(costs, buyers, now_ns)])
+
+    # The same requests through the workload index, one pick and update each
+    picked = []
+    for cost in costs:
+        name = state.workload.pick(now_ns)
+        state.workload.on_create(name, assigned_date, cost=cost)
+        picked.append(name)
+    assert picked == expected
+
+
+def test_greedy_assign_skips_absent_buyers(state):
+    engine.update_buyer(state, "Alice", 1.0, "2000-01-01:2100-01-01")
+    now_ns = pd.Timestamp("2025-06-01").value
+    buyers = buyer_arrays(state.workload, now_ns)
+    positions = greedy_assign(np.arange(6), np.ones(6), buyers, now_ns)
+    assert "Alice" not in set(buyers[0][positions])
+
+
+def test_import_batch_balances_the_load(state):
+    rows, report = import_batch(state, make_batch(90, seed=1))
+    assert len(rows) == 90 and rows["ID"].is_unique
+    assert state.store.count_dossiers() == 90
+    assert report["batch"]["load_spread"] <= report["sequential"]["load_spread"] + 3
+    loads = state.workload.weighted_workload()
+    assert loads.max() - loads.min() <= 3
+
+
+def test_import_batch_refuses_used_ids(state):
+    dossier_id = engine.create_dossier(state, "Écran")["ID"]
+    batch = make_batch(2)
+    batch["ID"] = [dossier_id, ""]
+    with pytest.raises(ValueError, match="déjà utilisés"):
+        import_batch(state, batch)
+    assert state.store.count_dossiers() == 1
+
+
+@pytest.mark.parametrize("bad, message", [
+    ({"Date_Ajustement": "demain"}, "Date d'ajustement invalide aux lignes 2 : demain"),
+    ({"Devise": "Yen"}, "Devise inconnue aux lignes 2 : Yen"),
+    ({"Category": "Divers"}, "Catégorie inconnue aux lignes 2 : Divers"),
+    ({"Type_AO": "AO restreint"}, "Type d'AO inconnu aux lignes 2 : AO restreint"),
+    ({"Urgency": "Urgente"}, "Urgence inconnue aux lignes 2 : Urgente"),
+    ({"Description": " "}, "Description vide aux lignes : 2"),
+])
+def test_frames_and_requests_are_validated_alike(bad, message):
+    requests = [{"Description": "Écran"}, {"Description": "Clavier", **bad}]
+    with pytest.raises(ValueError, match=message):
+        validate_batch(pd.DataFrame(requests))
+    with pytest.raises(ValueError, match=message):
+        validate_requests(requests)
+
+
+def test_adjustment_dates_are_normalized():
+    requests = [{"Description": "Écran", "Date_Ajustement": "2025-06-01T10:30"}, {"Description": "Clavier"}]
+    assert validate_batch(pd.DataFrame(requests))["Date_Ajustement"].tolist() == ["2025-06-01", ""]
+    assert [row["Date_Ajustement"] for row in validate_requests(requests)] == ["2025-06-01", ""]
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_validated_batch_is_written_by_every_backend(make_state, backend):
+    state = make_state(backend)
+    batch = validate_batch(pd.DataFrame({
+        "Description": ["Écran", "Clavier"], "Devise": ["EUR", ""], "Date_Ajustement": ["2025-06-01", ""],
+    }))
+    import_batch(state, batch)
+    dates = state.store.all_dossiers()["Date_Ajustement"]
+    assert dates.iloc[0] == pd.Timestamp("2025-06-01") and pd.isna(dates.iloc[1])
+
+
+def test_allocated_ids_avoid_the_manual_ids_of_the_batch(state):
+    next_id = state.ids.allocate(1)[0]
+    following = next_id[:-3] + f"{int(next_id[-3:]) + 1:03d}"
+    batch = make_batch(2)
+    batch["ID"] = [following, ""]
+    rows, _ = import_batch(state, batch)
+    assert rows["ID"].is_unique and following in set(rows["ID"])
+    assert state.store.count_dossiers() == 2
+
+
+def test_colliding_allocated_ids_are_refused(state, monkeypatch):
+    dossier_id = engine.create_dossier(state, "Écran")["ID"]
+    monkeypatch.setattr(state.ids, "allocate", lambda n, day=None, taken=(): [dossier_id] * n)
+    with pytest.raises(ValueError, match="déjà utilisés"):
+        import_batch(state, make_batch(1))
+    assert state.store.count_dossiers() == 1
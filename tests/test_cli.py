@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import achat_cli
+import engine
+
+
+def run(tmp_path, capsys, *argv):
+    code = achat_cli.main(["--data-dir", str(tmp_path), *argv])
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def test_assign_prints_the_new_dossier(make_state, tmp_path, capsys):
+    make_state()
+    code, out, _ = run(tmp_path, capsys, "assign", "Écran", "--devise", "EUR", "--montant", "12.5", "--json")
+    dossier = json.loads(out)
+    assert code == 0 and dossier["Devise"] == "EUR" and dossier["Buyer"] == "Alice"
+
+
+def test_assign_rejects_an_unknown_currency(make_state, tmp_path, capsys):
+    make_state()
+    with pytest.raises(SystemExit):
+        run(tmp_path, capsys, "assign", "Écran", "--devise", "XYZ")
+    assert "invalid choice" in capsys.readouterr().err
+    assert engine.open_state("csv", str(tmp_path)).store.count_dossiers() == 0
+
+
+def test_assign_rejects_a_blank_id(make_state, tmp_path, capsys):
+    make_state()
+    code, _, err = run(tmp_path, capsys, "assign", "Écran", "--id", " ")
+    assert code == 1 and "vide" in err
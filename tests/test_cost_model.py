@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import engine
+from cost_model import CostModel, parse_absences
+
+
+def _counts(state):
+    return state.store.find_dossiers()["Buyer"].astype(object).value_counts().to_dict()
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_half_capacity_gets_about_half_the_load(make_state, backend):
+    state = make_state(backend, buyers=("Alice", "Bob"))
+    engine.update_buyer(state, "Alice", 0.5)
+    for n in range(30):
+        engine.create_dossier(state, f"Demande {n}", urgency=["Élevée", "Moyenne", "Faible"][n % 3])
+    counts = _counts(state)
+    assert abs(counts["Alice"] - 10) <= 1 and counts["Alice"] + counts["Bob"] == 30
+    weighted = engine.stats(state)["weighted_workload"]
+    assert abs(weighted["Alice"] - weighted["Bob"]) <= 2 / 0.5
+
+
+def test_a_buyer_absent_today_is_never_picked(make_state):
+    state = make_state()
+    today = date.today()
+    engine.update_buyer(state, "Chloé", 1.0, f"{today - timedelta(days=3)}:{today}")
+    for n in range(12):
+        engine.create_dossier(state, f"Demande {n}")
+    assert "Chloé" not in _counts(state)
+
+    # Back from leave: she is the least loaded one
+    engine.update_buyer(state, "Chloé", 1.0, f"{today - timedelta(days=10)}:{today - timedelta(days=1)}")
+    assert engine.create_dossier(state, "Demande 12")["Buyer"] == "Chloé"
+
+
+def test_everyone_absent_still_assigns(make_state):
+    state = make_state(buyers=("Alice", "Bob"))
+    for name in ("Alice", "Bob"):
+        engine.update_buyer(state, name, 1.0, "2000-01-01:2100-12-31")
+    assert engine.create_dossier(state, "Écran")["Buyer"] in ("Alice", "Bob")
+
+
+def test_absence_periods_are_parsed_with_the_end_day_included():
+    windows = parse_absences(" 2025-08-01:2025-08-15 ; 2025-12-25 ;")
+    assert windows == [
+        (pd.Timestamp("2025-08-01").value, pd.Timestamp("2025-08-16").value),
+        (pd.Timestamp("2025-12-25").value, pd.Timestamp("2025-12-26").value),
+    ]
+    assert parse_absences("") == parse_absences(None) == []
+
+
+@pytest.mark.parametrize("text", [
+    "2025-08-15:2025-08-01", "2025-13-01:2025-13-05", "demain", "2025-08-01:fin", "2025-08-01:2025-08-15;août",
+])
+def test_malformed_absence_periods_are_rejected(make_state, text):
+    with pytest.raises(ValueError, match="Période d'absence invalide"):
+        parse_absences(text)
+    state = make_state()
+    with pytest.raises(ValueError, match="Période d'absence invalide"):
+        engine.update_buyer(state, "Alice", 1.0, text)
+    absences = state.store.buyers().set_index("Name").loc["Alice", "Absences"]
+    assert pd.isna(absences) or absences == ""
+
+
+@pytest.mark.parametrize("capacity", [0, -1, "beaucoup"])
+def test_capacity_must_be_positive(state, capacity):
+    with pytest.raises(ValueError):
+        engine.update_buyer(state, "Alice", capacity)
+
+
+def test_dossier_cost_is_the_product_of_its_weights():
+    model = CostModel({"Urgency": {"Élevée": 3}})
+    assert model.cost("Élevée", "Informatique", "AO Ouvert") == pytest.approx(3 * 1.2 * 2.0)
+    assert model.cost("Inconnue", "Inconnue", None) == 1.0
+    with pytest.raises(ValueError, match="Pondération inconnue"):
+        CostModel({"Couleur": {}})
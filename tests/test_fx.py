@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import fx
+from schema import dossiers_frame
+
+
+def dossier(dossier_id, buyer, devise, amount, assigned="2025-03-01 10:00"):
+    return {"ID": dossier_id, "Buyer": buyer, "Category": "Service", "Status": "Open",
+            "Devise": devise, "Montant_Ajustement": amount, "Assigned_Date": assigned}
+
+
+def test_currencies_are_matched_like_the_rates(tmp_path):
+    pd.DataFrame({"Date": ["2025-01-01"], "Devise": [" autre "], "Taux": [2.0]}).to_csv(fx.rates_path(tmp_path), index=False)
+    dossiers = dossiers_frame([dossier("A", "Alice", "Autre", 10.0), dossier("B", "Bob", "mad", 3.0)])
+    assert fx.to_mad(dossiers, fx.load_rates(tmp_path)).tolist() == [20.0, 3.0]
+
+
+def test_dossiers_without_rate_are_reported_in_the_totals(tmp_path):
+    dossiers = dossiers_frame([
+        dossier("A", "Alice", "EUR", 10.0),
+        dossier("B", "Bob", "Autre", 5.0),
+        dossier("C", "Bob", "USD", 2.0, assigned="2025-04-01 10:00"),
+    ])
+    mad = fx.to_mad(dossiers, fx.load_rates(tmp_path))
+    assert pd.isna(mad[1])
+    totals = fx.totals(dossiers, mad)
+    assert totals["buyer"].loc["Bob"].tolist() == [20.2, 1]
+    assert totals["month"].loc["2025-03"].tolist() == [105.0, 1]
+    assert totals["category"]["Sans_taux"].sum() == 1
+    assert totals["unconverted_dossiers"]["ID"].tolist() == ["B"]
+    assert totals["unconverted"].loc["Autre"].tolist() == [1, 5.0]
+
+
+@pytest.mark.parametrize("content, message", [
+    ("", "illisible"),
+    ("Date,Devise,Taux\n", "aucun taux"),
+    ("Date;Devise;Taux\n2025-01-01;EUR;10.5\n", "colonnes manquantes"),
+    ('Date,Devise,Taux\n2025-01-01,EUR,10.5\n"2025-02-01,USD\n', "illisible"),
+    ("Date,Devise,Taux\n2025-01-01,EUR,10.5\nhier,USD,10\n2025-01-01,GBP,\n", "ligne\\(s\\) 3, 4"),
+])
+def test_an_unusable_rate_file_is_an_error_not_the_defaults(tmp_path, content, message):
+    with open(fx.rates_path(tmp_path), "w", encoding="utf-8") as handle:
+        handle.write(content)
+    with pytest.raises(ValueError, match=message):
+        fx.load_rates(tmp_path)
+
+
+def test_default_rates_without_a_rate_file(tmp_path):
+    rates = fx.load_rates(tmp_path)
+    assert set(rates["Devise"]) == {"EUR", "USD", "GBP", "MAD"}
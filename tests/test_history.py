@@ -0,0 +1,77 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import engine
+import history
+import kpi
+
+
+def _open_counts(state):
+    return {name: n for name, n in engine.stats(state)["workload"].items() if n}
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_create_reassign_close_is_recorded_in_order(make_state, backend):
+    state = make_state(backend)
+    dossier = engine.create_dossier(state, "Écran", category="IT", actor="amine")
+    first = dossier["Buyer"]
+    other = next(name for name in ("Alice", "Bob") if name != first)
+    engine.reassign_dossier(state, dossier["ID"], other, "Congés", actor="amine")
+    engine.update_status(state, dossier["ID"], "Closed", "Livré", actor="sara")
+
+    events = engine.dossier_history(state, dossier["ID"])
+    assert events["Type"].tolist() == [
+        "created", "assigned", "unassigned", "assigned", "comment", "status_changed", "comment"
+    ]
+    assert events["Buyer"].tolist() == [first, first, first, other, other, other, other]
+    assert events["Actor"].tolist() == ["amine"] * 5 + ["sara"] * 2
+    assert events["Detail"].tolist()[2:] == [f"{first} → {other}", f"{first} → {other}", "Congés", "Open → Closed", "Livré"]
+    assert events["Ts"].is_monotonic_increasing
+    assert state.events.current_workload().to_dict() == _open_counts(state) == {}
+
+
+@pytest.mark.parametrize("snapshot_every", [history.SNAPSHOT_EVERY, 3])
+def test_workload_as_of_matches_the_open_counts_at_that_time(make_state, monkeypatch, snapshot_every):
+    monkeypatch.setattr(history, "SNAPSHOT_EVERY", snapshot_every)
+    state = make_state()
+    ids = [engine.create_dossier(state, f"Demande {n}")["ID"] for n in range(6)]
+    engine.update_status(state, ids[0], "Closed")
+    engine.reassign_dossier(state, ids[1], "Chloé" if state.store.get_dossier(ids[1])["Buyer"] != "Chloé" else "Alice")
+
+    time.sleep(0.01)
+    then = datetime.now()
+    expected = _open_counts(state)
+    time.sleep(0.01)
+
+    engine.update_status(state, ids[2], "Cancelled")
+    engine.reassign_dossier(state, ids[3], "Bob" if state.store.get_dossier(ids[3])["Buyer"] != "Bob" else "Alice")
+    engine.update_status(state, ids[0], "Open")
+    engine.create_dossier(state, "Demande 6")
+
+    assert engine.workload_as_of(state, then).to_dict() == expected
+    assert engine.workload_as_of(state, datetime.now()).to_dict() == _open_counts(state)
+    assert state.events.current_workload().to_dict() == _open_counts(state)
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_a_reassignment_moves_the_dossier_in_every_index(make_state, backend):
+    state, other = make_state(backend, buyers=("Alice", "Bob")), make_state(backend, buyers=("Alice", "Bob"))
+    ids = [engine.create_dossier(state, f"Imprimante {n}")["ID"] for n in range(3)]
+    engine.add_buyer(state, "Chloé")
+    engine.update_status(state, ids[0], "Closed")
+    engine.search_dossiers(other, "imprimante")  # builds the other process' index
+    for dossier_id in ids[:2]:
+        engine.reassign_dossier(state, dossier_id, "Chloé")
+    with pytest.raises(ValueError, match="Acheteur inconnu"):
+        engine.reassign_dossier(state, ids[2], "Nobody")
+
+    other.sync()
+    for each in (state, other):
+        assert sorted(engine.search_dossiers(each, "imprimante", buyer="Chloé")[1]["ID"]) == sorted(ids[:2])
+        fresh = kpi.KpiRollups.build(each.store.all_dossiers())
+        assert {name: getattr(each.kpi, name) for name in ("created_day", "closed_day")} == \
+               {name: getattr(fresh, name) for name in ("created_day", "closed_day")}
+        assert each.workload.workload().to_dict() == each.store.open_workload().reindex(
+            ["Alice", "Bob", "Chloé"], fill_value=0).to_dict()
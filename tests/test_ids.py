@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import engine
+from batch import import_batch, validate_batch
+from ids import format_dossier_id
+
+
+def today():
+    return datetime.now().strftime("%Y%m%d")
+
+
+def test_ids_follow_the_day_sequence(state):
+    first = engine.create_dossier(state, "Écran")["ID"]
+    second = engine.create_dossier(state, "Clavier")["ID"]
+    assert (first, second) == (format_dossier_id(today(), 1), format_dossier_id(today(), 2))
+
+
+def test_manual_ids_are_not_handed_out_again(state):
+    # Entered by hand before the first allocation of the day: the sequence starts after it
+    engine.create_dossier(state, "Écran", dossier_id=format_dossier_id(today(), 5))
+    assert engine.create_dossier(state, "Clavier")["ID"] == format_dossier_id(today(), 6)
+    # Entered by hand ahead of the sequence: skipped when reached
+    engine.create_dossier(state, "Souris", dossier_id=format_dossier_id(today(), 7))
+    assert engine.create_dossier(state, "Câble")["ID"] == format_dossier_id(today(), 8)
+
+
+def test_manual_id_collision_is_refused(state):
+    dossier_id = engine.create_dossier(state, "Écran")["ID"]
+    with pytest.raises(ValueError):
+        engine.create_dossier(state, "Clavier", dossier_id=dossier_id)
+
+
+@pytest.mark.parametrize("blank", ["", "   ", "\t"])
+def test_blank_manual_id_is_refused(state, blank):
+    with pytest.raises(ValueError, match="ne peut pas être vide"):
+        engine.create_dossier(state, "Écran", dossier_id=blank)
+    assert state.store.count_dossiers() == 0
+    # Surrounding spaces of a real ID are dropped
+    assert engine.create_dossier(state, "Écran", dossier_id=" AO-17 ")["ID"] == "AO-17"
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_two_processes_never_get_the_same_id(make_state, backend):
+    first, second = make_state(backend), make_state(backend)
+    ids = first.ids.allocate(3) + second.ids.allocate(2) + first.ids.allocate(1)
+    assert len(set(ids)) == 6
+    assert ids == [format_dossier_id(today(), n) for n in range(1, 7)]
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_batch_ids_skip_a_manual_id_entered_after_the_first_allocation(make_state, backend):
+    state = make_state(backend)
+    assert engine.create_dossier(state, "Écran")["ID"] == format_dossier_id(today(), 1)
+    engine.create_dossier(state, "Clavier", dossier_id=format_dossier_id(today(), 2))
+    rows, _ = import_batch(state, validate_batch(pd.DataFrame({"Description": ["Souris", "Câble"]})))
+    assert rows["ID"].tolist() == [format_dossier_id(today(), 3), format_dossier_id(today(), 4)]
+    assert state.store.count_dossiers() == 4
+    assert make_state(backend).store.count_dossiers() == 4
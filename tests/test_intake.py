@@ -0,0 +1,183 @@
+import asyncio
+import json
+import sqlite3
+from http import HTTPStatus
+
+import pandas as pd
+import pytest
+
+import engine
+import intake
+from batch import import_batch
+from intake import IntakeQueue, IntakeService
+
+
+def requests(n, start=0):
+    return [{"Description": f"Demande {i}", "Urgency": "Moyenne"} for i in range(start, start + n)]
+
+
+def test_queue_survives_a_restart(state):
+    service = IntakeService(state)
+    rows = service._validate(requests(3))
+    service.queue.append(rows)
+
+    # Restart: the pending requests and their IDs are read back from the file
+    queue = IntakeQueue(state.store.data_dir)
+    assert queue.pending == 3
+    assert queue.queued_ids == {row["ID"] for row in rows}
+    read, end = queue.read(None)
+    assert [row["ID"] for row in read] == [row["ID"] for row in rows]
+    queue.commit(read, end)
+    assert IntakeQueue(state.store.data_dir).pending == 0
+
+
+def test_requests_imported_before_a_crash_are_not_imported_again(state):
+    service = IntakeService(state)
+    service.queue.append(service._validate(requests(4)))
+    rows, end = service.queue.read(None)
+    # Crash after the first two were persisted, before the offset was written
+    import_batch(state, pd.DataFrame(rows[:2]))
+
+    restarted = IntakeService(state)
+    assert restarted.queue.pending == 4
+    rows, end = restarted.queue.read(None)
+    assert restarted._import(rows) == 2
+    restarted.queue.commit(rows, end)
+    assert state.store.count_dossiers() == 4
+    assert sorted(state.store.dossier_ids()) == sorted(row["ID"] for row in rows)
+
+
+def test_offset_only_covers_complete_lines(state):
+    service = IntakeService(state)
+    service.queue.append(service._validate(requests(2)))
+    with open(service.queue.path, "ab") as handle:
+        handle.write(b'{"Description": "torn"')
+    rows, end = IntakeQueue(state.store.data_dir).read(None)
+    assert len(rows) == 2
+    with open(service.queue.path, "rb") as handle:
+        assert handle.read()[:end].endswith(b"\n")
+
+
+def drain(service, timeout=10.0):
+    """Run the worker until the queue is empty."""
+    async def run():
+        worker = asyncio.create_task(service.worker())
+        try:
+            for _ in range(int(timeout / 0.01)):
+                if not service.queue.pending:
+                    return
+                await asyncio.sleep(0.01)
+            raise TimeoutError("file non vidée")
+        finally:
+            worker.cancel()
+    asyncio.run(run())
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(intake, "RETRY_DELAY", 0.01)
+
+
+def test_invalid_submission_is_refused_with_400(state):
+    service = IntakeService(state)
+    body = json.dumps({"Description": "Écran", "Date_Ajustement": "demain"}).encode()
+    status, response, _ = asyncio.run(service._handle("POST", "/dossiers", body))
+    assert status == HTTPStatus.BAD_REQUEST and "Date d'ajustement invalide" in response["error"]
+    assert service.queue.pending == 0
+
+
+def test_faulty_request_goes_to_the_dead_letter_file(make_state, fast):
+    state = make_state("sqlite")
+    rows = IntakeService(state)._validate(requests(3))
+    # Queued by an older version, before the dates were validated
+    rows[1]["Date_Ajustement"] = "demain"
+    IntakeQueue(state.store.data_dir).append(rows)
+    service = IntakeService(state, batch_wait=0)
+    drain(service)
+
+    assert sorted(state.store.dossier_ids()) == sorted([rows[0]["ID"], rows[2]["ID"]])
+    with open(service.queue.dead_path, encoding="utf-8") as handle:
+        dead = [json.loads(line) for line in handle]
+    assert [entry["row"]["ID"] for entry in dead] == [rows[1]["ID"]]
+    assert dead[0]["error"]
+    assert service.status()["rejected"] == 1 and service.status()["processed"] == 2
+    assert IntakeQueue(state.store.data_dir).dead == 1
+
+
+def test_storage_errors_are_retried(state, fast, monkeypatch):
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    def flaky_import(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return import_batch(*args, **kwargs)
+
+    monkeypatch.setattr(intake, "import_batch", flaky_import)
+    IntakeQueue(state.store.data_dir).append(IntakeService(state)._validate(requests(2)))
+    service = IntakeService(state, batch_wait=0)
+    drain(service)
+    assert state.store.count_dossiers() == 2
+    assert service.queue.dead == 0
+
+
+def test_requests_wait_for_a_buyer(make_state, fast):
+    state = make_state(buyers=())
+    IntakeQueue(state.store.data_dir).append(IntakeService(state)._validate(requests(1)))
+    service = IntakeService(state, batch_wait=0)
+
+    async def run():
+        worker = asyncio.create_task(service.worker())
+        await asyncio.sleep(0.1)
+        assert service.queue.pending == 1 and "Aucun acheteur" in service.last_error
+        await asyncio.to_thread(engine.add_buyer, state, "Alice")
+        for _ in range(500):
+            if not service.queue.pending:
+                break
+            await asyncio.sleep(0.01)
+        worker.cancel()
+    asyncio.run(run())
+    assert state.store.count_dossiers() == 1 and service.queue.dead == 0
+
+
+@pytest.mark.parametrize("length, status", [("abc", 400), ("-5", 400), ("\xb2", 400), (str(intake.MAX_BODY + 1), 413)])
+def test_bad_content_length_is_answered(state, length, status):
+    service = IntakeService(state)
+
+    async def run():
+        server = await asyncio.start_server(service.connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"POST /dossiers HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    assert asyncio.run(run()).startswith(f"HTTP/1.1 {status} ".encode())
+
+
+def test_allocated_ids_skip_queued_and_given_ids(state):
+    service = IntakeService(state)
+    next_id = state.ids.allocate(1)[0]
+    following = next_id[:-3] + f"{int(next_id[-3:]) + 1:03d}"
+    rows = service._validate([{"Description": "A", "ID": following}, {"Description": "B"}])
+    service.queue.append(rows)
+    assert rows[1]["ID"] != following
+    later = service._validate(requests(1))
+    assert later[0]["ID"] not in service.queue.queued_ids
+
+
+def test_request_whose_id_was_taken_meanwhile_is_not_skipped(state, fast):
+    rows = IntakeService(state)._validate(requests(2))
+    IntakeQueue(state.store.data_dir).append(rows)
+    # Entered by hand with the ID already acknowledged to the ERP
+    engine.create_dossier(state, "Autre chose", dossier_id=rows[0]["ID"])
+    service = IntakeService(state, batch_wait=0)
+    drain(service)
+    assert state.store.get_dossier(rows[1]["ID"])["Description"] == rows[1]["Description"]
+    with open(service.queue.dead_path, encoding="utf-8") as handle:
+        dead = [json.loads(line) for line in handle]
+    assert [entry["row"]["ID"] for entry in dead] == [rows[0]["ID"]]
+    assert "pris par un autre dossier" in dead[0]["error"]
@@ -0,0 +1,46 @@
+import pytest
+
+import engine
+import kpi
+from storage import open_store
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_saved_rollups_are_reused_at_the_same_generation(make_state, backend, monkeypatch):
+    state = make_state(backend)
+    engine.create_dossier(state, "Écran")
+    state.kpi.flush()
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError("rollups rebuilt")
+
+    monkeypatch.setattr(kpi.KpiRollups, "build", no_rebuild)
+    assert make_state(backend).kpi.categories == state.kpi.categories
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_rollups_are_rebuilt_after_writes_with_the_same_status_counts(make_state, backend, tmp_path):
+    state = make_state(backend)
+    first = engine.create_dossier(state, "Écran")["ID"]
+    second = engine.create_dossier(state, "Clavier")["ID"]
+    engine.update_status(state, first, "Closed")
+    state.kpi.flush()
+
+    # Another process swaps the closed dossier, without touching the rollups
+    store = open_store(backend, str(tmp_path))
+    store.init()
+    store.update_dossier(first, {"Status": "Open", "Closed_Date": ""})
+    store.update_dossier(second, {"Status": "Closed", "Closed_Date": "2025-06-02 10:00"})
+
+    buyer = store.get_dossier(second)["Buyer"]
+    assert make_state(backend).kpi.closed_day == {"2025-06-02": {buyer: 1}}
+
+
+def test_compaction_elsewhere_keeps_the_rollups_current(make_state):
+    state, other = make_state(), make_state()
+    engine.create_dossier(state, "Écran")
+    engine.create_dossier(other, "Clavier")
+    other.store.compact()
+    state.sync()
+    assert state.kpi.status_counts() == {"Open": 2}
+    assert state.kpi.matches(state.store)
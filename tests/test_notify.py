@@ -0,0 +1,133 @@
+import smtplib
+
+import pandas as pd
+import pytest
+
+import notify
+from notify import NotificationQueue, SmtpSender
+from smtp_stub import SmtpStub
+
+
+class FakeSender:
+    sender = "achat@test"
+
+    def __init__(self):
+        self.sent = []
+        self.fail = None  # exception raised by the next sends
+
+    def send_many(self, messages):
+        if self.fail is not None:
+            raise self.fail
+        self.sent.extend(messages)
+        return {}
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(notify, "DIGEST_DELAY", 0.0)
+    return NotificationQueue(str(tmp_path), sender=FakeSender())
+
+
+BUYERS = pd.DataFrame({"Name": ["Alice", "Bob", "Chloé"], "Email": ["alice@x", "bob@x", None]})
+
+
+def dossier(dossier_id, buyer):
+    return {"ID": dossier_id, "Description": f"Demande {dossier_id}", "Buyer": buyer,
+            "Category": "Service", "Urgency": "Moyenne", "Assigned_Date": "2025-06-01 10:00"}
+
+
+def make_due(queue):
+    queue._conn().execute("UPDATE outbox SET Due = 0 WHERE Status = 'pending'")
+
+
+def test_messages_of_one_buyer_are_sent_as_one_digest(queue):
+    assert queue.enqueue(BUYERS, [dossier("PR-1", "Alice"), dossier("PR-2", "Bob")]) == 2
+    assert queue.enqueue(BUYERS, [dossier("PR-3", "Alice")]) == 1
+    assert queue.drain() == 2
+    by_recipient = {email: message for email, message in queue.sender.sent}
+    assert set(by_recipient) == {"alice@x", "bob@x"}
+    assert by_recipient["alice@x"]["Subject"] == "2 nouveaux dossiers d'achat"
+    body = by_recipient["alice@x"].get_content()
+    assert "PR-1" in body and "PR-3" in body
+    assert queue.counts() == {"pending": 0, "sent": 3, "failed": 0}
+
+
+def test_buyer_without_email_is_skipped(queue):
+    assert queue.enqueue(BUYERS, [dossier("PR-1", "Chloé")]) == 0
+    assert queue.drain() == 0
+
+
+def test_failed_delivery_is_retried_with_backoff(queue):
+    queue.enqueue(BUYERS, [dossier("PR-1", "Alice")])
+    queue.sender.fail = smtplib.SMTPServerDisconnected("down")
+    assert queue.drain() == 0
+    due, attempts, error = queue._conn().execute("SELECT Due, Attempts, Error FROM outbox").fetchone()
+    assert attempts == 1 and "down" in error
+    assert due > notify.time.time() + notify.backoff(1) - 5
+    # Not due yet: nothing is claimed
+    assert queue.drain() == 0
+
+    queue.sender.fail = None
+    make_due(queue)
+    assert queue.drain() == 1
+    assert queue.counts()["sent"] == 1
+
+
+def test_message_fails_after_max_attempts(queue):
+    queue.enqueue(BUYERS, [dossier("PR-1", "Alice")])
+    queue.sender.fail = ConnectionRefusedError("refused")
+    for _ in range(notify.MAX_ATTEMPTS):
+        make_due(queue)
+        queue.drain()
+    assert queue.counts() == {"pending": 0, "sent": 0, "failed": 1}
+    assert queue.failures()[0][3] == notify.MAX_ATTEMPTS
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    assert notify.backoff(1) == notify.BACKOFF_BASE
+    assert notify.backoff(2) == 2 * notify.BACKOFF_BASE
+    assert notify.backoff(50) == notify.BACKOFF_MAX
+
+
+def smtp_queue(tmp_path, port):
+    sender = SmtpSender(host="127.0.0.1", port=port, user=None, sender="achat@test", starttls=False, timeout=5)
+    return NotificationQueue(str(tmp_path), sender=sender)
+
+
+def test_smtp_sender_delivers_one_digest_per_buyer(tmp_path, monkeypatch):
+    monkeypatch.setattr(notify, "DIGEST_DELAY", 0.0)
+    with SmtpStub() as stub:
+        queue = smtp_queue(tmp_path, stub.port)
+        queue.enqueue(BUYERS, [dossier("PR-1", "Alice"), dossier("PR-2", "Alice"), dossier("PR-3", "Bob")])
+        assert queue.drain() == 2
+    delivered = {recipients[0]: message for recipients, message in stub.messages}
+    assert set(delivered) == {"alice@x", "bob@x"}
+    assert "PR-2" in delivered["alice@x"].get_content()
+    assert queue.counts()["sent"] == 2
+
+
+def test_smtp_refused_recipient_is_retried_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(notify, "DIGEST_DELAY", 0.0)
+    with SmtpStub(refused={"bob@x"}) as stub:
+        queue = smtp_queue(tmp_path, stub.port)
+        queue.enqueue(BUYERS, [dossier("PR-1", "Alice"), dossier("PR-2", "Bob")])
+        assert queue.drain() == 1
+    assert [recipients for recipients, _ in stub.messages] == [["alice@x"]]
+    assert queue.counts() == {"pending": 1, "sent": 1, "failed": 0}
+
+
+def test_smtp_connection_failure_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(notify, "DIGEST_DELAY", 0.0)
+    stub = SmtpStub()
+    port = stub.port
+    stub.server.server_close()  # nothing listens on the port
+    queue = smtp_queue(tmp_path, port)
+    queue.enqueue(BUYERS, [dossier("PR-1", "Alice")])
+    assert queue.drain() == 0
+    attempts, error = queue._conn().execute("SELECT Attempts, Error FROM outbox").fetchone()
+    assert attempts == 1 and "ConnectionRefused" in error
+
+    with SmtpStub(port=port) as stub:
+        make_due(queue)
+        assert queue.drain() == 1
+    assert len(stub.messages) == 1 and queue.counts()["sent"] == 1
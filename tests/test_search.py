@@ -0,0 +1,91 @@
+import pytest
+
+import engine
+import search
+from storage import open_store
+
+
+def _ids(state, query, **filters):
+    total, page = engine.search_dossiers(state, query, **filters)
+    assert total == len(page)
+    return page["ID"].tolist() if total else []
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_accents_and_case_are_folded(make_state, backend):
+    state = make_state(backend)
+    wanted = engine.create_dossier(state, "Matériel ÉLECTRIQUE pour l'atelier")["ID"]
+    engine.create_dossier(state, "Chaises de bureau")
+    assert _ids(state, "materiel electrique") == [wanted]
+    assert _ids(state, "MATÉRIEL") == [wanted]
+    assert _ids(state, "Électrique") == [wanted]
+
+
+def test_the_last_word_also_matches_as_a_prefix(state):
+    wanted = engine.create_dossier(state, "Ordinateur portable")["ID"]
+    engine.create_dossier(state, "Ordonnance de fournitures")
+    assert _ids(state, "ordi") == [wanted]
+    assert len(_ids(state, "ord")) == 2
+    # Only the last word, and not once it is followed by a space
+    assert _ids(state, "ordi ") == []
+    assert _ids(state, "ordi portab") == [wanted]
+
+
+def test_ids_are_found_whole_and_by_prefix(state):
+    first = engine.create_dossier(state, "Écran")["ID"]
+    second = engine.create_dossier(state, "Clavier")["ID"]
+    assert _ids(state, first) == [first]
+    assert _ids(state, first.lower()) == [first]
+    assert sorted(_ids(state, first.rsplit("-", 1)[0])) == sorted([first, second])
+    manual = engine.create_dossier(state, "Souris", dossier_id="AO-2025-17")["ID"]
+    assert _ids(state, "AO-2025") == [manual]
+
+
+def test_buyer_status_and_date_filters(make_state, tmp_path):
+    state = make_state(buyers=("Alice", "Bob"))
+    rows = [engine.create_dossier(state, f"Papier lot {n}") for n in range(4)]
+    ids = [row["ID"] for row in rows]
+    engine.update_status(state, ids[0], "Closed")
+    store = open_store("csv", str(tmp_path))
+    store.init()
+    store.update_dossier(ids[1], {"Assigned_Date": "2024-03-15 10:00"})
+    state = make_state(buyers=("Alice", "Bob"))
+
+    alice = [row["ID"] for row in rows if row["Buyer"] == "Alice"]
+    assert sorted(_ids(state, "papier", buyer="Alice")) == sorted(alice)
+    assert _ids(state, "papier", buyer="Nobody") == []
+    assert _ids(state, "papier", statuses=["Closed"]) == [ids[0]]
+    assert sorted(_ids(state, "papier", statuses=["Open"])) == sorted(ids[1:])
+    assert _ids(state, "papier", start="2024-03-01", end="2024-03-15") == [ids[1]]
+    assert ids[1] not in _ids(state, "papier", start="2024-03-16")
+
+
+def test_new_dossiers_are_indexed_without_a_rebuild(state, monkeypatch):
+    engine.create_dossier(state, "Écran")
+    assert _ids(state, "imprimante") == []
+
+    def no_rebuild(self):
+        raise AssertionError("index rebuilt")
+
+    monkeypatch.setattr(search.SearchIndex, "_build", no_rebuild)
+    wanted = engine.create_dossier(state, "Imprimante laser")["ID"]
+    assert _ids(state, "imprimante") == [wanted]
+    engine.update_status(state, wanted, "Cancelled")
+    assert _ids(state, "imprimante", statuses=["Open"]) == []
+
+
+def test_archived_dossiers_remain_findable(make_state, tmp_path):
+    state = make_state()
+    wanted = engine.create_dossier(state, "Serveur de stockage")["ID"]
+    engine.create_dossier(state, "Serveur de messagerie")
+    store = open_store("csv", str(tmp_path))
+    store.init()
+    store.update_dossier(wanted, {"Status": "Closed", "Assigned_Date": "2024-01-02 09:00",
+                                  "Closed_Date": "2024-01-10 17:00"})
+    state = make_state()
+    assert engine.archive_dossiers(state, days=90) == 1
+
+    total, page = engine.search_dossiers(state, "stockage")
+    assert total == 1 and page["ID"].tolist() == [wanted] and page["Status"].tolist() == ["Closed"]
+    assert _ids(state, wanted) == [wanted]
+    assert len(_ids(make_state(), "serveur", statuses=["Closed", "Open"])) == 2
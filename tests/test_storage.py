@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+
+from storage import CsvStore, SqliteStore
+
+
+def new_store(path):
+    store = CsvStore(str(path))
+    store.init()
+    return store
+
+
+def row(dossier_id, buyer="Alice", status="Open"):
+    return {"ID": dossier_id, "Description": "Écran", "Category": "Informatique", "Urgency": "Moyenne",
+            "Buyer": buyer, "Status": status, "Assigned_Date": "2025-06-01 10:00", "Closed_Date": "",
+            "Type_AO": "", "Devise": "MAD", "Montant_Ajustement": 0.0, "Date_Ajustement": ""}
+
+
+def test_journal_replay_skips_a_torn_last_line(tmp_path):
+    store = new_store(tmp_path)
+    store.append_dossiers([row("PR-1"), row("PR-2")])
+    store.update_dossier("PR-1", {"Status": "Closed", "Closed_Date": "2025-06-02 09:00"})
+    # Crash in the middle of a write: the last record has no newline
+    with open(store.journal_path, "ab") as handle:
+        handle.write(b'{"ts": "2025-06-02", "op": "add_dossier", "row": {"ID": "PR-3"')
+
+    reloaded = new_store(tmp_path)
+    dossiers = reloaded.all_dossiers()
+    assert list(dossiers["ID"]) == ["PR-1", "PR-2"]
+    assert reloaded.get_dossier("PR-1")["Status"] == "Closed"
+
+    # The next write starts on a new line: both records are read back
+    reloaded.append_dossiers([row("PR-4")])
+    assert list(new_store(tmp_path).all_dossiers()["ID"]) == ["PR-1", "PR-2", "PR-4"]
+
+
+def test_compaction_folds_the_journal_into_the_snapshots(tmp_path):
+    store = new_store(tmp_path)
+    store.append_buyer({"Name": "Alice", "Email": "", "Capacity": 1.0, "Absences": ""})
+    store.append_dossiers([row("PR-1"), row("PR-2")])
+    store.update_dossier("PR-2", {"Status": "Cancelled"})
+    before = store.all_dossiers()
+
+    store.compact()
+    assert os.path.getsize(store.journal_path) == 0
+    snapshot = pd.read_csv(store.dossiers_path, dtype=str)
+    assert list(snapshot["ID"]) == ["PR-1", "PR-2"]
+
+    reloaded = new_store(tmp_path)
+    pd.testing.assert_frame_equal(reloaded.all_dossiers(), before)
+    assert list(reloaded.buyers()["Name"]) == ["Alice"]
+
+
+def test_other_process_writes_are_picked_up_by_refresh(tmp_path):
+    first, second = new_store(tmp_path), new_store(tmp_path)
+    first.all_dossiers()
+    second.append_dossiers([row("PR-1")])
+    changes = first.refresh()
+    assert [c["row"]["ID"] for c in changes] == ["PR-1"]
+    assert first.get_dossier("PR-1") is not None
+    # After a compaction elsewhere, the frames are reloaded (None)
+    second.compact()
+    assert first.refresh() is None
+    assert list(first.all_dossiers()["ID"]) == ["PR-1"]
+
+
+def test_updates_never_modify_a_frame_already_handed_out(tmp_path):
+    store = new_store(tmp_path)
+    store.append_dossiers([row("PR-1"), row("PR-2")])
+    before = store.all_dossiers()
+    store.update_dossier("PR-1", {"Status": "Closed", "Closed_Date": "2025-06-02 09:00"})
+    assert list(before["Status"]) == ["Open", "Open"] and before["Closed_Date"].isna().all()
+    after = store.all_dossiers()
+    assert after is not before and list(after["Status"]) == ["Closed", "Open"]
+    assert store.count_dossiers(status="Open") == 1
+
+
+def test_sqlite_first_start_imports_the_archived_dossiers(tmp_path):
+    store = new_store(tmp_path)
+    store.append_buyer({"Name": "Alice", "Email": "", "Capacity": 1.0, "Absences": ""})
+    old = {"Status": "Closed", "Assigned_Date": "2024-01-02 10:00", "Closed_Date": "2024-01-05 10:00"}
+    store.append_dossiers([{**row("PR-1"), **old}, row("PR-2")])
+    assert store.archive(pd.Timestamp("2025-01-01")) == 1
+    assert list(store.load()[0]["ID"]) == ["PR-2"]
+
+    sqlite = SqliteStore(str(tmp_path))
+    sqlite.init()
+    assert sorted(sqlite.dossier_ids()) == ["PR-1", "PR-2"]
+    assert sqlite.get_dossier("PR-1")["Status"] == "Closed"
+    assert list(sqlite.buyers()["Name"]) == ["Alice"]
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+import engine
+from workload import WorkloadIndex, check_consistency
+
+BUYERS = ("Alice", "Bob", "Chloé")
+
+
+def _assert_matches_a_full_recount(state):
+    store = state.store
+    open_files, buyers = store.find_dossiers(statuses=["Open"]), store.buyers()
+    assert check_consistency(state.workload, open_files, buyers) == []
+    rebuilt = WorkloadIndex.build(buyers, open_files, state.costs)
+    assert state.workload.keys() == rebuilt.keys()
+    assert state.workload.pick() == rebuilt.pick()
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_incremental_index_matches_a_full_recount(make_state, backend):
+    state, other = make_state(backend, BUYERS), make_state(backend, BUYERS)
+    rng = random.Random(3)
+    ids = []
+    for step in range(60):
+        # Half of the writes come from another process, picked up by sync()
+        writer = state if step % 2 else other
+        action = rng.choice(["create", "create", "status", "reassign", "buyer"] if ids else ["create"])
+        if action == "create":
+            ids.append(engine.create_dossier(
+                writer, f"Demande {step}", category=rng.choice(engine.CATEGORIES),
+                urgency=rng.choice(engine.URGENCIES), type_ao=rng.choice(["", "AO Ouvert", "AO fermé"])
+            )["ID"])
+        elif action == "status":
+            engine.update_status(writer, rng.choice(ids), rng.choice(engine.STATUSES))
+        elif action == "reassign":
+            engine.reassign_dossier(writer, rng.choice(ids), rng.choice(BUYERS))
+        else:
+            absences = rng.choice(["", "2020-01-01:2020-01-31", "2000-01-01:2100-12-31"])
+            engine.update_buyer(writer, rng.choice(BUYERS), rng.choice([0.5, 1.0, 2.0]), absences)
+        state.sync()
+        _assert_matches_a_full_recount(state)
+    other.sync()
+    _assert_matches_a_full_recount(other)
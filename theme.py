@@ -0,0 +1,61 @@
+"""Static assets of the app: theme stylesheet, header and logo.
+
+They are bundled in ``assets/`` (no CDN, so the app also works on offline
+servers) and assembled once per server process: this module stays imported
+between reruns, so the ``functools.cache`` results are reused by every rerun
+and session instead of being rebuilt and hashed each time.
+"""
+import base64
+import functools
+import os
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+THEME_VARIABLES = {
+    "dark": {
+        "primary-color": "#4ade80",
+        "secondary-color": "#34d399",
+        "background-color": "#111827",
+        "card-bg": "#1f2937",
+        "text-color": "#f3f4f6",
+        "text-secondary": "#9ca3af",
+        "border-color": "#374151",
+    },
+    "light": {
+        "primary-color": "#2c7873",
+        "secondary-color": "#60a5a0",
+        "background-color": "#f8fafc",
+        "card-bg": "#ffffff",
+        "text-color": "#1e293b",
+        "text-secondary": "#64748b",
+        "border-color": "#e2e8f0",
+    },
+}
+HEADER_HTML = """
+<div style="text-align: center; margin-bottom: 1.5rem;">
+  <h1 style="display: flex; align-items: center; justify-content: center; gap: 10px;">
+    <span>🛒</span> Achat Assistant
+  </h1>
+  <p style="color: var(--text-secondary); max-width: 600px; margin: 0 auto;">
+    Attribution intelligente des dossiers d'achat • Optimisation de la charge de travail
+  </p>
+</div>
+<hr style="margin: 1rem 0;">
+"""
+
+
+def _read(name):
+    with open(os.path.join(ASSETS_DIR, name), "rb") as handle:
+        return handle.read()
+
+
+@functools.cache
+def page_header(theme):
+    """HTML of the theme's stylesheet and of the page header, in one element."""
+    variables = "\n".join(f"    --{name}: {value};" for name, value in THEME_VARIABLES[theme].items())
+    return f"<style>\n:root {{\n{variables}\n}}\n\n{_read('theme.css').decode('utf-8')}</style>\n{HEADER_HTML}"
+
+
+@functools.cache
+def logo():
+    """Data URI of the bundled logo (passed through as is by ``st.image``)."""
+    return "data:image/svg+xml;base64," + base64.b64encode(_read("logo.svg")).decode("ascii")
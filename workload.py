@@ -0,0 +1,227 @@
+"""Incrementally maintained buyer workload for the least-busy assignment.
+
+``WorkloadIndex`` keeps, per buyer, the number of open dossiers, their
+weighted load (sum of the dossier costs of ``cost_model.CostModel``) and the
+latest ``Assigned_Date`` among them, and a heap ordered the same way as
+``assign_to_least_busy()`` (lowest load relative to capacity, then oldest
+last assignment, then buyer order). Creating, closing, cancelling,
+reopening or reassigning a dossier and adding a buyer update it in O(log B), so picking an
+assignee no longer depends on the number of dossiers. Buyers inside one of
+their absence windows are skipped by ``pick()``.
+"""
+import heapq
+import math
+
+import pandas as pd
+
+from cost_model import CostModel, parse_absences
+
+NEVER = math.inf  # Sort key of a buyer without open dossiers (NaT sorts last)
+
+
+def _ts(value):
+    if value is None or value == "":
+        return None
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(ts) else ts
+
+
+class WorkloadIndex:
+    def __init__(self, buyer_names=(), cost_model=None):
+        self.cost_model = cost_model or CostModel()
+        self._rank = {}         # registered buyer -> position in buyers list
+        self._open = {}         # buyer -> open dossier count
+        self._load = {}         # buyer -> sum of the costs of their open dossiers
+        self._capacity = {}     # registered buyer -> capacity
+        self._absences = {}     # registered buyer -> [(start ns, end ns)]
+        self._dates = {}        # buyer -> max-heap (negated ns) of open assigned dates
+        self._removed = {}      # buyer -> {ns: pending lazy deletions}
+        self._heap = []         # (relative load, last assignment ns, rank, buyer)
+        for name in buyer_names:
+            self.add_buyer(name)
+
+    @classmethod
+    def build(cls, buyers, open_dossiers, cost_model=None):
+        """Index from the buyers table and the currently open dossiers."""
+        index = cls(cost_model=cost_model)
+        for row in buyers.to_dict("records"):
+            index.add_buyer(row["Name"], row.get("Capacity", 1.0), row.get("Absences", ""))
+        costs = index.cost_model.costs(open_dossiers)
+        for buyer, assigned, cost in zip(open_dossiers["Buyer"], open_dossiers["Assigned_Date"], costs):
+            index._add_open(buyer, _ts(assigned), cost)
+        for buyer in index._rank:
+            index._push(buyer)
+        return index
+
+    # --- Internal bookkeeping ---
+    def _last_ns(self, buyer):
+        dates = self._dates.get(buyer)
+        removed = self._removed.get(buyer)
+        while dates:
+            ns = -dates[0]
+            if removed and removed.get(ns):
+                removed[ns] -= 1
+                heapq.heappop(dates)
+                continue
+            return ns
+        return None
+
+    def _relative_load(self, buyer):
+        # Rounded so that float noise never reorders equal loads
+        return round(self._load.get(buyer, 0.0) / self._capacity.get(buyer, 1.0), 9)
+
+    def _key(self, buyer):
+        last = self._last_ns(buyer)
+        return (self._relative_load(buyer), NEVER if last is None else last, self._rank[buyer], buyer)
+
+    def _push(self, buyer):
+        if buyer not in self._rank:
+            return
+        heapq.heappush(self._heap, self._key(buyer))
+        if len(self._heap) > 4 * len(self._rank) + 64:
+            # Drop the stale entries left behind by earlier updates
+            self._heap = [self._key(name) for name in self._rank]
+            heapq.heapify(self._heap)
+
+    def _add_open(self, buyer, assigned, cost=1.0):
+        self._open[buyer] = self._open.get(buyer, 0) + 1
+        self._load[buyer] = self._load.get(buyer, 0.0) + cost
+        if assigned is not None:
+            heapq.heappush(self._dates.setdefault(buyer, []), -assigned.value)
+
+    def _remove_open(self, buyer, assigned, cost=1.0):
+        self._open[buyer] = max(self._open.get(buyer, 0) - 1, 0)
+        # Reset exactly at zero so that rounding errors do not accumulate
+        self._load[buyer] = self._load.get(buyer, 0.0) - cost if self._open[buyer] else 0.0
+        if assigned is not None:
+            removed = self._removed.setdefault(buyer, {})
+            removed[assigned.value] = removed.get(assigned.value, 0) + 1
+
+    # --- Updates ---
+    def add_buyer(self, name, capacity=1.0, absences=""):
+        if name in self._rank:
+            return
+        self._rank[name] = len(self._rank)
+        self.set_profile(name, capacity, absences)
+
+    def set_profile(self, name, capacity=1.0, absences=""):
+        """Capacity and absence windows (``cost_model.parse_absences`` format)."""
+        self._capacity[name] = float(capacity) if pd.notna(capacity) and float(capacity) > 0 else 1.0
+        self._absences[name] = parse_absences(absences)
+        self._push(name)
+
+    def on_create(self, buyer, assigned_date, status="Open", cost=1.0):
+        if status == "Open":
+            self._add_open(buyer, _ts(assigned_date), cost)
+            self._push(buyer)
+
+    def on_create_many(self, buyers, assigned_date, costs=None):
+        """Several dossiers opened at the same time (batch import)."""
+        assigned = _ts(assigned_date)
+        costs = [1.0] * len(buyers) if costs is None else costs
+        for buyer, cost in zip(buyers, costs):
+            self._add_open(buyer, assigned, cost)
+        for buyer in set(buyers):
+            self._push(buyer)
+
+    def on_status_change(self, buyer, assigned_date, old_status, new_status, cost=1.0):
+        if old_status == new_status:
+            return
+        if old_status == "Open":
+            self._remove_open(buyer, _ts(assigned_date), cost)
+        elif new_status == "Open":
+            self._add_open(buyer, _ts(assigned_date), cost)
+        self._push(buyer)
+
+    def on_reassign(self, old_buyer, new_buyer, assigned_date, status="Open", cost=1.0):
+        if status != "Open" or old_buyer == new_buyer:
+            return
+        assigned = _ts(assigned_date)
+        self._remove_open(old_buyer, assigned, cost)
+        self._add_open(new_buyer, assigned, cost)
+        self._push(old_buyer)
+        self._push(new_buyer)
+
+    # --- Queries ---
+    def is_available(self, buyer, now_ns=None):
+        now_ns = pd.Timestamp.now().value if now_ns is None else now_ns
+        return not any(start <= now_ns < end for start, end in self._absences.get(buyer, ()))
+
+    def capacity(self, buyer):
+        return self._capacity.get(buyer, 1.0)
+
+    def keys(self):
+        """``(relative load, last assignment ns, rank, buyer)`` of every registered buyer."""
+        return [self._key(name) for name in self._rank]
+
+    def pick(self, now_ns=None):
+        """Least loaded available buyer, or None if there is none.
+
+        When every buyer is absent, the least loaded one is returned anyway.
+        """
+        now_ns = pd.Timestamp.now().value if now_ns is None else now_ns
+        absent = []
+        chosen = None
+        while self._heap:
+            entry = self._heap[0]
+            if entry != self._key(entry[3]):
+                heapq.heappop(self._heap)  # stale entry
+            elif self.is_available(entry[3], now_ns):
+                chosen = entry[3]
+                break
+            else:
+                absent.append(heapq.heappop(self._heap))
+        for entry in absent:
+            heapq.heappush(self._heap, entry)
+        if chosen is None and absent:
+            chosen = absent[0][3]
+        return chosen
+
+    def workload(self):
+        names = list(self._rank)
+        return pd.Series([self._open.get(name, 0) for name in names], index=names, dtype=int)
+
+    def weighted_workload(self):
+        """Load relative to capacity, per registered buyer."""
+        names = list(self._rank)
+        return pd.Series([self._relative_load(name) for name in names], index=names, dtype=float)
+
+    def last_assignment(self):
+        last = {}
+        for buyer in self._open:
+            ns = self._last_ns(buyer)
+            if ns is not None and self._open[buyer] > 0:
+                last[buyer] = pd.Timestamp(ns)
+        return pd.Series(last, dtype="datetime64[ns]")
+
+
+def check_consistency(index, dossiers, buyers):
+    """Compare ``index`` with the pandas computation over the full tables.
+
+    Returns a list of human-readable discrepancies (empty when consistent).
+    """
+    open_files = dossiers[dossiers["Status"] == "Open"]
+    expected_load = open_files["Buyer"].value_counts().reindex(buyers["Name"], fill_value=0)
+    expected_last = open_files.dropna(subset=["Assigned_Date"]).groupby("Buyer", observed=True)["Assigned_Date"].max()
+    costs = pd.Series(index.cost_model.costs(open_files), index=open_files.index)
+    expected_weighted = costs.groupby(open_files["Buyer"], observed=True).sum()
+
+    problems = []
+    actual_load = index.workload()
+    for name, count in expected_load.items():
+        if actual_load.get(name, 0) != count:
+            problems.append(f"{name}: {actual_load.get(name, 0)} dossiers ouverts indexés, {count} attendus")
+    actual_weighted = index.weighted_workload()
+    for name in buyers["Name"]:
+        expected = expected_weighted.get(name, 0.0) / index.capacity(name)
+        if abs(actual_weighted.get(name, 0.0) - expected) > 1e-6:
+            problems.append(f"{name}: charge pondérée {actual_weighted.get(name, 0.0):.3f} indexée, {expected:.3f} attendue")
+    actual_last = index.last_assignment()
+    for name in buyers["Name"]:
+        expected, actual = expected_last.get(name), actual_last.get(name)
+        if (expected is None) != (actual is None) or (expected is not None and expected != actual):
+            problems.append(f"{name}: dernière attribution {actual} indexée, {expected} attendue")
+    return problems